@@ -1,21 +1,136 @@
-from flask import Flask, session, request, render_template, redirect, url_for, jsonify
+import os
+import re
+import atexit
+import json
+import time
+import hashlib
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import Flask, Markup, Response, session, request, render_template, redirect, url_for, jsonify, \
+    stream_with_context, abort
+from werkzeug.routing import BaseConverter
 from flask_session import Session
-from book_database import BookDatabase
-from goodreads import GoodreadsAPI
+from book_database import BookDatabase, SEARCH_PAGE_SIZE, REVIEW_PAGE_SIZE, SAVED_BOOKS_PAGE_SIZE, parse_rating
+from sqlalchemy.exc import SQLAlchemyError, ArgumentError
+from goodreads import GoodreadsAPI, GoodreadsAPIError
+from book_cache import BookCache
+from fragment_cache import FragmentCache
+from search_cache import SearchCache
+from catalog import Catalog
+from review_queue import ReviewWriter, SQLiteReviewQueue
+from objects import ReviewObject
+from suggest import Suggestions, MAX_SUGGESTIONS
+from instrumentation import RequestInstrumentation
+from session_store import ServerSideSessionInterface, DatabaseSessionStore, MemorySessionStore
+from export import EXPORT_FORMATS, export_catalog, parse_since
+
+# An isbn is 10 characters (the last one may be an 'X' check digit) or 13 digits long, possibly with leading zeros
+ISBN_PATTERN = r"\d{9}[\dXx]|\d{13}"
+
+# Maximum number of isbns that can be looked up with a single request to /api/books
+API_BULK_LIMIT = int(os.getenv("API_BULK_LIMIT", 1000))
+
+
+class IsbnConverter(BaseConverter):
+    """URL converter for isbns, which keeps them as strings (unlike 'int', which drops leading zeros)."""
+
+    regex = ISBN_PATTERN
+
+    def to_python(self, value):
+        return value.upper()
+
 
 app = Flask(__name__)
+app.url_map.converters["isbn"] = IsbnConverter
 
-# Configure session to use filesystem
+# Create a Database; each request uses its own session, which is removed when the request ends. Nothing connects to
+# the database while the module is imported: the engine is created on first use in every process, and a process
+# forked by the server (e.g. gunicorn --preload) drops the engine it inherited, rather than sharing its connections
+db = BookDatabase()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=db.reset_after_fork)
+
+# Configure where user sessions are kept: "filesystem" (Flask-Session), "database" (the user_sessions table),
+# "memory" (the current process only) or "cookie" (signed cookies, which requires SECRET_KEY)
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "filesystem")
+if SESSION_BACKEND == "filesystem":
+    app.config["SESSION_TYPE"] = "filesystem"
+    Session(app)
+elif SESSION_BACKEND == "cookie":
+    if not os.getenv("SECRET_KEY"):
+        raise RuntimeError("SECRET_KEY is not set")
+    app.secret_key = os.getenv("SECRET_KEY")
+elif SESSION_BACKEND in ("database", "memory"):
+    session_store = DatabaseSessionStore(db) if SESSION_BACKEND == "database" else MemorySessionStore()
+    app.session_interface = ServerSideSessionInterface(
+        session_store,
+        lifetime=timedelta(seconds=int(os.getenv("SESSION_LIFETIME", 86400))),
+        cleanup_every=int(os.getenv("SESSION_CLEANUP_EVERY", 1000))
+    )
+else:
+    raise RuntimeError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+
+# Measure every request (latency, SQL statements, time waiting for Goodreads) for /metrics and the slow request log
+instrumentation = RequestInstrumentation(
+    app,
+    slow_request_threshold=float(os.getenv("SLOW_REQUEST_THRESHOLD", 1.0)),
+    timing_header=os.getenv("REQUEST_TIMING_HEADER", "false").lower() == "true"
+)
+db.add_engine_listener(instrumentation.instrument_engine)
+
+
+# Optionally, keep an in-process snapshot of the books catalog so book details are looked up without the database
+if os.getenv("CATALOG_SNAPSHOT", "false").lower() == "true":
+    db.catalog = Catalog(db, refresh_interval=int(os.getenv("CATALOG_REFRESH_INTERVAL", 60)))
 
-# Create a Database
-db = BookDatabase()
-db.initiate_session()
 
-# Goodreads API
-goodreads_api = GoodreadsAPI()
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """Returns the request's database connection to the pool once the request is finished."""
+    db.remove_session()
+
+
+# Cached books served by the JSON API, invalidated when a book gets a new review
+book_cache = BookCache(db, max_size=int(os.getenv("BOOK_CACHE_SIZE", 10000)),
+                       ttl=int(os.getenv("BOOK_CACHE_TTL", 300)))
+
+# Results of recent searches, as lists of isbns whose books are read from the book cache; the most popular searches
+# are run ahead of users by /ready
+search_cache = SearchCache(db, book_cache, max_size=int(os.getenv("SEARCH_CACHE_SIZE", 1000)),
+                           ttl=int(os.getenv("SEARCH_CACHE_TTL", 300)))
+SEARCH_PREWARM_COUNT = int(os.getenv("SEARCH_PREWARM_COUNT", 20))
+
+# Rendered fragments of book and search pages, keyed by the review count of the books they show (see fragment_cache.py)
+fragment_cache = FragmentCache(max_size=int(os.getenv("FRAGMENT_CACHE_SIZE", 10000)),
+                               max_bytes=int(os.getenv("FRAGMENT_CACHE_MAX_BYTES", 32 * 2 ** 20)),
+                               ttl=int(os.getenv("FRAGMENT_CACHE_TTL", 300)))
+
+# Optionally, submitted reviews are queued in a local file and written to the database in batches, in the background
+review_writer = None
+if os.getenv("REVIEW_WRITE_BEHIND", "false").lower() == "true":
+    review_writer = ReviewWriter(db, SQLiteReviewQueue(os.getenv("REVIEW_QUEUE_PATH", "review_queue.db")),
+                                 batch_size=int(os.getenv("REVIEW_BATCH_SIZE", 500)),
+                                 flush_interval=float(os.getenv("REVIEW_FLUSH_INTERVAL", 1.0)))
+    atexit.register(review_writer.stop)
+
+# Title and author completions for /api/suggest, ranked by review count and rebuilt when the catalog is re-imported
+suggestions = Suggestions(db, refresh_interval=int(os.getenv("CATALOG_REFRESH_INTERVAL", 60)),
+                          max_age=int(os.getenv("SUGGEST_MAX_AGE", 3600)))
+
+# Goodreads API, called from a thread pool so that book pages can query the database at the same time; stale cached
+# ratings are refreshed in the same pool
+goodreads_executor = ThreadPoolExecutor(max_workers=int(os.getenv("GOODREADS_WORKERS", 8)))
+goodreads_api = GoodreadsAPI(executor=goodreads_executor)
+
+# Seconds a book page waits for Goodreads (counted from the start of the request) before rendering without it
+GOODREADS_LATENCY_BUDGET = float(os.getenv("GOODREADS_LATENCY_BUDGET", 0.5))
+
+# Set once /ready has warmed up the current process; a forked process warms up its own connection pool again
+warmed_up = threading.Event()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=warmed_up.clear)
 
 
 @app.route("/")
@@ -43,9 +158,10 @@ def attempt_login():
     username = request.form.get("username")
     password = request.form.get("password")
 
-    if db.correct_credentials(username, password):
-        session["first_name"] = db.get_users_name_by_login(username, password)
-        session["user_id"] = db.get_user_id_by_login(username, password)
+    user = db.authenticate(username, password)
+    if user is not None:
+        session["first_name"] = user.first_name
+        session["user_id"] = user.db_id
         return redirect(url_for('search'))
     else:
         return render_template("login.html", login_message="Your username or password is incorrect. Try again.")
@@ -105,9 +221,42 @@ def search_db():
     """Searches database for users request field, returning any match on isbn, author or title."""
 
     user_search = request.form.get("user_search")
-    list_books = db.search_by_any(user_search)
+    page = max(request.form.get("page", 0, type=int), 0)
+
+    # fetch one extra book to find out whether there is another page of results
+    list_books = search_cache.search(user_search, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    has_more = len(list_books) > SEARCH_PAGE_SIZE
+    list_books = list_books[:SEARCH_PAGE_SIZE]
+
+    # Goodreads ratings of the whole page of results are fetched together; the search works without them
+    try:
+        with instrumentation.external_call("goodreads"):
+            goodreads_reviews = goodreads_api.get_reviews_for_isbns([book.isbn for book in list_books])
+    except GoodreadsAPIError as e:
+        print(f"Could not fetch Goodreads ratings for search results due to: {e}")
+        goodreads_reviews = dict()
+
+    # the results are rendered once for a given page of books, ratings and Goodreads ratings
+    results_key = ("search_results",) + tuple(
+        (found_book.isbn, found_book.review_count) + tuple((goodreads_reviews.get(found_book.isbn) or {}).values())
+        for found_book in list_books
+    )
+    search_results = fragment_cache.render(results_key, lambda: render_template(
+        "search_results.html",
+        book_result=list_books,
+        goodreads_reviews=goodreads_reviews
+    ))
 
-    return render_template("search.html", user=session["first_name"], book_result=list_books, searched=True)
+    return render_template(
+        "search.html",
+        user=session["first_name"],
+        book_result=list_books,
+        search_results=search_results,
+        searched=True,
+        user_search=user_search,
+        page=page,
+        has_more=has_more
+    )
 
 
 @app.route("/book-search/", methods=["POST"])
@@ -118,42 +267,252 @@ def find_book():
 
 @app.route("/book-review", methods=["POST"])
 def review_book():
+    """
+    Adds the user's review of a book, either directly or through the write-behind queue. The rating is validated
+    here, before either: a review without a valid rating re-renders the book page with a message (400), as does a
+    second review of the same book by the user (409).
+    """
+
+    if session.get("first_name") is None:
+        return redirect(url_for('login'))
 
     isbn = request.form.get("book_isbn")
-    rating = request.form.get("user_rating")
     review = request.form.get("user_review")
 
-    book_db_id = db.get_book_db_id_by_isbn(isbn)
-    db.add_user_review(user_db_id=session["user_id"], book_db_id=book_db_id, rating=rating, review=review)
+    book_db_id = db.get_book_db_id_by_isbn(isbn) if isbn else None
+    if book_db_id is None:
+        abort(400, description="The reviewed book is unknown.")
+    try:
+        rating = parse_rating(request.form.get("user_rating"))
+    except ValueError:
+        return render_book_page(isbn, review_message="Please choose a rating from 1 to 5 stars.",
+                                user_review=review), 400
+
+    # a user reviews a book once (see the unique index on book_reviews), queued reviews included
+    if review_writer is not None:
+        review_added = not db.user_already_submitted_review(book_db_id, session["user_id"]) \
+            and review_writer.pending_review(book_db_id, session["user_id"]) is None
+        if review_added:
+            review_writer.submit(user_db_id=session["user_id"], book_db_id=book_db_id, rating=rating, review=review)
+    else:
+        review_added = db.add_user_review(user_db_id=session["user_id"], book_db_id=book_db_id, rating=rating,
+                                          review=review)
+    if not review_added:
+        return render_book_page(isbn, review_message="You already reviewed this book."), 409
 
     return redirect(url_for('book', isbn=isbn))
 
 
+@app.route("/my-list", methods=["GET"])
+def my_list():
+    """The user's reading list: the books they saved, most recently saved first."""
+
+    if session.get("first_name") is None:
+        return redirect(url_for('login'))
+
+    page = max(request.args.get("page", 0, type=int), 0)
+
+    # fetch one extra book to find out whether there is another page of saved books
+    saved_books = db.get_saved_books(session["user_id"], limit=SAVED_BOOKS_PAGE_SIZE + 1,
+                                     offset=page * SAVED_BOOKS_PAGE_SIZE)
+    has_more = len(saved_books) > SAVED_BOOKS_PAGE_SIZE
+
+    return render_template(
+        "my_list.html",
+        user=session["first_name"],
+        saved_books=saved_books[:SAVED_BOOKS_PAGE_SIZE],
+        page=page,
+        has_more=has_more
+    )
+
+
+@app.route("/saved-books", methods=["POST"])
+def update_saved_books():
+    """
+    Saves books to the user's reading list (action=save) or removes them from it (action=remove), given as one or
+    more 'book_isbn' form fields, then returns to the book page (return_to=book) or the reading list.
+    """
+
+    if session.get("first_name") is None:
+        return redirect(url_for('login'))
+
+    isbns = request.form.getlist("book_isbn")
+    if request.form.get("action") == "remove":
+        db.remove_saved_books(session["user_id"], isbns)
+    else:
+        db.save_books(session["user_id"], isbns)
+
+    if request.form.get("return_to") == "book" and isbns:
+        return redirect(url_for('book', isbn=isbns[0]))
+    return redirect(url_for('my_list', page=request.form.get("page", 0, type=int)))
+
+
 @app.route("/book/<string:isbn>", methods=["GET"])
 def book(isbn):
 
     if session.get("first_name") is None:
         return redirect(url_for('login'))
 
+    return render_book_page(isbn)
+
+
+def render_book_page(isbn, review_message=None, user_review=None):
+    """
+    Renders the page of a book for the logged in user.
+    :param isbn: isbn of the book
+    :param review_message: message shown above the review form, e.g. why a submitted review was rejected
+    :param user_review: text the review form is filled in with
+    """
+
+    start = time.monotonic()
     book_object = db.search_by_isbn(isbn)
-    book_reviews = db.get_book_reviews(book_object.db_id)
+    if book_object is None:
+        abort(404, description="There is no book with this isbn.")
+
+    # one (cached) Goodreads lookup serves both the average rating and the number of ratings
+    goodreads_future = goodreads_executor.submit(goodreads_api.get_review, isbn)
+
+    # the book's details and its reviews are rendered once per review count (and page of reviews), which changes
+    # with every new review of the book
+    book_header = fragment_cache.render(("book_header", isbn, book_object.review_count), lambda: render_template(
+        "book_header.html",
+        book=book_object,
+        rating_histogram=db.get_rating_histogram(book_object.db_id) if book_object.review_count else None
+    ))
+
+    # reviews are paged newest first; 'before' is the id of the last review on the previous page
+    before_id = request.args.get("before", type=int)
+
+    def render_review_list(pending_review=None):
+        book_reviews = db.get_book_reviews(book_object.db_id, limit=REVIEW_PAGE_SIZE + 1, before_id=before_id)
+        older_reviews_id = book_reviews[REVIEW_PAGE_SIZE - 1].db_id if len(book_reviews) > REVIEW_PAGE_SIZE else None
+        book_reviews = book_reviews[:REVIEW_PAGE_SIZE]
+        if pending_review is not None:
+            book_reviews.insert(0, pending_review)
+        return render_template(
+            "book_reviews.html",
+            book=book_object,
+            book_reviews=book_reviews,
+            older_reviews_id=older_reviews_id,
+            newer_reviews=before_id is not None
+        )
+
     review_submitted = db.user_already_submitted_review(book_object.db_id, session['user_id'])
 
-    average_goodreads_rating = goodreads_api.get_average_rating(isbn)
-    number_goodreads_ratings = goodreads_api.get_number_ratings(isbn)
+    # a review still queued for writing is shown to the user who submitted it (in a list that isn't cached)
+    pending_review = None
+    if not review_submitted and review_writer is not None:
+        pending_review = review_writer.pending_review(book_object.db_id, session['user_id'])
+        review_submitted = pending_review is not None
+    if pending_review is not None and before_id is None:
+        review_list = Markup(render_review_list(ReviewObject(
+            db_id=None,
+            book_id=book_object.db_id,
+            username=db.get_username_by_id(session['user_id']),
+            date_created=pending_review["date_created"].date(),
+            rating=pending_review["rating"],
+            review=pending_review["review"]
+        )))
+    else:
+        review_list = fragment_cache.render(("book_reviews", isbn, book_object.review_count, before_id),
+                                            render_review_list)
+    recommendations = db.get_book_recommendations(book_object.db_id)
+    book_saved = db.book_is_saved(book_object.db_id, session['user_id'])
+
+    # the page is rendered without Goodreads data if it is slow or unavailable
+    try:
+        remaining_budget = max(GOODREADS_LATENCY_BUDGET - (time.monotonic() - start), 0)
+        with instrumentation.external_call("goodreads"):
+            goodreads_review = goodreads_future.result(timeout=remaining_budget) or {}
+    except (TimeoutError, GoodreadsAPIError) as e:
+        print(f"Rendering book page without Goodreads data due to: {e!r}")
+        goodreads_review = dict()
+    average_goodreads_rating = goodreads_review.get('average_rating')
+    number_goodreads_ratings = goodreads_review.get('ratings_count')
 
     return render_template(
         "book.html",
         user=session["first_name"],
         book=book_object,
-        book_reviews=book_reviews,
+        book_header=book_header,
+        review_list=review_list,
         goodreads_rating=average_goodreads_rating,
         number_goodreads_reviews=number_goodreads_ratings,
-        review_submitted=review_submitted
+        review_submitted=review_submitted,
+        recommendations=recommendations,
+        book_saved=book_saved,
+        review_message=review_message,
+        user_review=user_review
     )
 
 
-@app.route("/api/<int:isbn>", methods=["GET"])
+@app.route("/status", methods=["GET"])
+def status():
+    """Returns internal counters of the website (e.g. cache hit rates) as json, for monitoring."""
+
+    return jsonify(
+        {
+            "database_pool": db.pool_status(),
+            "book_cache": book_cache.cache_stats(),
+            "fragment_cache": fragment_cache.cache_stats(),
+            "search_cache": search_cache.cache_stats(),
+            "goodreads_cache": goodreads_api.cache_stats(),
+            "goodreads_circuit_breaker": goodreads_api.circuit_breaker.state
+        }
+    )
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness check for load balancers and deployments: on its first call in a process, opens the database
+    connections of the pool and builds the in-process indexes and snapshots, so that the first requests routed to
+    the process don't pay for them; afterwards, only checks that the database answers. Returns 503 if it doesn't.
+    """
+
+    start = time.perf_counter()
+    try:
+        if not warmed_up.is_set():
+            connections = db.warm_up_pool()
+            db.get_search_backend()
+            if db.catalog is not None:
+                db.catalog.get_snapshot()
+            suggestions.get_index()
+            search_cache.prewarm(SEARCH_PAGE_SIZE + 1, SEARCH_PREWARM_COUNT)
+            if review_writer is not None:
+                review_writer.start()
+            warmed_up.set()
+            print(f"Warmed up {connections} database connections and caches in {time.perf_counter() - start:.2f}s")
+        else:
+            db.session.execute("SELECT 1;")
+    except (SQLAlchemyError, ArgumentError, RuntimeError) as e:
+        # RuntimeError: DATABASE_URL is not set, or the engine could not be created from it
+        print(f"Not ready due to: {e!r}")
+        return jsonify({"ready": False, "error": str(e)}), 503
+
+    return jsonify({"ready": True, "seconds": round(time.perf_counter() - start, 3)})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Returns request latencies and SQL statement counts as Prometheus metrics."""
+
+    return Response(instrumentation.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def conditional_json(payload):
+    """
+    Returns payload as a json response with an ETag header (a hash of the json), or an empty 304 (Not Modified)
+    response if the request's If-None-Match header shows the client already has it. There is no Last-Modified
+    header: the cache doesn't know when a book's review count last changed, only when it was loaded.
+    """
+
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    return response.make_conditional(request)
+
+
+@app.route("/api/<isbn:isbn>", methods=["GET"])
 def book_by_isbn(isbn):
     """
     Available 'GET' endpoint for Reader's Forest API to return all information about a book.
@@ -162,14 +521,14 @@ def book_by_isbn(isbn):
     """
 
     # Get book object, information
-    found_book = db.search_by_isbn(str(isbn))
+    found_book = book_cache.get_book(isbn)
 
     # If book doesn't exist, then return 404 error
     if found_book is None:
         return jsonify({"Error": "ISBN number provided is unknown"}), 404
 
     # return book as formatted json
-    return jsonify(
+    return conditional_json(
         {
             "title": found_book.title,
             "author": found_book.author,
@@ -180,7 +539,7 @@ def book_by_isbn(isbn):
     )
 
 
-@app.route("/api/<int:isbn>/author", methods=["GET"])
+@app.route("/api/<isbn:isbn>/author", methods=["GET"])
 def author_by_isbn(isbn):
     """
     Available 'GET' endpoint for Reader's Forest API to get an author for a given book
@@ -188,22 +547,22 @@ def author_by_isbn(isbn):
     :return: json, representing book's author
     """
 
-    # Get book object, information
-    found_book = db.search_by_isbn(str(isbn))
+    # Get book information, without rating aggregates
+    found_book = book_cache.get_details(isbn)
 
     # If book doesn't exist, then return 404 error
     if found_book is None:
         return jsonify({"Error": "ISBN number provided is unknown"}), 404
 
     # return book as formatted json
-    return jsonify(
+    return conditional_json(
         {
-            "author": found_book.author
+            "author": found_book["author"]
         }
     )
 
 
-@app.route("/api/<int:isbn>/year", methods=["GET"])
+@app.route("/api/<isbn:isbn>/year", methods=["GET"])
 def year_by_isbn(isbn):
     """
     Available 'GET' endpoint for Reader's Forest API to get the year published for a given book
@@ -211,16 +570,160 @@ def year_by_isbn(isbn):
     :return: json, representing book's year of publication
     """
 
-    # Get book object, information
-    found_book = db.search_by_isbn(str(isbn))
+    # Get book information, without rating aggregates
+    found_book = book_cache.get_details(isbn)
 
     # If book doesn't exist, then return 404 error
     if found_book is None:
         return jsonify({"Error": "ISBN number provided is unknown"}), 404
 
     # return book as formatted json
-    return jsonify(
+    return conditional_json(
         {
-            "year": found_book.year
+            "year": found_book["year"]
         }
     )
+
+
+def json_isbns():
+    """
+    Returns the 'isbns' list of a request's json body, such as {"isbns": [...]}; an empty list if the body isn't
+    a json object with such a list (e.g. a list of isbns on its own), which the API answers with 400.
+    """
+
+    body = request.get_json(silent=True)
+    isbns = body.get("isbns") if isinstance(body, dict) else None
+    return isbns if isinstance(isbns, list) else []
+
+
+@app.route("/api/books", methods=["GET", "POST"])
+def books_by_isbns():
+    """
+    Available endpoint for Reader's Forest API to return information about many books at once, given as a
+    comma-separated 'isbns' query parameter (GET) or a json body such as {"isbns": [...]} (POST). Books are
+    returned in the order requested, as a json list, or as newline-delimited json with format=ndjson. Unknown or
+    invalid isbns are reported in place of their book.
+    :return: json, representing the information of every book
+    """
+
+    if request.method == "POST":
+        isbns = json_isbns()
+    else:
+        isbns = request.args.get("isbns", "").split(",")
+    isbns = [str(isbn).strip().upper() for isbn in isbns if str(isbn).strip()]
+
+    if not isbns:
+        return jsonify({"Error": "Please provide a list of ISBN numbers"}), 400
+    if len(isbns) > API_BULK_LIMIT:
+        return jsonify({"Error": f"At most {API_BULK_LIMIT} ISBN numbers can be requested at once"}), 400
+
+    valid_isbns = [isbn for isbn in isbns if re.fullmatch(ISBN_PATTERN, isbn)]
+    found_books = {book.isbn: book for book in db.get_books_by_isbns(valid_isbns)}
+
+    def book_results():
+        for isbn in isbns:
+            found_book = found_books.get(isbn)
+            if found_book is not None:
+                yield {
+                    "title": found_book.title,
+                    "author": found_book.author,
+                    "year": found_book.year,
+                    "isbn": found_book.isbn,
+                    "average_rating": found_book.star_rating,
+                    "review_count": found_book.review_count
+                }
+            elif re.fullmatch(ISBN_PATTERN, isbn):
+                yield {"isbn": isbn, "Error": "ISBN number provided is unknown"}
+            else:
+                yield {"isbn": isbn, "Error": "ISBN number provided is invalid"}
+
+    if request.args.get("format") == "ndjson":
+        return Response((json.dumps(result) + "\n" for result in book_results()), mimetype="application/x-ndjson")
+
+    def json_list():
+        for position, result in enumerate(book_results()):
+            yield ("[" if position == 0 else ",") + json.dumps(result)
+        yield "]"
+
+    return Response(json_list(), mimetype="application/json")
+
+
+@app.route("/api/saved-books", methods=["GET", "POST", "DELETE"])
+def saved_books_api():
+    """
+    Endpoint for the logged in user's reading list. 'GET' returns a page of it (page query parameter), most
+    recently saved first; 'POST' adds and 'DELETE' removes the books of a json body such as {"isbns": [...]}, in a
+    single statement.
+    :return: json, representing the saved books, or the number of books added or removed
+    """
+
+    if session.get("user_id") is None:
+        return jsonify({"Error": "Please log in to use your reading list"}), 401
+
+    if request.method == "GET":
+        page = max(request.args.get("page", 0, type=int), 0)
+        saved_books = db.get_saved_books(session["user_id"], limit=SAVED_BOOKS_PAGE_SIZE + 1,
+                                         offset=page * SAVED_BOOKS_PAGE_SIZE)
+        return jsonify(
+            {
+                "books": [
+                    {
+                        "title": saved_book.title,
+                        "author": saved_book.author,
+                        "year": saved_book.year,
+                        "isbn": saved_book.isbn,
+                        "average_rating": saved_book.star_rating,
+                        "review_count": saved_book.review_count
+                    }
+                    for saved_book in saved_books[:SAVED_BOOKS_PAGE_SIZE]
+                ],
+                "page": page,
+                "has_more": len(saved_books) > SAVED_BOOKS_PAGE_SIZE
+            }
+        )
+
+    isbns = [str(isbn).strip().upper() for isbn in json_isbns() if str(isbn).strip()]
+    if not isbns:
+        return jsonify({"Error": "Please provide a list of ISBN numbers"}), 400
+    if len(isbns) > API_BULK_LIMIT:
+        return jsonify({"Error": f"At most {API_BULK_LIMIT} ISBN numbers can be changed at once"}), 400
+
+    if request.method == "POST":
+        return jsonify({"saved": db.save_books(session["user_id"], isbns)})
+    return jsonify({"removed": db.remove_saved_books(session["user_id"], isbns)})
+
+
+@app.route("/api/export", methods=["GET"])
+def export_books():
+    """
+    Available 'GET' endpoint for Reader's Forest API to download the whole catalog, with ratings and review
+    counts, as newline-delimited json (format=ndjson, the default) or csv (format=csv). With since=<date>, only
+    books reviewed on or after that date are included.
+    :return: streamed ndjson or csv export
+    """
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"Error": f"Export format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError:
+        return jsonify({"Error": "'since' must be a date such as 2019-06-01"}), 400
+
+    mimetype = "application/x-ndjson" if export_format == "ndjson" else "text/csv"
+    return Response(stream_with_context(export_catalog(db, export_format, since)), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=books.{export_format}"})
+
+
+@app.route("/api/suggest", methods=["GET"])
+def suggest():
+    """
+    Available 'GET' endpoint for Reader's Forest API to complete what a user is typing (q=<prefix>) into book
+    titles and authors, most reviewed first. At most 'limit' completions are returned (default 10).
+    :return: json, representing the completions
+    """
+
+    prefix = request.args.get("q", "")
+    limit = min(max(request.args.get("limit", 10, type=int), 1), MAX_SUGGESTIONS)
+    return jsonify({"query": prefix, "suggestions": suggestions.get_index().suggest(prefix, limit)})
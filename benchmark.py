@@ -0,0 +1,973 @@
+"""
+Benchmarks for Reader's Forest, run against the database configured by the DATABASE_URL environment variable
+(the tables should already exist and hold the books.csv catalog, see import.py). Each benchmark is a
+subcommand, e.g.
+
+    $ python benchmark.py search
+
+A synthetic dataset (books.csv scaled up, with users and reviews) can be created in an empty database with the
+'setup' subcommand, and the results of any benchmark saved as json (--output) and compared with the results of
+an earlier run (--compare):
+
+    $ DATABASE_URL=sqlite:///benchmark.db python benchmark.py setup --scale 10 --users 1000 --reviews 100000
+    $ DATABASE_URL=sqlite:///benchmark.db python benchmark.py load --output after.json --compare before.json
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from flask.sessions import SecureCookieSessionInterface
+from flask_session import FileSystemSessionInterface
+from sqlalchemy import event
+from book_database import BookDatabase, BOOK_IMPORT_BATCH_SIZE, PASSWORD_HASH_METHOD, SAVED_BOOKS_PAGE_SIZE, \
+    SEARCH_PAGE_SIZE, hash_password
+from search_backends import LikeSearch, PostgresTextSearch, InvertedIndexSearch
+from book_cache import BookCache
+from catalog import CatalogSnapshot
+from search_cache import SearchCache
+from suggest import SuggestionIndex
+from review_queue import ReviewWriter, SQLiteReviewQueue
+from objects import BookObject
+from session_store import ServerSideSessionInterface, DatabaseSessionStore, MemorySessionStore
+
+# Searches used to compare the search backends: common words, authors, partial words and isbns
+SEARCH_QUERIES = ["the", "harry potter", "king", "Stephen King", "dark", "love", "asimov", "war and peace",
+                  "0380795272", "0553", "myst", "tolkien", "a", "zzzz"]
+
+# Results reported by the benchmark being run, saved as json with --output
+RESULTS = []
+
+
+def time_calls(func, arguments, repeat=1):
+    """
+    Calls func once per argument (repeat times over) and returns the duration of every call in milliseconds.
+    """
+
+    timings = []
+    for _ in range(repeat):
+        for argument in arguments:
+            start = time.perf_counter()
+            func(argument)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, percent):
+    """Returns the given percentile (0-100) of a list of timings."""
+
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(name, timings, **extra):
+    """
+    Prints a one line summary of a list of timings in milliseconds, and adds it to the RESULTS.
+    :param extra: other measurements to report along with the timings (e.g. queries per request)
+    """
+
+    result = {
+        "name": name,
+        "n": len(timings),
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        **extra
+    }
+    RESULTS.append(result)
+    print(f"{name:<30} n={len(timings):<6} mean={result['mean_ms']:8.3f}ms p50={result['p50_ms']:8.3f}ms "
+          f"p95={result['p95_ms']:8.3f}ms p99={result['p99_ms']:8.3f}ms"
+          + "".join(f" {key}={value:.1f}" for key, value in extra.items()))
+
+
+def count_queries(engine):
+    """Returns a dictionary whose 'count' is incremented by every SQL statement subsequently run on engine."""
+
+    counter = {"count": 0}
+
+    def count(*args):
+        counter["count"] += 1
+
+    event.listen(engine, "after_cursor_execute", count)
+    return counter
+
+
+class StubGoodreadsServer:
+    """
+    Local stand-in for the Goodreads review_counts endpoint, which answers every known isbn with a fixed rating
+    after an optional delay, or fails every request when "failing" is set.
+    """
+
+    def __init__(self, delay=0.0, failing=False):
+        self.delay = delay
+        self.failing = failing
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.failing:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                isbns = parse_qs(urlparse(self.path).query)["isbns"][0].split(",")
+                body = json.dumps(
+                    {"books": [{"isbn": isbn, "average_rating": "4.00", "ratings_count": 100} for isbn in isbns]}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def load_application(stub):
+    """Imports the Flask application with Goodreads pointed at a stub server, and returns a logged in test client."""
+
+    os.environ.setdefault("GOODREADS_API_KEY", "benchmark")
+    import application
+
+    application.goodreads_api.base_url = stub.url
+    client = application.app.test_client()
+    with client.session_transaction() as user_session:
+        user_session["first_name"] = "Benchmark"
+        user_session["user_id"] = 0
+    return application, client
+
+
+def benchmark_search(db, args):
+    """Compares the search backends on the catalog currently in the books table."""
+
+    start = time.perf_counter()
+    memory_backend = InvertedIndexSearch.from_database(db)
+    print(f"Built in-memory index of {memory_backend.book_count} books "
+          f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    backends = [LikeSearch(), memory_backend]
+    if db.engine.dialect.name == "postgresql":
+        db.create_books_search_indexes()
+        backends.append(PostgresTextSearch())
+
+    for backend in backends:
+        db.search_backend = backend
+        db.search_by_any(SEARCH_QUERIES[0])  # warm up
+        timings = time_calls(db.search_by_any, SEARCH_QUERIES, repeat=args.repeat)
+        report(f"search ({backend.name})", timings)
+
+
+def benchmark_search_cache(db, args):
+    """
+    Compares the latency of args.requests searches, drawn from a skewed distribution of popular queries typed with
+    varying case, spacing and isbn hyphens, run directly on the search backend, through a cold search cache and
+    through a search cache prewarmed with the most popular queries. The 'search_query_stats' table is restored
+    afterwards.
+    """
+
+    authors = [row.author for row in db.session.execute(
+        "SELECT b.author FROM books b JOIN book_stats s ON s.book_id = b.id GROUP BY b.author "
+        "ORDER BY SUM(s.rating_count) DESC LIMIT 30;"
+    ).fetchall()]
+    isbn = db.session.execute("SELECT isbn FROM books ORDER BY id LIMIT 1;").fetchone()['isbn']
+    queries = SEARCH_QUERIES + authors + [f"{isbn[0]}-{isbn[1:4]}-{isbn[4:9]}-{isbn[9:]}"]
+    variants = [str.lower, str.upper, str.title, lambda query: "  " + query.replace(" ", "   ") + " "]
+    rng = random.Random(args.seed)
+    # the n-th most popular query is searched about 1/n as often as the most popular one
+    searches = [rng.choice(variants)(query) for query in
+                rng.choices(queries, weights=[1 / rank for rank in range(1, len(queries) + 1)], k=args.requests)]
+    print(f"{len(searches)} searches of {len(queries)} queries with the '{db.get_search_backend().name}' backend")
+
+    previous_rows = db.session.execute(
+        "SELECT query, search_count, last_searched_at FROM search_query_stats;"
+    ).fetchall()
+    limit = SEARCH_PAGE_SIZE + 1
+    try:
+        db.session.execute("DELETE FROM search_query_stats;")
+        db.session.commit()
+        report("search (no cache)", time_calls(lambda search: db.search_by_any(search, limit=limit), searches))
+
+        search_cache = SearchCache(db, BookCache(db), flush_every=len(searches))
+        report("search (cold cache)", time_calls(lambda search: search_cache.search(search, limit), searches),
+               **{"hit_rate_%": search_cache.cache_stats()["hit_rate"] * 100})
+
+        search_cache = SearchCache(db, BookCache(db), flush_every=len(searches))
+        start = time.perf_counter()
+        prewarmed = search_cache.prewarm(limit)
+        print(f"Prewarmed the {prewarmed} most popular searches in {(time.perf_counter() - start) * 1000:.0f}ms")
+        report("search (prewarmed cache)", time_calls(lambda search: search_cache.search(search, limit), searches),
+               **{"hit_rate_%": search_cache.cache_stats()["hit_rate"] * 100})
+    finally:
+        db.session.rollback()
+        db.session.execute("DELETE FROM search_query_stats;")
+        if previous_rows:
+            db.session.execute("INSERT INTO search_query_stats (query, search_count, last_searched_at) "
+                               "VALUES (:query, :search_count, :last_searched_at);",
+                               [dict(row) for row in previous_rows])
+        db.session.commit()
+
+
+def benchmark_book_page(db, args):
+    """
+    Times /book/<isbn> while Goodreads is fast, slower than the latency budget, and failing. Every request uses
+    a different isbn, so Goodreads responses are never served from the cache.
+    """
+
+    isbns = [row.isbn for row in db.session.execute("SELECT isbn FROM books ORDER BY id LIMIT :n;",
+                                                    {"n": args.requests * 3}).fetchall()]
+    stub = StubGoodreadsServer()
+    application, client = load_application(stub)
+    print(f"Goodreads latency budget: {application.GOODREADS_LATENCY_BUDGET * 1000:.0f}ms")
+
+    scenarios = [("fast", 0.0, False), ("slow", application.GOODREADS_LATENCY_BUDGET * 2, False),
+                 ("failing", 0.0, True)]
+    for position, (name, delay, failing) in enumerate(scenarios):
+        stub.delay = delay
+        stub.failing = failing
+        scenario_isbns = isbns[position * args.requests:(position + 1) * args.requests]
+        timings = time_calls(lambda isbn: client.get(f"/book/{isbn}"), scenario_isbns)
+        report(f"book page (goodreads {name})", timings)
+        print(f"{'':<30} circuit breaker {application.goodreads_api.circuit_breaker.state}, "
+              f"{stub.requests} Goodreads requests so far")
+
+    stub.stop()
+
+
+def benchmark_fragments(db, args):
+    """
+    Compares book pages and search pages rendered from scratch (the fragment cache is cleared before every request)
+    with pages whose fragments are cached, for the args.requests most reviewed books and a few searches, reporting
+    the SQL statements per request and the fragment cache's hit rate and size.
+    """
+
+    isbns = [row.isbn for row in db.session.execute(
+        "SELECT b.isbn FROM books b JOIN book_stats s ON s.book_id = b.id ORDER BY s.rating_count DESC LIMIT :n;",
+        {"n": args.requests}
+    ).fetchall()]
+    stub = StubGoodreadsServer()
+    application, client = load_application(stub)
+    queries = count_queries(application.db.engine)
+    cache = application.fragment_cache.fragments
+
+    pages = [("book page", lambda isbn: client.get(f"/book/{isbn}"), isbns),
+             ("search page", lambda search: client.post("/search", data={"user_search": search}), SEARCH_QUERIES)]
+    for name, get_page, arguments in pages:
+        # warm up the Goodreads cache, so that both stages only differ by the fragments
+        for argument in arguments:
+            get_page(argument)
+
+        for stage in ("rendered", "cached"):
+            queries["count"] = 0
+
+            def request_page(argument):
+                if stage == "rendered":
+                    cache.clear()
+                get_page(argument)
+
+            timings = time_calls(request_page, arguments, repeat=args.repeat)
+            report(f"{name} ({stage})", timings, queries_per_request=queries["count"] / len(timings))
+
+    print(f"Fragment cache: {application.fragment_cache.cache_stats()}")
+    stub.stop()
+
+
+def benchmark_indexes(db, args):
+    """
+    Shows the query plans and timings of the review queries on a synthetic table of args.reviews reviews, before
+    and after adding the indexes of schema migration 1. The table is dropped afterwards.
+    """
+
+    postgres = db.engine.dialect.name == "postgresql"
+    book_count = db.session.execute("SELECT COUNT(*) AS n FROM books;").fetchone()['n']
+    user_count = max(args.reviews // 50, 1)
+
+    print(f"Creating 'benchmark_reviews' with {args.reviews} reviews of {book_count} books by {user_count} users")
+    db.session.execute("DROP TABLE IF EXISTS benchmark_reviews;")
+    db.session.execute(
+        "CREATE TABLE benchmark_reviews (id INT PRIMARY KEY, book_id INT, user_id INT, date_created DATE, "
+        "rating FLOAT, review VARCHAR);"
+    )
+    if postgres:
+        rows = "SELECT n FROM generate_series(1, :reviews) AS n"
+    else:
+        rows = "WITH RECURSIVE series(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM series WHERE n < :reviews) " \
+               "SELECT n FROM series"
+    db.session.execute(
+        f"INSERT INTO benchmark_reviews (id, book_id, user_id, date_created, rating, review) "
+        f"SELECT n, n % :books + 1, (n / :books) % :users + 1, CURRENT_DATE, n % 5 + 1, 'Benchmark review' "
+        f"FROM ({rows}) AS series_rows;",
+        {"reviews": args.reviews, "books": book_count, "users": user_count}
+    )
+    db.session.commit()
+
+    queries = [
+        ("reviews of a book", "SELECT id, rating FROM benchmark_reviews WHERE book_id = :book_id "
+                              "ORDER BY id DESC LIMIT 20"),
+        ("user reviewed book", "SELECT 1 FROM benchmark_reviews WHERE book_id = :book_id AND user_id = :user_id "
+                               "LIMIT 1"),
+        ("rating aggregates", "SELECT AVG(rating), COUNT(*) FROM benchmark_reviews WHERE book_id = :book_id"),
+        ("reviews by user", "SELECT COUNT(*) FROM benchmark_reviews WHERE user_id = :user_id"),
+    ]
+    indexes = [
+        "CREATE UNIQUE INDEX benchmark_reviews_book_id_user_id_key ON benchmark_reviews (book_id, user_id);",
+        "CREATE INDEX benchmark_reviews_book_id_id_idx ON benchmark_reviews (book_id, id);",
+        "CREATE INDEX benchmark_reviews_user_id_idx ON benchmark_reviews (user_id);",
+    ]
+    explain = "EXPLAIN ANALYZE " if postgres else "EXPLAIN QUERY PLAN "
+    parameters = [{"book_id": book_id, "user_id": book_id % user_count + 1} for book_id in range(1, book_count, 97)]
+
+    try:
+        for stage in ("without indexes", "with indexes"):
+            if stage == "with indexes":
+                start = time.perf_counter()
+                for statement in indexes:
+                    db.session.execute(statement)
+                db.session.execute("ANALYZE benchmark_reviews;")
+                db.session.commit()
+                print(f"Created indexes in {time.perf_counter() - start:.1f}s")
+
+            print(f"--- {stage}")
+            for name, query in queries:
+                plan = db.session.execute(explain + query, parameters[0]).fetchall()
+                print(f"{name}: " + " | ".join(str(row[-1]) for row in plan))
+                report(name, time_calls(lambda p: db.session.execute(query, p).fetchall(), parameters))
+    finally:
+        db.session.rollback()
+        db.session.execute("DROP TABLE benchmark_reviews;")
+        db.session.commit()
+
+
+def benchmark_saved_books(db, args):
+    """
+    Times the reading list of a user with args.books saved books (at most the whole catalog): saving books one at a
+    time and 1,000 at once, listing its first and last pages, checking whether books are saved and removing them
+    1,000 at once, and shows the query plans of the lookups. The user's reading list is restored afterwards.
+    """
+
+    user_id = db.session.execute("SELECT MIN(id) AS id FROM users;").fetchone()['id']
+    if user_id is None:
+        print("The database has no users; create a dataset with the 'setup' subcommand")
+        return
+
+    previous_rows = db.session.execute("SELECT book_id, saved_at FROM saved_books WHERE user_id = :user_id;",
+                                       {"user_id": user_id}).fetchall()
+    books = db.session.execute("SELECT id, isbn FROM books ORDER BY id LIMIT :n;",
+                               {"n": args.books}).fetchall()
+    random.Random(args.seed).shuffle(books)
+    isbns = [book.isbn for book in books]
+    batches = [isbns[start:start + 1000] for start in range(0, len(isbns), 1000)]
+    print(f"Reading list of user {user_id} with {len(isbns)} books")
+
+    try:
+        db.remove_saved_books(user_id, isbns)
+        report("save one book at a time", time_calls(lambda isbn: db.save_books(user_id, [isbn]), isbns[:500]))
+        db.remove_saved_books(user_id, isbns[:500])
+        report("save 1000 books at once", time_calls(lambda batch: db.save_books(user_id, batch), batches))
+
+        pages = (len(isbns) - 1) // SAVED_BOOKS_PAGE_SIZE
+        for name, page in (("first", 0), ("last", pages)):
+            report(f"reading list page ({name})",
+                   time_calls(lambda offset: db.get_saved_books(user_id, offset=offset),
+                              [page * SAVED_BOOKS_PAGE_SIZE], repeat=args.repeat * 10))
+        report("book is saved", time_calls(lambda book: db.book_is_saved(book.id, user_id), books[:1000]))
+
+        explain = "EXPLAIN " if db.engine.dialect.name == "postgresql" else "EXPLAIN QUERY PLAN "
+        for name, query in (("reading list page", "SELECT sb.book_id FROM saved_books sb JOIN books b ON "
+                                                  "b.id = sb.book_id WHERE sb.user_id = :user_id ORDER BY "
+                                                  "sb.saved_at DESC, sb.book_id DESC LIMIT 50"),
+                            ("book is saved", "SELECT 1 FROM saved_books WHERE user_id = :user_id AND "
+                                              "book_id = :book_id")):
+            plan = db.session.execute(explain + query, {"user_id": user_id, "book_id": books[0].id}).fetchall()
+            print(f"{name}: " + " | ".join(str(row[-1]) for row in plan))
+
+        report("remove 1000 books at once", time_calls(lambda batch: db.remove_saved_books(user_id, batch),
+                                                       batches))
+    finally:
+        db.session.rollback()
+        db.session.execute("DELETE FROM saved_books WHERE user_id = :user_id;", {"user_id": user_id})
+        if previous_rows:
+            db.session.execute("INSERT INTO saved_books (user_id, book_id, saved_at) "
+                               "VALUES (:user_id, :book_id, :saved_at);",
+                               [{"user_id": user_id, "book_id": row.book_id, "saved_at": row.saved_at}
+                                for row in previous_rows])
+        db.session.commit()
+
+
+def benchmark_pool(db, args):
+    """
+    Sends requests to the JSON API and book pages from args.concurrency threads at once, while sampling the
+    database connection pool, to check that connections are returned to the pool after every request.
+    """
+
+    isbns = [row.isbn for row in db.session.execute("SELECT isbn FROM books ORDER BY id LIMIT 200;").fetchall()]
+    stub = StubGoodreadsServer()
+    application, client = load_application(stub)
+    print(f"Pool before: {application.db.pool_status()}")
+
+    samples = []
+    timings = []
+    finished = threading.Event()
+
+    def sample_pool():
+        while not finished.is_set():
+            samples.append(application.db.pool_status())
+            time.sleep(0.05)
+
+    def send_requests(worker):
+        worker_client = application.app.test_client()
+        with worker_client.session_transaction() as user_session:
+            user_session["first_name"] = "Benchmark"
+            user_session["user_id"] = 0
+        paths = [f"/api/{isbn}" if position % 2 else f"/book/{isbn}" for position, isbn in enumerate(isbns)]
+        timings.extend(time_calls(worker_client.get, paths[worker::args.concurrency] * args.repeat))
+
+    sampler = threading.Thread(target=sample_pool)
+    sampler.start()
+    workers = [threading.Thread(target=send_requests, args=(worker,)) for worker in range(args.concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    finished.set()
+    sampler.join()
+
+    report(f"requests ({args.concurrency} threads)", timings)
+    print(f"Throughput: {len(timings) / elapsed:.0f} requests/sec")
+    if "checked_out" in samples[0]:
+        print(f"Connections checked out: max {max(sample['checked_out'] for sample in samples)}, "
+              f"max overflow {max(sample['overflow'] for sample in samples)}")
+    print(f"Pool after: {application.db.pool_status()}")
+    stub.stop()
+
+
+def benchmark_login(db, args):
+    """
+    Measures login throughput (BookDatabase.authenticate) at the work factor set by PASSWORD_HASH_ITERATIONS,
+    using temporary benchmark users.
+    """
+
+    usernames = [f"benchmark_user_{number}" for number in range(args.requests)]
+    print(f"Password hash method: {PASSWORD_HASH_METHOD}")
+    for username in usernames:
+        db.add_new_user("Benchmark", "User", username, "benchmark password")
+
+    try:
+        start = time.perf_counter()
+        timings = time_calls(lambda username: db.authenticate(username, "benchmark password"), usernames,
+                             repeat=args.repeat)
+        elapsed = time.perf_counter() - start
+        report("login", timings)
+        print(f"Throughput: {len(timings) / elapsed:.1f} logins/sec (single thread)")
+    finally:
+        db.session.execute("DELETE FROM users WHERE username LIKE 'benchmark_user_%';")
+        db.session.commit()
+
+
+def synthetic_books(count):
+    """Generates (id, isbn, title, author, year) tuples for a synthetic catalog of count books."""
+
+    author_count = max(count // 10, 1)
+    for book_id in range(1, count + 1):
+        yield book_id, f"{book_id:010d}", f"Synthetic Title Number {book_id}", \
+            f"Author {book_id % author_count}", 1900 + book_id % 120
+
+
+def traced_memory(build):
+    """Calls build() and returns its result along with the memory (in bytes) allocated while building it."""
+
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def benchmark_catalog(db, args):
+    """
+    Compares the memory footprint and lookup latency of a CatalogSnapshot with a dictionary of BookObjects, for
+    synthetic catalogs of 5,000 and args.books books, and with database lookups on the books table.
+    """
+
+    for count in (5000, args.books):
+        books, objects_size = traced_memory(lambda: {
+            isbn: BookObject(book_id, isbn, title, author, year, 0, 0)
+            for book_id, isbn, title, author, year in synthetic_books(count)
+        })
+        snapshot, snapshot_size = traced_memory(lambda: CatalogSnapshot(synthetic_books(count)))
+        print(f"--- {count} books: BookObjects {objects_size / 2 ** 20:.1f}MiB, "
+              f"snapshot {snapshot_size / 2 ** 20:.1f}MiB")
+
+        isbns = random.sample(list(books), min(count, 10000))
+        del books
+        report(f"snapshot lookup ({count})", time_calls(snapshot.get, isbns, repeat=args.repeat))
+
+    isbns = [row.isbn for row in db.session.execute("SELECT isbn FROM books ORDER BY id LIMIT 1000;").fetchall()]
+    report("database lookup", time_calls(db.get_book_details, isbns))
+    report("database lookup + ratings", time_calls(db.search_by_isbn, isbns))
+
+
+def benchmark_sessions(db, args):
+    """
+    Compares the per-request overhead of the session backends (see SESSION_BACKEND), on requests to / which only
+    read the logged in user's session.
+    """
+
+    stub = StubGoodreadsServer()
+    application, _ = load_application(stub)
+    app = application.app
+    app.secret_key = app.secret_key or "benchmark"
+    backends = [
+        ("filesystem", FileSystemSessionInterface(tempfile.mkdtemp(), 500, 0o600, "session:")),
+        ("database", ServerSideSessionInterface(DatabaseSessionStore(application.db))),
+        ("memory", ServerSideSessionInterface(MemorySessionStore())),
+        ("cookie", SecureCookieSessionInterface()),
+    ]
+
+    for name, interface in backends:
+        app.session_interface = interface
+        client = app.test_client()
+        with client.session_transaction() as user_session:
+            user_session["first_name"] = "Benchmark"
+            user_session["user_id"] = 0
+        client.get("/")  # warm up
+        report(f"session read ({name})", time_calls(lambda _: client.get("/"), range(args.requests),
+                                                    repeat=args.repeat))
+
+        if name == "database":
+            sid = next(cookie.value for cookie in client.cookie_jar if cookie.name == app.session_cookie_name)
+            interface.store.delete(sid)
+
+    stub.stop()
+
+
+def setup_dataset(db, args):
+    """
+    Creates the tables in an empty database, and fills them with a synthetic dataset: args.scale copies of the
+    args.file catalog (copies get new 13 digit isbns), args.users users (username 'load_user_<n>', password
+    'benchmark') and args.reviews reviews. A few books get most of the reviews, as on the real website.
+    """
+
+    if db.engine.dialect.has_table(db.engine, "books"):
+        print("The database already has a 'books' table; the dataset must be created in an empty database")
+        return
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    db.create_all_tables()
+
+    with open(args.file) as book_file:
+        reader = csv.reader(book_file)
+        next(reader)
+        catalog = [(isbn, title, author, int(year)) for isbn, title, author, year in reader]
+
+    books = []
+    for copy in range(args.scale):
+        for position, (isbn, title, author, year) in enumerate(catalog):
+            book_id = copy * len(catalog) + position + 1
+            if copy:
+                isbn, title = f"97{copy:02d}{book_id:09d}", f"{title} (volume {copy + 1})"
+            books.append({"isbn": isbn, "title": title, "author": author, "year": year})
+    # the tables are new, so rows get the ids 1, 2, ... in the order they are inserted
+    insert_in_batches(db, "INSERT INTO books (isbn, title, author, year) VALUES (:isbn, :title, :author, :year);",
+                      books)
+
+    # every user has the same password, hashed once, since hashing is slow on purpose
+    password = hash_password("benchmark")
+    insert_in_batches(db, "INSERT INTO users (first_name, last_name, username, password) "
+                          "VALUES ('Load', 'User', :username, :password);",
+                      [{"username": f"load_user_{user_id}", "password": password}
+                       for user_id in range(1, args.users + 1)])
+
+    reviewed = set()
+    reviews = []
+    while len(reviews) < min(args.reviews, len(books) * args.users):
+        book_id = int(len(books) * rng.random() ** 3) + 1
+        user_id = rng.randint(1, args.users)
+        if (book_id, user_id) in reviewed:
+            continue
+        reviewed.add((book_id, user_id))
+        reviews.append({"book_id": book_id, "user_id": user_id,
+                        "date_created": date.today() - timedelta(days=rng.randrange(365)),
+                        "rating": rng.randint(1, 5), "review": "Synthetic review"})
+    insert_in_batches(db, "INSERT INTO book_reviews (book_id, user_id, date_created, rating, review) "
+                          "VALUES (:book_id, :user_id, :date_created, :rating, :review);", reviews)
+
+    if db.engine.dialect.name == "postgresql":
+        db.create_books_search_indexes()
+    db.rebuild_book_stats()
+
+    print(f"Created {len(books)} books, {args.users} users and {len(reviews)} reviews "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+def insert_in_batches(db, statement, rows):
+    """Inserts rows with a multi-row (executemany) INSERT per BOOK_IMPORT_BATCH_SIZE rows."""
+
+    for position in range(0, len(rows), BOOK_IMPORT_BATCH_SIZE):
+        db.session.execute(statement, rows[position:position + BOOK_IMPORT_BATCH_SIZE])
+        db.session.commit()
+
+
+def benchmark_load(db, args):
+    """
+    Sends a mix of requests to /search, /book/<isbn>, /api/<isbn> and /book-review from args.concurrency threads,
+    each logged in as a different user, with Goodreads replaced by a stub server. Reports the latency and SQL
+    statements of each route, and the overall throughput.
+    """
+
+    isbns = [row.isbn for row in db.session.execute("SELECT isbn FROM books ORDER BY id LIMIT 1000;").fetchall()]
+    user_ids = [row.id for row in db.session.execute("SELECT id FROM users ORDER BY id LIMIT :n;",
+                                                     {"n": args.concurrency}).fetchall()]
+    db.remove_session()
+    if not user_ids:
+        print("The database has no users to send requests as; create a dataset with the 'setup' subcommand")
+        return
+
+    stub = StubGoodreadsServer()
+    application, _ = load_application(stub)
+    application.instrumentation.timing_header = True
+    routes = ["search", "book", "api", "review"]
+    timings = {route: [] for route in routes}
+    queries = {route: [] for route in routes}
+
+    def send_requests(worker):
+        rng = random.Random(args.seed + worker)
+        client = application.app.test_client()
+        with client.session_transaction() as user_session:
+            user_session["first_name"] = "Load"
+            user_session["user_id"] = user_ids[worker % len(user_ids)]
+
+        requests = routes * args.requests
+        rng.shuffle(requests)
+        for route in requests:
+            isbn = rng.choice(isbns)
+            start = time.perf_counter()
+            if route == "search":
+                response = client.post("/search", data={"user_search": rng.choice(SEARCH_QUERIES)})
+            elif route == "book":
+                response = client.get(f"/book/{isbn}")
+            elif route == "api":
+                response = client.get(f"/api/{isbn}")
+            else:
+                response = client.post("/book-review", data={"book_isbn": isbn, "user_rating": rng.randint(1, 5),
+                                                             "user_review": "Load test review"})
+            timings[route].append((time.perf_counter() - start) * 1000)
+            query_count = re.search(r'desc="(\d+) queries"', response.headers.get("Server-Timing", ""))
+            queries[route].append(int(query_count.group(1)) if query_count else 0)
+
+    workers = [threading.Thread(target=send_requests, args=(worker,)) for worker in range(args.concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    for route in routes:
+        report(f"load {route}", timings[route], queries_per_request=statistics.mean(queries[route]))
+    all_timings = [timing for route in routes for timing in timings[route]]
+    report(f"load total ({args.concurrency} threads)", all_timings, requests_per_second=len(all_timings) / elapsed)
+    stub.stop()
+
+
+def benchmark_micro(db, args):
+    """Times the BookDatabase methods behind the website's pages directly, with the SQL statements they run."""
+
+    books = db.session.execute("SELECT id, isbn FROM books ORDER BY id LIMIT 500;").fetchall()
+    isbns = [book.isbn for book in books]
+    book_ids = [book.id for book in books]
+    user_id = db.session.execute("SELECT COALESCE(MIN(id), 0) AS id FROM users;").fetchone()['id']
+    queries = count_queries(db.engine)
+
+    operations = [
+        ("search_by_any", db.search_by_any, SEARCH_QUERIES),
+        ("search_by_isbn", db.search_by_isbn, isbns),
+        ("get_book_details", db.get_book_details, isbns),
+        ("get_books_by_isbns (50)", db.get_books_by_isbns,
+         [isbns[position:position + 50] for position in range(0, len(isbns), 50)]),
+        ("get_book_reviews", db.get_book_reviews, book_ids),
+        ("get_rating_histogram", db.get_rating_histogram, book_ids),
+        ("user_already_submitted_review", lambda book_id: db.user_already_submitted_review(book_id, user_id),
+         book_ids),
+    ]
+    for name, operation, arguments in operations:
+        queries["count"] = 0
+        timings = time_calls(operation, arguments, repeat=args.repeat)
+        report(name, timings, queries_per_call=queries["count"] / len(timings))
+
+
+def benchmark_suggest(db, args):
+    """
+    Simulates users typing titles and authors into /api/suggest (one request per keystroke) from args.concurrency
+    threads, after timing the build of the suggestion index and its lookups alone.
+    """
+
+    start = time.perf_counter()
+    index = SuggestionIndex.from_database(db)
+    print(f"Built suggestion index of {len(index.completions)} titles and authors "
+          f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    rng = random.Random(args.seed)
+    texts = [text for text, _, _, _ in rng.sample(index.completions, min(len(index.completions), 200))]
+    keystrokes = [text[:length] for text in texts for length in range(1, min(len(text), 12) + 1)]
+    report("suggest (index)", time_calls(index.suggest, keystrokes, repeat=args.repeat))
+    db.remove_session()
+
+    stub = StubGoodreadsServer()
+    application, _ = load_application(stub)
+    application.suggestions.get_index()
+    timings = []
+
+    def type_queries(worker):
+        client = application.app.test_client()
+        worker_keystrokes = keystrokes[worker::args.concurrency] * args.repeat
+        timings.extend(time_calls(lambda prefix: client.get("/api/suggest", query_string={"q": prefix}),
+                                  worker_keystrokes))
+
+    workers = [threading.Thread(target=type_queries, args=(worker,)) for worker in range(args.concurrency)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    report(f"/api/suggest ({args.concurrency} threads)", timings, requests_per_second=len(timings) / elapsed)
+    stub.stop()
+
+
+def benchmark_recommendations(db, args):
+    """
+    Times the recommendations job (see recommendations.py) and its peak memory on args.reviews synthetic reviews
+    of the books in the books table, for the whole catalog and incrementally for 1% of the books. Recommendations
+    are computed but not saved.
+    """
+
+    import numpy as np
+    from recommendations import HIGH_RATING, readers_matrix, compute_recommendations
+
+    book_count = db.session.execute("SELECT COUNT(*) AS n FROM books;").fetchone()['n']
+    user_count = max(args.reviews // 50, 1)
+    rng = np.random.default_rng(args.seed)
+    book_ids = (book_count * rng.random(args.reviews) ** 3).astype(np.int32) + 1
+    user_ids = rng.integers(1, user_count + 1, args.reviews, dtype=np.int32)
+    high_ratings = rng.integers(1, 6, args.reviews) >= HIGH_RATING
+    book_ids, user_ids = book_ids[high_ratings], user_ids[high_ratings]
+    print(f"{args.reviews} synthetic reviews of {book_count} books by {user_count} users, "
+          f"{len(book_ids)} of them high ratings")
+
+    stages = [("all books", None), ("incremental, 1%", np.unique(book_ids)[::100])]
+    for name, for_books in stages:
+        tracemalloc.start()
+        start = time.perf_counter()
+        matrix, books = readers_matrix(book_ids, user_ids)
+        computed = sum(1 for _ in compute_recommendations(matrix, books, for_books))
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f"recommendations ({name})", [elapsed * 1000], books=computed, peak_memory_mib=peak / 2 ** 20)
+
+
+def benchmark_reviews(db, args):
+    """
+    Compares the ingestion throughput of reviews written one transaction each (BookDatabase.add_user_review) with
+    the write-behind ReviewWriter, with args.concurrency users submitting args.requests reviews each at the same
+    time. The benchmark reviews are deleted afterwards.
+    """
+
+    user_ids = [row.id for row in db.session.execute("SELECT id FROM users ORDER BY id "
+                                                     "LIMIT :n;", {"n": args.concurrency}).fetchall()]
+    if not user_ids:
+        print("The database has no users to submit reviews as; create a dataset with the 'setup' subcommand")
+        return
+
+    # every user reviews books they haven't reviewed yet, different ones in each stage
+    reviewed = {(row.book_id, row.user_id) for row in db._execute_list_query(
+        f"SELECT book_id, user_id FROM book_reviews WHERE {db._list_condition('user_id', 'user_ids')};",
+        "user_ids", {"user_ids": user_ids}
+    ).fetchall()}
+    book_ids = [row.id for row in db.session.execute("SELECT id FROM books ORDER BY id;").fetchall()]
+    unreviewed = {user_id: iter([book_id for book_id in book_ids if (book_id, user_id) not in reviewed])
+                  for user_id in user_ids}
+    db.remove_session()
+
+    queue_file = tempfile.NamedTemporaryFile(suffix=".db")
+    writer = ReviewWriter(db, SQLiteReviewQueue(queue_file.name))
+    stages = [("one transaction per review", db.add_user_review), ("write-behind queue", writer.submit)]
+
+    try:
+        for name, add_review in stages:
+            timings = []
+
+            def submit_reviews(user_id):
+                reviews = [(user_id, next(unreviewed[user_id])) for _ in range(args.requests)]
+                timings.extend(time_calls(lambda review: add_review(user_db_id=review[0], book_db_id=review[1],
+                                                                    rating=5, review="Benchmark review"), reviews))
+                db.remove_session()
+
+            workers = [threading.Thread(target=submit_reviews, args=(user_id,)) for user_id in user_ids]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            writer.flush()
+            elapsed = time.perf_counter() - start
+            report(f"reviews ({name})", timings, reviews_per_second=len(timings) / elapsed)
+    finally:
+        writer.stop()
+        db.session.execute("DELETE FROM book_reviews WHERE review = 'Benchmark review';")
+        db.session.commit()
+        db.rebuild_book_stats()
+
+
+# Run in a new interpreter by the 'startup' benchmark: prints the time taken and the memory used by the import of
+# the application and by its first /ready call, as json
+STARTUP_SCRIPT = """
+import json, resource, time
+start = time.perf_counter()
+import application
+imported = time.perf_counter()
+imported_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+response = application.app.test_client().get("/ready")
+ready = time.perf_counter()
+print(json.dumps({"status": response.status_code, "import_ms": (imported - start) * 1000,
+                  "ready_ms": (ready - imported) * 1000, "import_rss_kib": imported_rss,
+                  "ready_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def benchmark_startup(db, args):
+    """
+    Measures the cold start of a worker process, args.repeat times: how long importing the application takes (what
+    a server forking workers from a preloaded application pays once, and every worker otherwise), how long its
+    first /ready call takes to warm up the database pool and the in-process indexes, and the process' peak memory
+    after each step.
+    """
+
+    environment = dict(os.environ)
+    environment.setdefault("GOODREADS_API_KEY", "benchmark")
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=environment, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    if any(run["status"] != 200 for run in runs):
+        print(f"/ready failed with status {runs[-1]['status']}")
+    report("startup (import)", [run["import_ms"] for run in runs],
+           max_rss_mib=max(run["import_rss_kib"] for run in runs) / 1024)
+    report("startup (first /ready)", [run["ready_ms"] for run in runs],
+           max_rss_mib=max(run["ready_rss_kib"] for run in runs) / 1024)
+
+
+def git_commit():
+    """Returns the hash of the checked out git commit, or None outside of a git repository."""
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(path):
+    """Prints how the median and 95th percentile of the RESULTS changed since the results saved in a json file."""
+
+    with open(path) as results_file:
+        previous = json.load(results_file)
+    previous_results = {result["name"]: result for result in previous["results"]}
+
+    print(f"--- compared with {path} (commit {previous.get('commit')})")
+    for result in RESULTS:
+        before = previous_results.get(result["name"])
+        if before is None:
+            continue
+        changes = " ".join(
+            f"{key}={(result[key] - before[key]) / before[key] * 100 if before[key] else 0.0:+.1f}%"
+            for key in ("p50_ms", "p95_ms")
+        )
+        print(f"{result['name']:<30} {changes}")
+
+
+BENCHMARKS = {
+    "setup": setup_dataset,
+    "load": benchmark_load,
+    "micro": benchmark_micro,
+    "search": benchmark_search,
+    "search-cache": benchmark_search_cache,
+    "book-page": benchmark_book_page,
+    "catalog": benchmark_catalog,
+    "fragments": benchmark_fragments,
+    "indexes": benchmark_indexes,
+    "login": benchmark_login,
+    "pool": benchmark_pool,
+    "recommendations": benchmark_recommendations,
+    "reviews": benchmark_reviews,
+    "saved-books": benchmark_saved_books,
+    "sessions": benchmark_sessions,
+    "startup": benchmark_startup,
+    "suggest": benchmark_suggest,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reader's Forest benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="benchmark to run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times each operation is repeated")
+    parser.add_argument("--requests", type=int, default=20, help="number of requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--books", type=int, default=1000000, help="number of synthetic books to generate")
+    parser.add_argument("--reviews", type=int, default=1000000, help="number of synthetic reviews to generate")
+    parser.add_argument("--users", type=int, default=1000, help="number of synthetic users to generate")
+    parser.add_argument("--scale", type=int, default=1, help="number of copies of the catalog to generate")
+    parser.add_argument("--file", default="books.csv", help="catalog the synthetic dataset is generated from")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random dataset and requests")
+    parser.add_argument("--output", help="json file to save the results to")
+    parser.add_argument("--compare", help="json file of earlier results to compare the results with")
+    args = parser.parse_args()
+
+    db = BookDatabase()
+    db.initiate_session()
+    try:
+        BENCHMARKS[args.benchmark](db, args)
+    finally:
+        db.close_session()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"benchmark": args.benchmark, "commit": git_commit(), "created_at": datetime.now().isoformat(),
+                       "arguments": vars(args), "results": RESULTS}, output_file, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare:
+        compare_results(args.compare)
+
+
+if __name__ == "__main__":
+    main()
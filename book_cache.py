@@ -0,0 +1,106 @@
+"""
+The "BookCache" class is a cached read model of the books served by the JSON API and found by cached searches
+(see search_cache.py). A book is cached in two parts:
+its details (id, isbn, title, author, year), which don't change once imported, and its rating statistics, which are
+dropped as soon as BookDatabase.add_user_review records a new review of the book. Field-only lookups (e.g. a book's
+author) only need the details, which are loaded without the rating aggregates.
+
+Invalidation is in-process: other worker processes serve their cached statistics until they expire (ttl).
+"""
+from cache import TTLCache
+from objects import BookObject
+
+
+class BookCache:
+
+    def __init__(self, db, max_size=10000, ttl=300):
+        """
+        :param db: BookDatabase the books are read from
+        :param max_size: maximum number of books kept in each part of the cache
+        :param ttl: seconds a cached book is served for, at most
+        """
+
+        self.db = db
+        self.details = TTLCache(max_size=max_size, ttl=ttl)     # isbn -> details dictionary, or None
+        self.stats = TTLCache(max_size=max_size, ttl=ttl)       # book id -> rating statistics
+        db.add_review_listener(self.invalidate)
+
+    def get_details(self, isbn):
+        """
+        Returns the static details of a book.
+        :param isbn: isbn of the book
+        :return: dictionary of db_id, isbn, title, author and year; None for unknown isbns
+        """
+
+        found, details, _ = self.details.lookup(isbn)
+        if found:
+            return details
+
+        details = self.db.get_book_details(isbn)
+        self.details.set(isbn, details)
+        return details
+
+    def get_book(self, isbn):
+        """
+        Returns a book with its rating statistics.
+        :param isbn: isbn of the book
+        :return: BookObject, or None for unknown isbns
+        """
+
+        details = self.get_details(isbn)
+        if details is None:
+            return None
+
+        found, stats, _ = self.stats.lookup(details["db_id"])
+        if not found:
+            book = self.db.search_by_isbn(isbn)
+            if book is None:
+                return None
+            stats = {"star_rating": book.star_rating, "review_count": book.review_count}
+            self.stats.set(details["db_id"], stats)
+
+        return BookObject(**details, **stats)
+
+    def get_books(self, isbns):
+        """
+        Returns several books with their rating statistics; the books missing from the cache are loaded together
+        in a single query.
+        :param isbns: list of isbns
+        :return: list of BookObjects in the same order as the isbns; unknown isbns are left out
+        """
+
+        books = dict()
+        missing = list()
+        for isbn in isbns:
+            found, details, _ = self.details.lookup(isbn)
+            if found and details is not None:
+                found, stats, _ = self.stats.lookup(details["db_id"])
+                if found:
+                    books[isbn] = BookObject(**details, **stats)
+                    continue
+            missing.append(isbn)
+
+        if missing:
+            loaded_books = self.db.get_books_by_isbns(missing)
+            self.remember(loaded_books)
+            books.update((book.isbn, book) for book in loaded_books)
+
+        return [books[isbn] for isbn in isbns if isbn in books]
+
+    def remember(self, books):
+        """Caches books just loaded from the database, with their rating statistics."""
+
+        for book in books:
+            self.details.set(book.isbn, {"db_id": book.db_id, "isbn": book.isbn, "title": book.title,
+                                         "author": book.author, "year": book.year})
+            self.stats.set(book.db_id, {"star_rating": book.star_rating, "review_count": book.review_count})
+
+    def invalidate(self, book_db_id):
+        """Drops the cached rating statistics of a book, e.g. when it gets a new review."""
+
+        self.stats.delete(book_db_id)
+
+    def cache_stats(self):
+        """Returns the hit/miss/eviction counters of both parts of the cache."""
+
+        return {"details": self.details.stats(), "stats": self.stats.stats()}
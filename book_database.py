@@ -3,26 +3,202 @@ The "BookDatabase" class represents all interactions of the website with the boo
 definitions of how tables should be configured/created.
 """
 import os
+import io
+import hmac
 import csv
-from sqlalchemy import create_engine
+import time
+import threading
+from itertools import islice
+from sqlalchemy import create_engine, text, bindparam
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import scoped_session, sessionmaker
-from objects import BookObject, ReviewObject
+from sqlalchemy.pool import QueuePool
+from werkzeug.security import generate_password_hash, check_password_hash
+from objects import BookObject, ReviewObject, UserObject, RecommendationObject
+from search_backends import create_search_backend
 from datetime import datetime
 
+# Maximum number of books returned by a single call to search_by_any (one page of search results)
+SEARCH_PAGE_SIZE = 50
+
+# Number of reviews shown per page on a book page
+REVIEW_PAGE_SIZE = 20
+
+# Number of recommended books shown on a book page
+RECOMMENDATIONS_PAGE_SIZE = 5
+
+# Number of books shown per page of a user's reading list
+SAVED_BOOKS_PAGE_SIZE = 50
+
+# Number of csv lines loaded per batch by insert_books_from_file
+BOOK_IMPORT_BATCH_SIZE = 10000
+
+# Number of rows fetched at a time when exporting the catalog
+EXPORT_BATCH_SIZE = 1000
+
+# Selects books together with their average rating (0 if no ratings yet) and number of reviews, read from the
+# 'book_stats' table; callers append a WHERE clause
+BOOK_AGGREGATE_QUERY = "SELECT b.id, b.isbn, b.title, b.author, b.year, " \
+                       "COALESCE(s.rating_sum / NULLIF(s.rating_count, 0), 0) AS star_rating, " \
+                       "COALESCE(s.rating_count, 0) AS review_count " \
+                       "FROM books b LEFT JOIN book_stats s ON s.book_id = b.id "
+
+# Computes, from the raw reviews, the aggregates kept in the 'book_stats' table for every reviewed book
+REVIEW_STATS_QUERY = "SELECT book_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count, " + \
+                     ", ".join(f"SUM(CASE WHEN CAST(rating AS INT) = {stars} THEN 1 ELSE 0 END) AS rating_{stars}"
+                               for stars in range(1, 6)) + \
+                     " FROM book_reviews GROUP BY book_id"
+
+# Fills the (empty) 'book_stats' table from the raw reviews
+BOOK_STATS_INSERT = "INSERT INTO book_stats (book_id, rating_sum, rating_count, rating_1, rating_2, rating_3, " \
+                    f"rating_4, rating_5) {REVIEW_STATS_QUERY};"
+
+# Method used to hash passwords: PBKDF2-SHA256 with a number of iterations (work factor) that can be lowered per
+# environment with PASSWORD_HASH_ITERATIONS, e.g. to keep tests fast
+PASSWORD_HASH_METHOD = f"pbkdf2:sha256:{int(os.getenv('PASSWORD_HASH_ITERATIONS', 150000))}"
+
+# Ordered schema migrations applied by BookDatabase.migrate, as (version, description, SQL statements). Never
+# change a migration that has been released; add a new one with the next version number instead.
+MIGRATIONS = [
+    (1, "Index book_reviews and saved_books foreign keys; allow one review per user and book", [
+        # keep only the first review of any user who reviewed the same book twice, before enforcing uniqueness
+        "DELETE FROM book_reviews WHERE id NOT IN (SELECT MIN(id) FROM book_reviews GROUP BY book_id, user_id);",
+        "CREATE UNIQUE INDEX IF NOT EXISTS book_reviews_book_id_user_id_key ON book_reviews (book_id, user_id);",
+        "CREATE INDEX IF NOT EXISTS book_reviews_book_id_id_idx ON book_reviews (book_id, id);",
+        "CREATE INDEX IF NOT EXISTS book_reviews_user_id_idx ON book_reviews (user_id);",
+        "CREATE INDEX IF NOT EXISTS saved_books_user_id_idx ON saved_books (user_id);",
+        "CREATE INDEX IF NOT EXISTS saved_books_book_id_idx ON saved_books (book_id);",
+        # removed duplicates must not be counted in the rating aggregates
+        "DELETE FROM book_stats;",
+        BOOK_STATS_INSERT,
+    ]),
+    (2, "Track the version of the books catalog, bumped by every import", [
+        """CREATE TABLE catalog_version (
+            id INT PRIMARY KEY,
+            version INT NOT NULL
+        );""",
+        "INSERT INTO catalog_version (id, version) VALUES (1, 1);",
+    ]),
+    (3, "Store user sessions in the database", [
+        """CREATE TABLE user_sessions (
+            id VARCHAR PRIMARY KEY,
+            data VARCHAR NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        );""",
+        "CREATE INDEX user_sessions_expires_at_idx ON user_sessions (expires_at);",
+    ]),
+    (4, "Store 'readers also liked' book recommendations (see recommendations.py)", [
+        """CREATE TABLE book_recommendations (
+            book_id INT NOT NULL REFERENCES books,
+            rank INT NOT NULL,
+            recommended_book_id INT NOT NULL REFERENCES books,
+            score FLOAT NOT NULL,
+            PRIMARY KEY (book_id, rank)
+        );""",
+        """CREATE TABLE recommendation_state (
+            id INT PRIMARY KEY,
+            last_review_id INT NOT NULL,
+            computed_at TIMESTAMP
+        );""",
+        "INSERT INTO recommendation_state (id, last_review_id) VALUES (1, 0);",
+    ]),
+    (5, "Give saved_books a (user_id, book_id) primary key and the date each book was saved", [
+        """CREATE TABLE saved_books_new (
+            user_id INT NOT NULL REFERENCES users,
+            book_id INT NOT NULL REFERENCES books,
+            saved_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT saved_books_pkey PRIMARY KEY (user_id, book_id)
+        );""",
+        "INSERT INTO saved_books_new (user_id, book_id) SELECT DISTINCT user_id, book_id FROM saved_books "
+        "WHERE user_id IS NOT NULL AND book_id IS NOT NULL;",
+        "DROP TABLE saved_books;",
+        "ALTER TABLE saved_books_new RENAME TO saved_books;",
+        # a user's reading list is listed most recently saved first
+        "CREATE INDEX saved_books_user_id_saved_at_idx ON saved_books (user_id, saved_at, book_id);",
+        "CREATE INDEX saved_books_book_id_idx ON saved_books (book_id);",
+    ]),
+    (6, "Count how often every (normalized) search query is run, to prewarm the search cache", [
+        """CREATE TABLE search_query_stats (
+            query VARCHAR PRIMARY KEY,
+            search_count INT NOT NULL,
+            last_searched_at TIMESTAMP NOT NULL
+        );""",
+        "CREATE INDEX search_query_stats_search_count_idx ON search_query_stats (search_count);",
+    ]),
+]
+
+
+def hash_password(password):
+    """Returns a salted hash of a password, using PASSWORD_HASH_METHOD."""
+
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD, salt_length=16)
+
+
+def parse_rating(rating):
+    """Returns a rating as a number of stars from 1 to 5; raises ValueError if it is missing or out of range."""
+
+    try:
+        stars = int(rating)
+    except (TypeError, ValueError):
+        raise ValueError(f"Rating must be a number of stars, not {rating!r}")
+    if stars not in range(1, 6):
+        raise ValueError(f"Rating must be between 1 and 5 stars, not {stars}")
+    return stars
+
 
 class BookDatabase:
 
-    def __init__(self):
-        self.session = None
-        self.engine = None
+    def __init__(self, search_backend=None):
+        self._session = None
+        self._engine = None
+        self.engine_lock = threading.Lock()
+        self.engine_listeners = list()
+        self.inherited_engines = list()
+        self.search_backend = search_backend
+        self.review_listeners = list()
+        self.catalog = None
 
-    def initialize(self):
-        """Main method to set up new database tables from scratch and inserts book information from file."""
+    @property
+    def engine(self):
+        """The SQLAlchemy engine, created (by initiate_session) on first use in the current process."""
+
+        if self._engine is None:
+            with self.engine_lock:
+                if self._engine is None:
+                    self.initiate_session()
+        if self._engine is None:
+            # initiate_session printed why, e.g. an invalid DATABASE_URL
+            raise RuntimeError("Could not create the database engine")
+        return self._engine
+
+    @engine.setter
+    def engine(self, engine):
+        self._engine = engine
+
+    @property
+    def session(self):
+        """The thread-local SQLAlchemy session, created along with the engine on first use."""
+
+        if self._session is None:
+            self.engine     # creates the session too
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def initialize(self, book_file="books.csv", batch_size=BOOK_IMPORT_BATCH_SIZE, dry_run=False):
+        """
+        Main method to set up new database tables from scratch and inserts book information from file. In a dry
+        run, the book file is only read and validated; nothing is written to the database.
+        """
 
         try:
             self.initiate_session()
-            self.create_all_tables()
-            self.insert_books_from_file()
+            if not dry_run:
+                self.create_all_tables()
+            self.insert_books_from_file(book_file, batch_size=batch_size, dry_run=dry_run)
             self.close_session()
         except Exception as e:
             print(f"Failed to properly initialized database due to {e}")
@@ -35,10 +211,106 @@ class BookDatabase:
             raise RuntimeError("DATABASE_URL is not set")
 
         try:
-            self.engine = create_engine(os.getenv("DATABASE_URL"))
+            self.engine = create_engine(os.getenv("DATABASE_URL"), **self._pool_options(os.getenv("DATABASE_URL")))
             self.session = scoped_session(sessionmaker(bind=self.engine))
         except Exception as te:
             print(f"Failed to create session, See more: {te}")
+            return
+
+        for listener in self.engine_listeners:
+            listener(self.engine)
+
+    def add_engine_listener(self, listener):
+        """Registers a function called with every engine created by initiate_session (e.g. to instrument it)."""
+
+        self.engine_listeners.append(listener)
+        if self._engine is not None:
+            listener(self._engine)
+
+    def reset_after_fork(self):
+        """
+        Forgets, in a child process just forked, the engine inherited from the parent process, so that the child
+        creates its own connection pool on first use. The inherited engine is kept referenced rather than disposed
+        of: closing its connections from the child would also close them for the parent.
+        """
+
+        if self._engine is not None:
+            self.inherited_engines.append(self._engine)
+        self._engine = None
+        self._session = None
+        self.engine_lock = threading.Lock()
+
+    def warm_up_pool(self, connections=None):
+        """
+        Opens database connections ahead of the first requests, and checks that the database answers.
+        :param connections: number of connections to open; by default, the size of the pool (DB_POOL_SIZE)
+        :return: number of connections opened
+        """
+
+        if connections is None:
+            # only a QueuePool keeps a number of connections; SQLite's pools open one per thread (or per checkout)
+            pool = self.engine.pool
+            connections = pool.size() if isinstance(pool, QueuePool) else 1
+
+        opened = list()
+        try:
+            for _ in range(connections):
+                opened.append(self.engine.connect())
+                opened[-1].execute("SELECT 1;")
+        finally:
+            for connection in opened:
+                connection.close()
+        return connections
+
+    @staticmethod
+    def _pool_options(database_url):
+        """
+        Connection pool settings for create_engine, read from environment variables: DB_POOL_SIZE and
+        DB_MAX_OVERFLOW (number of kept and extra connections), DB_POOL_TIMEOUT (seconds to wait for a free
+        connection), DB_POOL_RECYCLE (seconds after which a connection is replaced) and DB_POOL_PRE_PING (test
+        connections before using them, "true" or "false"). SQLite doesn't use a sized pool, so only the last two
+        apply to it.
+        """
+
+        options = {
+            "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+            "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        }
+        if make_url(database_url).get_backend_name() != "sqlite":
+            options.update(
+                pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+                pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+            )
+        return options
+
+    def pool_status(self):
+        """Returns the utilization of the connection pool (connections kept, checked in/out, overflow)."""
+
+        pool = self.engine.pool
+        if not hasattr(pool, "checkedout"):
+            return {"pool": type(pool).__name__, "status": pool.status()}
+
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+    def get_search_backend(self):
+        """
+        Returns the backend used by search_by_any, creating it on first use. The backend is chosen by the
+        SEARCH_BACKEND environment variable ("like", "postgres" or "memory"); by default Postgres databases use
+        their full-text/trigram indexes and any other database uses the in-process index of the books table.
+        """
+
+        if self.search_backend is None:
+            default_backend = "postgres" if self.engine.dialect.name == "postgresql" else "memory"
+            self.search_backend = create_search_backend(os.getenv("SEARCH_BACKEND", default_backend))
+
+        return self.search_backend
 
     def create_all_tables(self):
         """Creates all database tables at once."""
@@ -46,28 +318,152 @@ class BookDatabase:
         self.create_user_table()
         self.create_books_table()
         self.create_reviews_table()
+        self.create_book_stats_table()
         self.create_user_saved_books()
+        self.migrate()
 
-    def insert_books_from_file(self, book_file="books.csv"):
+    def migrate(self):
+        """
+        Brings the database schema up to date by applying, in order, the MIGRATIONS that haven't been applied yet.
+        The version of every applied migration is recorded in the 'schema_version' table, and each migration
+        runs in its own transaction. Databases created before 'book_stats' existed get the table first, since the
+        migrations keep it up to date.
+        """
+
+        self.create_book_stats_table()
+        self.session.execute(
+            """CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            );"""
+        )
+        self.session.commit()
+
+        current_version = self.session.execute(
+            "SELECT COALESCE(MAX(version), 0) AS version FROM schema_version;"
+        ).fetchone()['version']
+
+        for version, description, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            print(f"Applying schema migration {version}: {description}")
+            for statement in statements:
+                self.session.execute(statement)
+            self.session.execute(
+                "INSERT INTO schema_version (version, description, applied_at) "
+                "VALUES (:version, :description, :applied_at);",
+                {"version": version, "description": description, "applied_at": datetime.now()}
+            )
+            self.session.commit()
+
+        print(f"Database schema is at version {MIGRATIONS[-1][0]}")
+
+    def insert_books_from_file(self, book_file="books.csv", batch_size=BOOK_IMPORT_BATCH_SIZE, dry_run=False):
         """
         Imports a csv file containing book data (comma-delimited) and inserts each line into the
         books database. Assumes that a file called "books.csv" exists in the same directory level,
         but another path can be passed.
+
+        The file is streamed in batches of rows, which are loaded with COPY on Postgres and with a single
+        multi-row (executemany) INSERT on other databases. Books whose isbn already exists are updated instead,
+        so importing the same file twice is harmless.
+        :param book_file: path to the csv file, with a header line and isbn, title, author, year columns
+        :param batch_size: number of rows loaded per batch
+        :param dry_run: if True, the file is read and validated but nothing is written to the database
+        :return: number of books imported (or that would be imported, for a dry run)
         """
 
         print("Inserting books into 'books' table from .csv file")
         try:
             f = open(book_file)
-            reader = csv.reader(f)
-            next(reader)   # skip header
         except FileNotFoundError:
             print("Please make sure that the books.csv file is in the correct spot in your repository.")
+            return 0
 
-        for isbn, title, author, year in reader:
-            insert_statement = "INSERT INTO books (isbn, title, author, year) VALUES (:isbn, :title, :author, :year)"
-            self.session.execute(insert_statement, {"isbn": isbn, "title": title, "author": author, "year": year})
+        if dry_run:
+            load_batch = None
+        elif self.engine.dialect.name == "postgresql":
+            load_batch = self._copy_books
+            self.session.execute(
+                "CREATE TEMPORARY TABLE books_import (isbn VARCHAR, title VARCHAR, author VARCHAR, year INT) "
+                "ON COMMIT DROP;"
+            )
+        else:
+            load_batch = self._upsert_books
 
-        self.session.commit()
+        imported = 0
+        skipped = 0
+        start = time.perf_counter()
+        with f:
+            reader = csv.reader(f)
+            next(reader)   # skip header
+
+            while True:
+                batch = list()
+                for line in islice(reader, batch_size):
+                    try:
+                        isbn, title, author, year = line
+                        batch.append({"isbn": isbn, "title": title, "author": author, "year": int(year)})
+                    except ValueError:
+                        print(f"Skipping malformed line {reader.line_num}: {line}")
+                        skipped += 1
+
+                if not batch:
+                    break
+
+                if load_batch is not None:
+                    load_batch(batch)
+                imported += len(batch)
+
+                elapsed = time.perf_counter() - start
+                print(f"{'Validated' if dry_run else 'Imported'} {imported} books "
+                      f"({imported / elapsed if elapsed else 0:.0f} rows/sec)")
+
+        if dry_run:
+            self.session.rollback()
+        else:
+            # lets in-process catalog snapshots (see catalog.py) know that the books changed
+            self.session.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1;")
+            self.session.commit()
+
+        print(f"Finished {'validating' if dry_run else 'importing'} {imported} books from {book_file} "
+              f"in {time.perf_counter() - start:.1f}s ({skipped} malformed lines skipped)")
+        return imported
+
+    def _upsert_books(self, batch):
+        """Inserts a batch of books with one executemany INSERT, updating books whose isbn already exists."""
+
+        self.session.execute(
+            "INSERT INTO books (isbn, title, author, year) VALUES (:isbn, :title, :author, :year) "
+            "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, year = excluded.year",
+            batch
+        )
+
+    def _copy_books(self, batch):
+        """
+        Loads a batch of books into the temporary 'books_import' table with COPY FROM STDIN, then upserts them into
+        the books table in a single statement (Postgres only).
+        """
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for book in batch:
+            writer.writerow((book["isbn"], book["title"], book["author"], book["year"]))
+        buffer.seek(0)
+
+        cursor = self.session.connection().connection.cursor()
+        cursor.copy_expert("COPY books_import (isbn, title, author, year) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.close()
+
+        # DISTINCT ON, because a single INSERT can't update the same book twice when an isbn is repeated in the file
+        self.session.execute(
+            "INSERT INTO books (isbn, title, author, year) "
+            "SELECT DISTINCT ON (isbn) isbn, title, author, year FROM books_import "
+            "ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, author = excluded.author, year = excluded.year;"
+        )
+        self.session.execute("TRUNCATE books_import;")
 
     def create_user_table(self):
         """Creates 'users' table from scratch, if doesn't exist yet."""
@@ -78,8 +474,8 @@ class BookDatabase:
 
         print("Creating 'users' Table")
         self.session.execute(
-            """CREATE TABLE users ( 
-                id SERIAL PRIMARY KEY,
+            f"""CREATE TABLE users ( 
+                id {self._id_column_type()},
                 first_name VARCHAR NOT NULL,
                 last_name VARCHAR NOT NULL,
                 username VARCHAR UNIQUE NOT NULL,
@@ -93,18 +489,50 @@ class BookDatabase:
 
         if self.engine.dialect.has_table(self.engine, 'books'):
             print("Note 'books' table already exists")
+        else:
+            print("Creating 'books' Table")
+            self.session.execute(
+                f"""CREATE TABLE books ( 
+                    id {self._id_column_type()},
+                    isbn VARCHAR UNIQUE,
+                    title VARCHAR NOT NULL,
+                    author VARCHAR NOT NULL,
+                    year INT NOT NULL
+                );"""
+            )
+            self.session.commit()
+
+        self.create_books_search_indexes()
+
+    def _id_column_type(self):
+        """
+        Type of the auto-incremented id columns: SERIAL on Postgres; SQLite doesn't know SERIAL (the ids would stay
+        NULL), and only assigns ids to INTEGER PRIMARY KEY columns.
+        """
+
+        if self.engine.dialect.name == "postgresql":
+            return "SERIAL PRIMARY KEY"
+        return "INTEGER PRIMARY KEY"
+
+    def create_books_search_indexes(self):
+        """
+        Creates the full-text and trigram (pg_trgm) indexes used by the "postgres" search backend, if they don't
+        exist yet. Other databases are searched without these indexes.
+        """
+
+        if self.engine.dialect.name != "postgresql":
             return
 
-        print("Creating 'books' Table")
+        print("Creating search indexes on 'books' Table")
+        self.session.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
         self.session.execute(
-            """CREATE TABLE books ( 
-                id SERIAL PRIMARY KEY,
-                isbn VARCHAR UNIQUE,
-                title VARCHAR NOT NULL,
-                author VARCHAR NOT NULL,
-                year INT NOT NULL
-            );"""
+            "CREATE INDEX IF NOT EXISTS books_search_tsv_idx ON books "
+            "USING GIN (to_tsvector('simple', title || ' ' || author));"
         )
+        for column in ("isbn", "title", "author"):
+            self.session.execute(
+                f"CREATE INDEX IF NOT EXISTS books_{column}_trgm_idx ON books USING GIN ({column} gin_trgm_ops);"
+            )
         self.session.commit()
 
     def create_reviews_table(self):
@@ -116,8 +544,8 @@ class BookDatabase:
 
         print("Creating 'book_reviews' Table")
         self.session.execute(
-            """CREATE TABLE book_reviews ( 
-                id SERIAL PRIMARY KEY,
+            f"""CREATE TABLE book_reviews ( 
+                id {self._id_column_type()},
                 book_id INT REFERENCES books,
                 user_id INT REFERENCES users,
                 date_created DATE,
@@ -128,8 +556,69 @@ class BookDatabase:
 
         self.session.commit()
 
+    def create_book_stats_table(self):
+        """
+        Creates 'book_stats' table from scratch, if doesn't exist yet. The table holds the rating aggregates of
+        each reviewed book (sum and number of ratings, and the number of ratings of each star value), kept up
+        to date by add_user_review, so ratings can be read without scanning 'book_reviews'. A new table is filled
+        from any reviews that already exist.
+        """
+
+        if self.engine.dialect.has_table(self.engine, 'book_stats'):
+            print("Note 'book_stats' table already exists")
+            return
+
+        print("Creating 'book_stats' Table")
+        self.session.execute(
+            """CREATE TABLE book_stats ( 
+                book_id INT PRIMARY KEY REFERENCES books,
+                rating_sum FLOAT NOT NULL DEFAULT 0,
+                rating_count INT NOT NULL DEFAULT 0,
+                rating_1 INT NOT NULL DEFAULT 0,
+                rating_2 INT NOT NULL DEFAULT 0,
+                rating_3 INT NOT NULL DEFAULT 0,
+                rating_4 INT NOT NULL DEFAULT 0,
+                rating_5 INT NOT NULL DEFAULT 0
+            );"""
+        )
+        self.session.commit()
+        self.rebuild_book_stats()
+
+    def rebuild_book_stats(self):
+        """Recomputes the whole 'book_stats' table from the reviews in 'book_reviews', in one transaction."""
+
+        print("Rebuilding 'book_stats' Table from 'book_reviews'")
+        self.session.execute("DELETE FROM book_stats;")
+        self.session.execute(BOOK_STATS_INSERT)
+        self.session.commit()
+
+    def check_book_stats(self):
+        """
+        Verifies the aggregates in 'book_stats' against the reviews in 'book_reviews'.
+        :return: list of the database ids of books whose aggregates are wrong
+        """
+
+        mismatches = " OR ".join(
+            f"COALESCE(s.{column}, 0) <> COALESCE(r.{column}, 0)"
+            for column in ("rating_count", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5")
+        )
+        query = f"SELECT b.id FROM books b LEFT JOIN book_stats s ON s.book_id = b.id " \
+                f"LEFT JOIN ({REVIEW_STATS_QUERY}) r ON r.book_id = b.id " \
+                f"WHERE {mismatches} OR ABS(COALESCE(s.rating_sum, 0) - COALESCE(r.rating_sum, 0)) > 0.001 " \
+                f"ORDER BY b.id;"
+        book_ids = [row.id for row in self.session.execute(query).fetchall()]
+
+        if book_ids:
+            print(f"'book_stats' is inconsistent with 'book_reviews' for {len(book_ids)} books: {book_ids[:20]}")
+        else:
+            print("'book_stats' is consistent with 'book_reviews'")
+        return book_ids
+
     def create_user_saved_books(self):
-        """This creates a table called 'saved books' that is currently not fully implemented in this version."""
+        """
+        This creates a table called 'saved books', holding the reading list of every user. Its primary key and
+        indexes are added by the migrations.
+        """
 
         if self.engine.dialect.has_table(self.engine, 'saved_books'):
             print("Note 'saved_books' table already exists")
@@ -152,31 +641,53 @@ class BookDatabase:
             return False
         return True
 
-    def correct_credentials(self, username, password):
+    def authenticate(self, username, password):
         """
-        Returns true if the username, password combination provided is in the db for
-        1 and only 1 distinct entry.
+        Checks a user's login credentials with a single query on the users table. Passwords are stored as salted
+        PBKDF2 hashes; a password still stored in plain text, or hashed with a different number of iterations than
+        PASSWORD_HASH_METHOD, is re-hashed on the user's next successful login.
         :param username
         :param password
-        :return: boolean for 'correct credentials'
+        :return: User object (database id and first name) if the credentials are correct, otherwise None
         """
 
-        if self.session.execute("SELECT username FROM users WHERE username = :username AND password = :password",
-                      {"username": username, "password": password}).rowcount == 1:
-            return True
-        return False
+        user = self.session.execute("SELECT id, first_name, password FROM users WHERE username = :username",
+                                    {"username": username}).fetchone()
+        if user is None:
+            return None
 
-    def get_users_name_by_login(self, username, password):
-        """Obtains the user's name as a string based on their login credentials"""
+        if user.password.startswith("pbkdf2:"):
+            if not check_password_hash(user.password, password):
+                return None
+            needs_rehash = user.password.split("$", 1)[0] != PASSWORD_HASH_METHOD
+        else:
+            # accounts registered before passwords were hashed
+            if not hmac.compare_digest(user.password.encode(), password.encode()):
+                return None
+            needs_rehash = True
 
-        return self.session.execute("SELECT first_name FROM users WHERE username = :username AND password = :password",
-                                    {"username": username, "password": password}).fetchone()['first_name']
+        if needs_rehash:
+            self.session.execute("UPDATE users SET password = :password WHERE id = :db_id",
+                                 {"password": hash_password(password), "db_id": user.id})
+            self.session.commit()
 
-    def get_user_id_by_login(self, username, password):
-        """Obtains the user's name as a string based on their login credentials"""
+        return UserObject(db_id=user.id, first_name=user.first_name)
 
-        return self.session.execute("SELECT id FROM users WHERE username = :username AND password = :password",
-                                    {"username": username, "password": password}).fetchone()['id']
+    def hash_plaintext_passwords(self):
+        """
+        Replaces every password still stored in plain text by its hash, so accounts that don't log in again are
+        protected too.
+        :return: number of passwords hashed
+        """
+
+        users = self.session.execute("SELECT id, password FROM users WHERE password NOT LIKE 'pbkdf2:%';").fetchall()
+        for user in users:
+            self.session.execute("UPDATE users SET password = :password WHERE id = :db_id",
+                                 {"password": hash_password(user.password), "db_id": user.id})
+        self.session.commit()
+
+        print(f"Hashed {len(users)} plain text passwords")
+        return len(users)
 
     def get_username_by_id(self, user_db_id):
         """Obtains the user's name as a string based on their database id."""
@@ -184,9 +695,9 @@ class BookDatabase:
                                     {"db_id": user_db_id}).fetchone()['username']
 
     def get_book_db_id_by_isbn(self, isbn):
-        """Obtains the book's database id by search on isbn number."""
+        """Obtains the book's database id by search on isbn number, or None if no book has this isbn."""
 
-        return self.session.execute("SELECT id FROM books WHERE isbn = :ibsn", {"ibsn": isbn}).fetchone()['id']
+        return self.session.execute("SELECT id FROM books WHERE isbn = :ibsn", {"ibsn": isbn}).scalar()
 
     def add_new_user(self, first_name, last_name, username, password):
         """
@@ -194,7 +705,7 @@ class BookDatabase:
         :param first_name: first name of new user
         :param last_name: last name of new user
         :param username: submitted username
-        :param password: submitted password
+        :param password: submitted password, which is stored hashed
         :return: None
         """
 
@@ -202,38 +713,90 @@ class BookDatabase:
             self.session.execute(
                 "INSERT INTO users (first_name, last_name, username, password) "
                 "VALUES (:first_name, :last_name, :username, :password)",
-                {"first_name": first_name, "last_name": last_name, "username": username, "password": password, }
+                {"first_name": first_name, "last_name": last_name, "username": username,
+                 "password": hash_password(password), }
             )
             self.session.commit()
         except Exception as e:
             print(f"Could not add new user to the database due to: {e}")
 
-    def search_by_any(self, item):
+    def search_by_any(self, item, limit=SEARCH_PAGE_SIZE, offset=0):
         """
-        Searches the book database to locate any 'matching' items based on LIKE queries for title, isbn and author
-        and returns a list of book objects. Note that date is unsupported
+        Searches the book database to locate any 'matching' items for title, isbn and author (case-insensitive)
+        and returns a list of book objects. Note that date is unsupported. Matching and ranking are done by the
+        configured search backend (see get_search_backend).
         :param item: any item submitted by user
-        :return: list of book tuple Objects that match the search item
+        :param limit: maximum number of books to return (one page of results)
+        :param offset: number of matching books to skip, for fetching later pages
+        :return: list of book tuple Objects that match the search item, most relevant first
         """
 
-        query_item = '%' + str(item) + '%'
-        query = "SELECT * FROM books WHERE ((isbn LIKE :isbn) OR (title LIKE :title) OR (author LIKE :author));"
-        book_tuples = self.session.execute(query, {"isbn": query_item, "title": query_item, "author": query_item}).fetchall()
-
-        list_books = list()
-        for book in book_tuples:
-            book_object = BookObject(
-                db_id=book.id,
-                isbn=book.isbn,
-                title=book.title,
-                author=book.author,
-                year=book.year,
-                star_rating=self.get_average_rating(book.isbn),
-                review_count=self.get_review_count(book.isbn)
-            )
-            list_books.append(book_object)
+        return self.get_search_backend().search(self, item, limit, offset)
 
-        return list_books
+    def record_search_queries(self, query_counts):
+        """
+        Adds to the number of times search queries were run, in a single (executemany) statement.
+        :param query_counts: dictionary of normalized search query to the number of new searches
+        """
+
+        if not query_counts:
+            return
+
+        now = datetime.now()
+        self.session.execute(
+            "INSERT INTO search_query_stats (query, search_count, last_searched_at) VALUES (:query, :count, :now) "
+            "ON CONFLICT (query) DO UPDATE SET search_count = search_query_stats.search_count + "
+            "excluded.search_count, last_searched_at = excluded.last_searched_at;",
+            [{"query": query, "count": count, "now": now} for query, count in query_counts.items()]
+        )
+        self.session.commit()
+
+    def get_popular_search_queries(self, limit):
+        """Returns the limit most often run search queries, most popular first."""
+
+        return [row.query for row in self.session.execute(
+            "SELECT query FROM search_query_stats ORDER BY search_count DESC, query LIMIT :limit;", {"limit": limit}
+        ).fetchall()]
+
+    def find_books(self, condition, params, order_by, limit, offset):
+        """
+        Returns a page of books matching an SQL condition on the books table (aliased 'b'), together with their
+        ratings and review counts, in a single query.
+        :param condition: SQL boolean expression used as the WHERE clause
+        :param params: bind parameters used by the condition and order_by
+        :param order_by: SQL ORDER BY expression
+        :param limit: maximum number of books to return
+        :param offset: number of matching books to skip
+        :return: list of book tuple Objects
+        """
+
+        query = BOOK_AGGREGATE_QUERY + \
+            f"WHERE {condition} ORDER BY {order_by} LIMIT :limit OFFSET :offset;"
+        book_tuples = self.session.execute(query, dict(params, limit=limit, offset=offset)).fetchall()
+
+        return [self._book_object_from_row(book) for book in book_tuples]
+
+    def get_books_by_isbns(self, isbns):
+        """
+        Looks up several books by isbn in a single query.
+        :param isbns: list of isbn numbers
+        :return: list of book tuple Objects in the same order as the isbns; unknown isbns are left out
+        """
+
+        if not isbns:
+            return []
+
+        if self.catalog is not None:
+            snapshot = self.catalog.get_snapshot()
+            found_books = [snapshot.get(isbn) for isbn in isbns if isbn in snapshot]
+            stats = self.get_book_stats([details["db_id"] for details in found_books])
+            return [self._book_object_from_details(details, stats) for details in found_books]
+
+        query = BOOK_AGGREGATE_QUERY + f"WHERE {self._list_condition('b.isbn', 'isbns')};"
+        books = {book.isbn: self._book_object_from_row(book)
+                 for book in self._execute_list_query(query, "isbns", {"isbns": list(isbns)}).fetchall()}
+
+        return [books[isbn] for isbn in isbns if isbn in books]
 
     def search_by_isbn(self, isbn):
         """
@@ -243,95 +806,295 @@ class BookDatabase:
         :return: list of book tuple Objects that match the search item
         """
 
-        query = "SELECT * FROM books WHERE isbn = :isbn;"
-        book_tuples = self.session.execute(query, {"isbn": isbn}).fetchall()
+        if self.catalog is not None:
+            details = self.catalog.get_snapshot().get(isbn)
+            if details is None:
+                return None
+            return self._book_object_from_details(details, self.get_book_stats([details["db_id"]]))
+
+        query = BOOK_AGGREGATE_QUERY + "WHERE b.isbn = :isbn;"
+        book_tuple = self.session.execute(query, {"isbn": isbn}).fetchone()
+
+        if book_tuple is None:
+            return None
+
+        return self._book_object_from_row(book_tuple)
+
+    def get_book_stats(self, book_db_ids):
+        """
+        Reads the rating aggregates of several books from 'book_stats' in a single query.
+        :param book_db_ids: list of book database ids
+        :return: dictionary of book id to (average rating, review count); books without reviews are left out
+        """
+
+        if not book_db_ids:
+            return dict()
+
+        query = "SELECT book_id, rating_sum / NULLIF(rating_count, 0) AS star_rating, rating_count " \
+                f"FROM book_stats WHERE {self._list_condition('book_id', 'book_ids')};"
+        rows = self._execute_list_query(query, "book_ids", {"book_ids": list(book_db_ids)}).fetchall()
+
+        return {row.book_id: (row.star_rating or 0, row.rating_count) for row in rows}
+
+    def get_catalog_version(self):
+        """Returns the version of the books catalog, which changes every time books are imported."""
+
+        return self.session.execute("SELECT version FROM catalog_version WHERE id = 1;").fetchone()['version']
+
+    def _list_condition(self, column, parameter):
+        """
+        SQL condition matching a column against a list bind parameter (see _execute_list_query). On Postgres the
+        list is passed as one array parameter, so the statement is the same for any number of values.
+        """
+
+        if self.engine.dialect.name == "postgresql":
+            return f"{column} = ANY(:{parameter})"
+        return f"{column} IN :{parameter}"
+
+    def _execute_list_query(self, query, parameter, params):
+        """Executes a query using a _list_condition; other databases than Postgres get one parameter per value."""
+
+        if self.engine.dialect.name != "postgresql":
+            query = text(query).bindparams(bindparam(parameter, expanding=True))
+        return self.session.execute(query, params)
+
+    def iter_catalog(self, since=None, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Iterates over every book, with its ratings and review count, in database id order. Rows are streamed from
+        a server-side cursor in batches, so memory use doesn't grow with the size of the catalog.
+        :param since: if given (a date or datetime), only books with reviews written on or after that day are
+        included; a datetime is truncated to its date, as date_created is a DATE column
+        :param batch_size: number of rows fetched from the cursor at a time
+        :return: generator of book tuple Objects
+        """
+
+        if isinstance(since, datetime):
+            since = since.date()
+
+        query = BOOK_AGGREGATE_QUERY
+        if since is not None:
+            query += "WHERE b.id IN (SELECT book_id FROM book_reviews WHERE date_created >= :since) "
+        query += "ORDER BY b.id;"
+
+        result = self.session.execute(text(query).execution_options(stream_results=True), {"since": since})
+        try:
+            while True:
+                book_tuples = result.fetchmany(batch_size)
+                if not book_tuples:
+                    break
+                for book in book_tuples:
+                    yield self._book_object_from_row(book)
+        finally:
+            result.close()
+
+    def get_book_details(self, isbn):
+        """
+        Looks up only the books table columns of a book (no rating aggregates), for lightweight lookups.
+        :param isbn: isbn of the book
+        :return: dictionary of the book's db_id, isbn, title, author and year; None if the isbn is unknown
+        """
+
+        if self.catalog is not None:
+            return self.catalog.get_snapshot().get(isbn)
 
-        if not book_tuples:
+        book = self.session.execute("SELECT id, isbn, title, author, year FROM books WHERE isbn = :isbn;",
+                                    {"isbn": isbn}).fetchone()
+        if book is None:
             return None
 
-        # assume one result (1 element in list of tuples)
-
-        book_tuple = book_tuples[0]
-        book = BookObject(
-            db_id=book_tuple[0],
-            isbn=book_tuple[1],
-            title=book_tuple[2],
-            author=book_tuple[3],
-            year=book_tuple[4],
-            star_rating=self.get_average_rating(isbn),
-            review_count=self.get_review_count(isbn)
+        return {"db_id": book.id, "isbn": book.isbn, "title": book.title, "author": book.author, "year": book.year}
+
+    @staticmethod
+    def _book_object_from_details(details, stats):
+        """Builds a BookObject from a book's details (see get_book_details) and get_book_stats results."""
+
+        star_rating, review_count = stats.get(details["db_id"], (0, 0))
+        return BookObject(**details, star_rating=star_rating, review_count=review_count)
+
+    @staticmethod
+    def _book_object_from_row(book):
+        """Builds a BookObject from a row returned by a query starting with BOOK_AGGREGATE_QUERY."""
+
+        return BookObject(
+            db_id=book.id,
+            isbn=book.isbn,
+            title=book.title,
+            author=book.author,
+            year=book.year,
+            star_rating=book.star_rating,
+            review_count=book.review_count
         )
-        return book
 
     def get_average_rating(self, isbn):
         """ Gets the average rating of the book based on existing reviews in the book database based on isbn
         number; 0 if no ratings yet; otherwise the average."""
 
-        book_id = self.get_book_db_id_by_isbn(isbn)
-        query = "SELECT AVG(rating) as average_rating FROM book_reviews WHERE book_id = :book_id"
-        average_rating = self.session.execute(query, {"book_id": book_id}).fetchone()['average_rating']
+        query = "SELECT s.rating_sum / NULLIF(s.rating_count, 0) AS average_rating " \
+                "FROM books b JOIN book_stats s ON s.book_id = b.id WHERE b.isbn = :isbn"
+        average_rating = self.session.execute(query, {"isbn": isbn}).fetchone()
 
-        if average_rating is None:
+        if average_rating is None or average_rating['average_rating'] is None:
             return 0
         else:
-            return average_rating
+            return average_rating['average_rating']
 
     def get_review_count(self, isbn):
         """Returns the number of reviews for the book currently in the database."""
 
-        book_id = self.get_book_db_id_by_isbn(isbn)
-        query = "SELECT COUNT(*) as count_reviews FROM book_reviews WHERE book_id = :book_id"
-        return self.session.execute(query, {"book_id": book_id}).fetchone()['count_reviews']
+        query = "SELECT s.rating_count FROM books b JOIN book_stats s ON s.book_id = b.id WHERE b.isbn = :isbn"
+        review_count = self.session.execute(query, {"isbn": isbn}).fetchone()
+        return 0 if review_count is None else review_count['rating_count']
 
-    def get_book_reviews(self, book_db_id):
+    def get_book_reviews(self, book_db_id, limit=REVIEW_PAGE_SIZE, before_id=None):
         """
-        Retrieves all book reviews based on the books database id.
+        Retrieves a page of book reviews based on the books database id, newest first, together with the
+        reviewers' usernames in a single query.
         :param db_book_id:  unique identifier (id) for the book in the database (id from 'books' table)
+        :param limit: maximum number of reviews to return
+        :param before_id: only return reviews older than the review with this id (the last review of the
+        previous page), or the newest reviews if None
         :return: list of Review objects
         """
 
-        query = "SELECT * FROM book_reviews WHERE book_id = :book_id;"
-        review_tuples = self.session.execute(query, {"book_id": book_db_id}).fetchall()
+        query = "SELECT r.id, r.book_id, u.username, r.date_created, r.rating, r.review " \
+                "FROM book_reviews r JOIN users u ON u.id = r.user_id WHERE r.book_id = :book_id "
+        if before_id is not None:
+            query += "AND r.id < :before_id "
+        query += "ORDER BY r.id DESC LIMIT :limit;"
 
-        if not review_tuples:
-            return None
+        review_tuples = self.session.execute(
+            query, {"book_id": book_db_id, "before_id": before_id, "limit": limit}
+        ).fetchall()
 
-        list_reviews = list()
-        for review in review_tuples:
-            review_object = ReviewObject(
-                db_id=review[0],
-                book_id=review[1],
-                username=self.get_username_by_id(review[2]),
-                date_created=review[3],
-                rating=int(review[4]),
-                review=review[5]
+        return [
+            ReviewObject(
+                db_id=review.id,
+                book_id=review.book_id,
+                username=review.username,
+                date_created=review.date_created,
+                rating=int(review.rating),
+                review=review.review
             )
-            list_reviews.append(review_object)
+            for review in review_tuples
+        ]
+
+    def get_rating_histogram(self, book_db_id):
+        """
+        Summarizes the ratings of a book.
+        :param book_db_id: unique identifier (id) for the book in the database (id from 'books' table)
+        :return: dictionary of star rating (1 to 5) to the number of reviews with that rating
+        """
 
-        return list_reviews
+        query = "SELECT rating_1, rating_2, rating_3, rating_4, rating_5 FROM book_stats WHERE book_id = :book_id;"
+        stats = self.session.execute(query, {"book_id": book_db_id}).fetchone()
+
+        return {stars: stats[f"rating_{stars}"] if stats else 0 for stars in range(1, 6)}
+
+    def get_book_recommendations(self, book_db_id, limit=RECOMMENDATIONS_PAGE_SIZE):
+        """
+        Looks up the books most liked by the readers who liked a book, as precomputed by recommendations.py.
+        :param book_db_id: unique identifier (id) for the book in the database (id from 'books' table)
+        :param limit: maximum number of recommendations
+        :return: list of recommendation tuple Objects, most similar book first
+        """
+
+        query = "SELECT b.isbn, b.title, b.author, r.score FROM book_recommendations r " \
+                "JOIN books b ON b.id = r.recommended_book_id " \
+                "WHERE r.book_id = :book_id AND r.rank <= :limit ORDER BY r.rank;"
+        recommendations = self.session.execute(query, {"book_id": book_db_id, "limit": limit}).fetchall()
+
+        return [RecommendationObject(isbn=book.isbn, title=book.title, author=book.author, score=book.score)
+                for book in recommendations]
 
     def add_user_review(self, user_db_id, book_db_id, rating, review):
         """
-        Adds new user review to the database.
+        Adds new user review to the database and updates the book's rating aggregates in 'book_stats', in the
+        same transaction.
         :param user_db_id: database user id
         :param book_db_id: database book id
-        :param rating: user provided rating
+        :param rating: user provided rating, from 1 to 5 stars
         :param review: user provided review
+        :return: True if the review was added, False if the user already reviewed this book
         """
 
+        rating = parse_rating(rating)
+
         insert_statement = "INSERT INTO book_reviews (book_id, user_id, date_created, rating, review) " \
                            "VALUES (:book_id, :user_id, :date_created, :rating, :review)"
+        try:
+            self.session.execute(
+                insert_statement, {
+                    "book_id": book_db_id,
+                    "user_id": user_db_id,
+                    "date_created": datetime.now(),
+                    "rating": rating,
+                    "review": review
+                }
+            )
+        except IntegrityError as e:
+            # e.g. a second submission of the same review racing the first one
+            print(f"Could not add review of book {book_db_id} by user {user_db_id} due to: {e.orig}")
+            self.session.rollback()
+            return False
+
+        self.session.execute(
+            f"INSERT INTO book_stats (book_id, rating_sum, rating_count, rating_{rating}) "
+            f"VALUES (:book_id, :rating, 1, 1) "
+            f"ON CONFLICT (book_id) DO UPDATE SET rating_sum = book_stats.rating_sum + excluded.rating_sum, "
+            f"rating_count = book_stats.rating_count + 1, rating_{rating} = book_stats.rating_{rating} + 1",
+            {"book_id": book_db_id, "rating": rating}
+        )
+        self.session.commit()
+        self._notify_review_listeners(book_db_id)
+        return True
+
+    def add_user_reviews(self, reviews):
+        """
+        Adds many reviews at once with a multi-row (executemany) INSERT, and recomputes the rating aggregates of the
+        reviewed books in 'book_stats', in the same transaction. Reviews of a book by a user who already reviewed
+        it are skipped, so adding the same reviews twice is harmless.
+        :param reviews: list of dictionaries of the reviews' book_id, user_id, date_created, rating and review
+        :return: list of the database ids of the reviewed books
+        """
+
+        if not reviews:
+            return []
+
+        reviews = [dict(review, rating=parse_rating(review["rating"])) for review in reviews]
         self.session.execute(
-            insert_statement, {
-                "book_id": book_db_id,
-                "user_id": user_db_id,
-                "date_created": datetime.now(),
-                "rating": int(rating),
-                "review": review
-            }
+            "INSERT INTO book_reviews (book_id, user_id, date_created, rating, review) "
+            "VALUES (:book_id, :user_id, :date_created, :rating, :review) "
+            "ON CONFLICT (book_id, user_id) DO NOTHING;",
+            reviews
+        )
+
+        book_ids = sorted({review["book_id"] for review in reviews})
+        self._execute_list_query(f"DELETE FROM book_stats WHERE {self._list_condition('book_id', 'book_ids')};",
+                                 "book_ids", {"book_ids": book_ids})
+        self._execute_list_query(
+            "INSERT INTO book_stats (book_id, rating_sum, rating_count, rating_1, rating_2, rating_3, rating_4, "
+            f"rating_5) SELECT r.* FROM ({REVIEW_STATS_QUERY}) r "
+            f"WHERE {self._list_condition('r.book_id', 'book_ids')};",
+            "book_ids", {"book_ids": book_ids}
         )
         self.session.commit()
 
+        for book_db_id in book_ids:
+            self._notify_review_listeners(book_db_id)
+        return book_ids
+
+    def add_review_listener(self, listener):
+        """
+        Registers a function to call with a book's database id whenever a review of the book is added, e.g. to
+        invalidate cached information about the book.
+        """
+
+        self.review_listeners.append(listener)
+
+    def _notify_review_listeners(self, book_db_id):
+        for listener in self.review_listeners:
+            listener(book_db_id)
+
     def user_already_submitted_review(self, book_db_id, user_db_id):
         """
         Returns True if a user has already submitted an id for a book.
@@ -339,12 +1102,84 @@ class BookDatabase:
         :param user_db_id
         :return: boolean representing if review has already been submitted
         """
-        query = "SELECT * FROM book_reviews WHERE book_id = :book_id AND user_id = :user_id;"
-        if self.session.execute(query, {"book_id": book_db_id, "user_id":user_db_id}).fetchall():
+        query = "SELECT 1 FROM book_reviews WHERE book_id = :book_id AND user_id = :user_id LIMIT 1;"
+        if self.session.execute(query, {"book_id": book_db_id, "user_id":user_db_id}).fetchone():
             return True
         else:
             return False
 
+    def save_books(self, user_db_id, isbns):
+        """
+        Adds books to a user's reading list in a single statement; books already in the list keep their date.
+        :param user_db_id: database user id
+        :param isbns: list of isbns of the books to save; unknown isbns are ignored
+        :return: number of books added to the list
+        """
+
+        if not isbns:
+            return 0
+
+        saved = self._execute_list_query(
+            "INSERT INTO saved_books (user_id, book_id, saved_at) "
+            "SELECT :user_id, b.id, :saved_at FROM books b "
+            f"WHERE {self._list_condition('b.isbn', 'isbns')} "
+            "ON CONFLICT (user_id, book_id) DO NOTHING;",
+            "isbns", {"user_id": user_db_id, "saved_at": datetime.now(), "isbns": list(isbns)}
+        ).rowcount
+        self.session.commit()
+        return saved
+
+    def remove_saved_books(self, user_db_id, isbns):
+        """
+        Removes books from a user's reading list in a single statement.
+        :param user_db_id: database user id
+        :param isbns: list of isbns of the books to remove
+        :return: number of books removed from the list
+        """
+
+        if not isbns:
+            return 0
+
+        removed = self._execute_list_query(
+            "DELETE FROM saved_books WHERE user_id = :user_id "
+            f"AND book_id IN (SELECT b.id FROM books b WHERE {self._list_condition('b.isbn', 'isbns')});",
+            "isbns", {"user_id": user_db_id, "isbns": list(isbns)}
+        ).rowcount
+        self.session.commit()
+        return removed
+
+    def get_saved_books(self, user_db_id, limit=SAVED_BOOKS_PAGE_SIZE, offset=0):
+        """
+        Returns a page of a user's reading list, most recently saved first, with the ratings and review counts of
+        the books, in a single query.
+        :param user_db_id: database user id
+        :param limit: maximum number of books to return
+        :param offset: number of saved books to skip, for fetching later pages
+        :return: list of book tuple Objects
+        """
+
+        query = BOOK_AGGREGATE_QUERY + \
+            "JOIN saved_books sb ON sb.book_id = b.id WHERE sb.user_id = :user_id " \
+            "ORDER BY sb.saved_at DESC, sb.book_id DESC LIMIT :limit OFFSET :offset;"
+        books = self.session.execute(query, {"user_id": user_db_id, "limit": limit, "offset": offset}).fetchall()
+
+        return [self._book_object_from_row(book) for book in books]
+
+    def book_is_saved(self, book_db_id, user_db_id):
+        """Returns True if a book is in a user's reading list."""
+
+        query = "SELECT 1 FROM saved_books WHERE user_id = :user_id AND book_id = :book_id;"
+        return self.session.execute(query, {"user_id": user_db_id, "book_id": book_db_id}).fetchone() is not None
+
+    def remove_session(self):
+        """
+        Ends the current thread's session, rolling back anything uncommitted and returning its connection to the
+        pool. Called at the end of every web request.
+        """
+        if self._session is not None:
+            self._session.remove()
+
     def close_session(self):
         """Officially ends the session with the database."""
-        self.session.close()
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,232 @@
+"""
+The "TTLCache" class is a small, thread-safe, in-process cache used to avoid repeating expensive work, such as
+calls to the Goodreads API. Entries are evicted least-recently-used first once the cache is full, and expire after
+a time-to-live; optionally, the cache is also bounded by the total weight of its values (e.g. their size in
+bytes). Expired entries can still be served for a while ("stale") while they are being refreshed, and hit,
+miss and eviction counters are kept to see how well the cache works.
+
+Optionally, entries can be persisted to a local SQLite file with "SQLiteCacheStore", so that they survive restarts.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+CacheEntry = namedtuple('CacheEntry', 'value expires_at stale_until')
+
+
+class TTLCache:
+
+    def __init__(self, max_size=1024, ttl=3600, stale_ttl=0, store=None, max_weight=None, weigh=None):
+        """
+        :param max_size: maximum number of entries kept in memory
+        :param ttl: seconds an entry is fresh for, by default
+        :param stale_ttl: seconds an expired entry may still be served (as stale) while it is refreshed
+        :param store: optional persistent store (see SQLiteCacheStore) backing the in-memory entries
+        :param max_weight: optional maximum total weight of the values kept in memory
+        :param weigh: function returning the weight of a value (e.g. sys.getsizeof), required with max_weight
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """
+        Looks up a key in the cache.
+        :param key: cache key
+        :return: tuple (found, value, is_stale); found is False if the key is missing or too old to be served
+        """
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.store is not None:
+                entry = self.store.get(key)
+                if entry is not None:
+                    self._remember(key, entry)
+
+            if entry is None or entry.stale_until <= now:
+                self.misses += 1
+                return False, None, False
+
+            self.entries.move_to_end(key)
+            if entry.expires_at <= now:
+                self.stale_hits += 1
+                return True, entry.value, True
+
+            self.hits += 1
+            return True, entry.value, False
+
+    def get(self, key, default=None):
+        """Returns the cached value for a key if it is still fresh, otherwise the default."""
+
+        found, value, is_stale = self.lookup(key)
+        if not found or is_stale:
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value in the cache.
+        :param key: cache key
+        :param value: value to store (must be json serializable when a persistent store is used)
+        :param ttl: seconds the value is fresh for, if different from the cache's default
+        """
+
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        entry = CacheEntry(value=value, expires_at=expires_at, stale_until=expires_at + self.stale_ttl)
+        with self.lock:
+            self._remember(key, entry)
+            if self.store is not None:
+                self.store.set(key, entry)
+
+    def delete(self, key):
+        """Removes a key from the cache, if present."""
+
+        with self.lock:
+            self._forget(self.entries.pop(key, None))
+            if self.store is not None:
+                self.store.delete(key)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+            if self.store is not None:
+                self.store.clear()
+
+    def stats(self):
+        """Returns the cache's counters, e.g. for monitoring its hit rate."""
+
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            stats = {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+            if self.weigh is not None:
+                stats.update(weight=self.weight, max_weight=self.max_weight)
+            return stats
+
+    def _remember(self, key, entry):
+        """Adds an entry in memory, evicting the least recently used entries if the cache is full."""
+
+        self._forget(self.entries.get(key))
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if self.weigh is not None:
+            self.weight += self.weigh(entry.value)
+        while len(self.entries) > self.max_size or \
+                (self.max_weight is not None and self.weight > self.max_weight and self.entries):
+            self._forget(self.entries.popitem(last=False)[1])
+            self.evictions += 1
+
+    def _forget(self, entry):
+        """Subtracts the weight of an entry removed from memory (None if there was no entry)."""
+
+        if entry is not None and self.weigh is not None:
+            self.weight -= self.weigh(entry.value)
+
+
+class SQLiteCacheStore:
+    """
+    Persists cache entries as json in a local SQLite file. Entries that can't be served anymore, even as stale, are
+    deleted when the file is opened and then by the first write every prune_interval seconds.
+    """
+
+    def __init__(self, path, prune_interval=600):
+        """
+        :param path: path of the SQLite file
+        :param prune_interval: seconds between two deletions of the entries past their stale time
+        """
+
+        self.path = path
+        self.prune_interval = prune_interval
+        self.pruned_at = time.monotonic()
+        self.pid = None
+        self._connection = None
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """
+        Connection to the cache file, opened on first use in every process (not at import, and not shared with
+        the workers forked from it).
+        """
+
+        if self.pid != os.getpid():
+            # the lock may have been held by another thread when the process was forked
+            self.lock = threading.Lock()
+            self._connection = self._connect()
+            self.pid = os.getpid()
+        return self._connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, stale_until REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_entries_stale_until_idx ON cache_entries (stale_until)")
+        self._prune(connection)
+        connection.commit()
+        return connection
+
+    def _prune(self, connection):
+        """Deletes the entries past their stale time (committed by the caller)."""
+
+        connection.execute("DELETE FROM cache_entries WHERE stale_until <= ?", (time.time(),))
+        self.pruned_at = time.monotonic()
+
+    def get(self, key):
+        connection = self.connection
+        with self.lock:
+            row = connection.execute(
+                "SELECT value, expires_at, stale_until FROM cache_entries WHERE key = ?", (str(key),)
+            ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(value=json.loads(row[0]), expires_at=row[1], stale_until=row[2])
+
+    def set(self, key, entry):
+        connection = self.connection
+        with self.lock:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, stale_until) VALUES (?, ?, ?, ?)",
+                (str(key), json.dumps(entry.value), entry.expires_at, entry.stale_until)
+            )
+            if time.monotonic() - self.pruned_at >= self.prune_interval:
+                self._prune(connection)
+            connection.commit()
+
+    def delete(self, key):
+        connection = self.connection
+        with self.lock:
+            connection.execute("DELETE FROM cache_entries WHERE key = ?", (str(key),))
+            connection.commit()
+
+    def clear(self):
+        connection = self.connection
+        with self.lock:
+            connection.execute("DELETE FROM cache_entries")
+            connection.commit()
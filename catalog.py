@@ -0,0 +1,110 @@
+"""
+The "CatalogSnapshot" class is a compact, read-only, in-process copy of the books table, so that the static details of
+a book (id, isbn, title, author, year) can be looked up without querying the database. Instead of one object per
+book, the columns are kept in arrays: ids and years in typed arrays, all titles in one string sliced by offsets, and
+authors (often repeated) as codes into a list of distinct names. An index maps each isbn to its position.
+
+The books table rarely changes after import.py has run. Every import bumps the catalog version stored in the
+database, and the "Catalog" class reloads its snapshot when it sees a new version.
+"""
+import sys
+import threading
+import time
+from array import array
+
+
+class CatalogSnapshot:
+
+    def __init__(self, books, version=0):
+        """
+        :param books: iterable of (id, isbn, title, author, year) tuples
+        :param version: catalog version the books were loaded at
+        """
+
+        self.version = version
+        self.ids = array('q')
+        self.years = array('h')
+        self.title_offsets = array('I', [0])
+        self.author_codes = array('I')
+        self.authors = list()
+        self.index = dict()
+
+        author_codes = dict()
+        titles = list()
+        title_length = 0
+        for book_id, isbn, title, author, year in books:
+            self.index[isbn] = len(self.ids)
+            self.ids.append(book_id)
+            self.years.append(year)
+            titles.append(title)
+            title_length += len(title)
+            self.title_offsets.append(title_length)
+            if author not in author_codes:
+                author_codes[author] = len(self.authors)
+                self.authors.append(sys.intern(author))
+            self.author_codes.append(author_codes[author])
+
+        self.titles = "".join(titles)
+
+    @classmethod
+    def from_database(cls, db):
+        """Loads a snapshot of the whole books table."""
+
+        version = db.get_catalog_version()
+        books = db.session.execute("SELECT id, isbn, title, author, year FROM books ORDER BY id;")
+        return cls(((book.id, book.isbn, book.title, book.author, book.year) for book in books), version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, isbn):
+        return isbn in self.index
+
+    def get(self, isbn):
+        """
+        Looks up a book by isbn.
+        :param isbn: isbn of the book
+        :return: dictionary of the book's db_id, isbn, title, author and year; None if the isbn is unknown
+        """
+
+        position = self.index.get(isbn)
+        if position is None:
+            return None
+
+        return {
+            "db_id": self.ids[position],
+            "isbn": isbn,
+            "title": self.titles[self.title_offsets[position]:self.title_offsets[position + 1]],
+            "author": self.authors[self.author_codes[position]],
+            "year": self.years[position],
+        }
+
+
+class Catalog:
+    """
+    Holds the current snapshot of the catalog, taken on first use, and replaces it when the catalog is re-imported.
+    The catalog version is checked at most once every refresh_interval seconds.
+    """
+
+    def __init__(self, db, refresh_interval=60):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.checked_at = 0
+
+    def get_snapshot(self):
+        """Returns the current snapshot, (re)loading it first if it is missing or the catalog has changed."""
+
+        if self.snapshot is None or time.monotonic() - self.checked_at >= self.refresh_interval:
+            self.refresh()
+        return self.snapshot
+
+    def refresh(self, force=False):
+        """Reloads the snapshot if the catalog version changed (or always, if force is True)."""
+
+        with self.lock:
+            self.checked_at = time.monotonic()
+            if force or self.snapshot is None or self.db.get_catalog_version() != self.snapshot.version:
+                print("Reloading catalog snapshot")
+                self.snapshot = CatalogSnapshot.from_database(self.db)
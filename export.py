@@ -0,0 +1,91 @@
+"""
+Exports the book catalog, with each book's average rating and review count, as newline-delimited json or csv.
+Books are streamed from the database, so exports of any size use constant memory. An incremental export only
+includes the books reviewed since a given date.
+
+    $ python export.py --format csv --since 2019-06-01 --output reviewed_books.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date
+from book_database import BookDatabase, EXPORT_BATCH_SIZE
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ("isbn", "title", "author", "year", "average_rating", "review_count")
+
+
+def book_record(book):
+    """Returns the exported fields of a book as a dictionary."""
+
+    return {
+        "isbn": book.isbn,
+        "title": book.title,
+        "author": book.author,
+        "year": book.year,
+        "average_rating": book.star_rating,
+        "review_count": book.review_count
+    }
+
+
+def parse_since(since):
+    """
+    Parses the date an incremental export starts from, in ISO format (e.g. 2019-06-01). Reviews are dated by day
+    (book_reviews.date_created is a DATE), so a time of day is rejected rather than silently ignored.
+    """
+
+    return date.fromisoformat(since) if since else None
+
+
+def export_catalog(db, export_format="ndjson", since=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Generates the lines of a catalog export.
+    :param db: BookDatabase with an initiated session
+    :param export_format: "ndjson" or "csv"
+    :param since: if given, only books with reviews written on or after this date are exported
+    :param batch_size: number of books fetched from the database at a time
+    :return: generator of strings, each ending with a newline
+    """
+
+    books = db.iter_catalog(since=since, batch_size=batch_size)
+
+    if export_format == "ndjson":
+        for book in books:
+            yield json.dumps(book_record(book)) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for book in books:
+        writer.writerow(book_record(book))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the Reader's Forest book catalog with ratings")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson", help="export format")
+    parser.add_argument("--since", type=parse_since,
+                        help="only export books reviewed on or after this date (e.g. 2019-06-01)")
+    parser.add_argument("--output", help="file to write the export to (default: standard output)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE,
+                        help="number of books fetched from the database at a time")
+    args = parser.parse_args()
+
+    db = BookDatabase()
+    db.initiate_session()
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for line in export_catalog(db, args.format, args.since, args.batch_size):
+            output.write(line)
+    finally:
+        if args.output:
+            output.close()
+        db.close_session()
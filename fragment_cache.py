@@ -0,0 +1,44 @@
+"""
+The "FragmentCache" class keeps rendered HTML fragments of pages, such as the details and the reviews of a book
+page or a page of search results, so that requests showing the same fragment again neither render it nor run the
+queries behind it.
+
+A fragment is never invalidated explicitly: its key includes the version of everything it shows. For books, the
+version is the book's review count from 'book_stats', which BookDatabase.add_user_review (and add_user_reviews)
+increments in the same transaction as the review itself; a new review therefore changes the keys of exactly the
+fragments showing that book, in every process, and the old fragments are evicted as the least recently used.
+"""
+import sys
+from flask import Markup
+from cache import TTLCache
+
+
+class FragmentCache:
+
+    def __init__(self, max_size=10000, max_bytes=32 * 2 ** 20, ttl=300):
+        """
+        :param max_size: maximum number of fragments kept
+        :param max_bytes: maximum total size of the fragments kept, in bytes
+        :param ttl: seconds a fragment is served for, at most (e.g. for books re-imported with new details)
+        """
+
+        self.fragments = TTLCache(max_size=max_size, ttl=ttl, max_weight=max_bytes, weigh=sys.getsizeof)
+
+    def render(self, key, render):
+        """
+        Returns a fragment from the cache, or renders and caches it.
+        :param key: hashable key of the fragment, including the version of everything it shows
+        :param render: function returning the fragment's html, called when the fragment isn't cached
+        :return: the fragment's html, marked as safe to include in a template
+        """
+
+        html = self.fragments.get(key)
+        if html is None:
+            html = render()
+            self.fragments.set(key, html)
+        return Markup(html)
+
+    def cache_stats(self):
+        """Returns the hit/miss/eviction counters and the size in bytes of the cache."""
+
+        return self.fragments.stats()
@@ -3,51 +3,254 @@ The GoodreadsAPI class represents interactions this project can have with the Go
 """
 import requests
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import TTLCache, SQLiteCacheStore
+
+# Maximum number of isbns the Goodreads review_counts endpoint accepts per request
+GOODREADS_BATCH_SIZE = 1000
+
+
+class GoodreadsAPIError(Exception):
+    """Raised when Goodreads can't be reached, is too slow or answers with an error."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream service after too many consecutive failures. Once open, calls are refused for
+    reset_timeout seconds; the next call after that is a trial ("half open"), which closes the breaker again
+    if it succeeds or re-opens it if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half open"
+        return "open"
+
+    def allow_request(self):
+        """Returns True if a call to the upstream service may be attempted now."""
+
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half open" and not self.trial_in_progress:
+                self.trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_progress or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_progress = False
 
 
 class GoodreadsAPI:
 
-    def __init__(self):
+    def __init__(self, cache=None, executor=None):
+        """
+        :param cache: cache of the reviews; by default, configured by environment variables (see _create_cache)
+        :param executor: thread pool stale reviews are refreshed in; by default, one of GOODREADS_WORKERS threads
+        """
+
         self.base_url = "https://www.goodreads.com"
-        self.api_key = self._get_api_key()
+        self.api_key = os.getenv("GOODREADS_API_KEY")
         self.format = "json"
+        self.http = requests.Session()
+        self.timeout = float(os.getenv("GOODREADS_TIMEOUT", 2))
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("GOODREADS_FAILURE_THRESHOLD", 5)),
+            reset_timeout=int(os.getenv("GOODREADS_RESET_TIMEOUT", 30))
+        )
+        self.cache = cache if cache is not None else self._create_cache()
+        self.negative_ttl = int(os.getenv("GOODREADS_NEGATIVE_CACHE_TTL", 3600))
+        self.executor = executor if executor is not None else \
+            ThreadPoolExecutor(max_workers=int(os.getenv("GOODREADS_WORKERS", 8)))
+        self.refreshing = set()     # isbns being refreshed, so that each is refreshed once at a time
+        self.refreshing_lock = threading.Lock()
 
     def get_average_rating(self, isbn):
-        """Returns the average rating of the edition of the book (isbn)."""
+        """Returns the average rating of the edition of the book (isbn), or None if Goodreads doesn't know it."""
 
-        review = self._get_review_by_isbn(isbn)
-        return review['average_rating']
+        review = self.get_review(isbn)
+        return review['average_rating'] if review else None
 
     def get_number_ratings(self, isbn):
         """Returns the total number of ratings cast for a particular edition
-        of the book (isbn)."""
+        of the book (isbn), or None if Goodreads doesn't know it."""
 
-        review = self._get_review_by_isbn(isbn)
-        return review['ratings_count']
+        review = self.get_review(isbn)
+        return review['ratings_count'] if review else None
+
+    def get_review(self, isbn):
+        """
+        Returns the Goodreads review information for a book, from the cache when possible. A stale cached review
+        is returned immediately while it is refreshed in the background.
+        :param isbn: The known, single isbn number for a book edition
+        :return: json object, containing response details for that book; None if Goodreads doesn't know the isbn
+        """
+
+        found, review, is_stale = self.cache.lookup(isbn)
+        if not found:
+            return self._fetch_review(isbn)
+
+        if is_stale:
+            self._refresh_in_background(isbn)
+        return review
+
+    def get_reviews_for_isbns(self, isbns):
+        """
+        Returns the Goodreads review information for several books at once. Cached reviews are reused and the
+        remaining isbns are fetched with as few requests as possible (up to GOODREADS_BATCH_SIZE isbns each).
+        :param isbns: list of isbn numbers
+        :return: dictionary of isbn to review json object (None for isbns Goodreads doesn't know)
+        """
+
+        reviews = dict()
+        missing = list()
+        for isbn in dict.fromkeys(isbns):
+            found, review, is_stale = self.cache.lookup(isbn)
+            if not found:
+                missing.append(isbn)
+                continue
+            if is_stale:
+                self._refresh_in_background(isbn)
+            reviews[isbn] = review
+
+        for start in range(0, len(missing), GOODREADS_BATCH_SIZE):
+            chunk = missing[start:start + GOODREADS_BATCH_SIZE]
+            fetched = self._get_reviews_by_isbns(chunk)
+            for isbn in chunk:
+                review = fetched.get(isbn)
+                self.cache.set(isbn, review, ttl=self.negative_ttl if review is None else None)
+                reviews[isbn] = review
+
+        return reviews
+
+    def cache_stats(self):
+        """Returns the hit/miss/eviction counters of the review cache."""
+
+        return self.cache.stats()
 
     @staticmethod
-    def _get_api_key():
-        """Fetches the api key from environmental variables."""
+    def _create_cache():
+        """
+        Creates the review cache configured by environment variables: GOODREADS_CACHE_SIZE (entries),
+        GOODREADS_CACHE_TTL and GOODREADS_CACHE_STALE_TTL (seconds) and GOODREADS_CACHE_PATH, the path of a SQLite
+        file used to keep the cache across restarts (in memory only, if unset).
+        """
+
+        store = SQLiteCacheStore(os.getenv("GOODREADS_CACHE_PATH")) if os.getenv("GOODREADS_CACHE_PATH") else None
+        return TTLCache(
+            max_size=int(os.getenv("GOODREADS_CACHE_SIZE", 10000)),
+            ttl=int(os.getenv("GOODREADS_CACHE_TTL", 6 * 3600)),
+            stale_ttl=int(os.getenv("GOODREADS_CACHE_STALE_TTL", 24 * 3600)),
+            store=store
+        )
+
+    def _fetch_review(self, isbn):
+        """Fetches a review from Goodreads and caches it; unknown isbns are cached for a shorter time."""
+
+        review = self._get_review_by_isbn(isbn)
+        self.cache.set(isbn, review, ttl=self.negative_ttl if review is None else None)
+        return review
 
-        if not os.getenv("GOODREADS_API_KEY"):
-            raise RuntimeError("GOODREADS_API_KEY is not set")
+    def _refresh_in_background(self, isbn):
+        """Re-fetches a stale review in the thread pool, unless a refresh of the isbn is already in progress."""
 
-        return os.getenv("GOODREADS_API_KEY")
+        with self.refreshing_lock:
+            if isbn in self.refreshing:
+                return
+            self.refreshing.add(isbn)
+
+        def refresh():
+            try:
+                self._fetch_review(isbn)
+            except Exception as e:
+                print(f"Failed to refresh Goodreads review for {isbn} due to: {e}")
+            finally:
+                with self.refreshing_lock:
+                    self.refreshing.discard(isbn)
+
+        try:
+            self.executor.submit(refresh)
+        except RuntimeError as e:
+            # the pool is shut down, e.g. at exit: the stale review is refreshed by a later request
+            print(f"Could not refresh Goodreads review for {isbn} due to: {e}")
+            with self.refreshing_lock:
+                self.refreshing.discard(isbn)
 
     def _get_review_by_isbn(self, isbn):
         """
         Fetches the review information from the Goodreads API
         :param isbn: The known, single isbn number for a book edition
-        :return: json object, containing response details for that book
+        :return: json object, containing response details for that book; None if Goodreads doesn't know the isbn
         """
 
-        url = self.base_url + "/book/review_counts." + self.format
-        res = requests.get(url, params={"key": self.api_key, "isbns": isbn})
+        return self._get_reviews_by_isbns([isbn]).get(isbn)
 
-        if res.status_code != 200:
-            raise Exception("Uh oh. Goodreads API request was unsuccessful!")
+    def _get_reviews_by_isbns(self, isbns):
+        """
+        Fetches the review information of several books from the Goodreads API in a single request
+        :param isbns: list of isbn numbers (at most GOODREADS_BATCH_SIZE)
+        :return: dictionary of isbn to json object for the books Goodreads knows, matched on either isbn or isbn13
+        """
 
-        return res.json()['books'][0]
+        # a missing api key only disables the Goodreads ratings, rather than keeping the website from starting
+        if not self.api_key:
+            raise GoodreadsAPIError("GOODREADS_API_KEY is not set")
 
+        if not self.circuit_breaker.allow_request():
+            raise GoodreadsAPIError("Goodreads API requests are paused after repeated failures")
+
+        url = self.base_url + "/book/review_counts." + self.format
+        try:
+            res = self.http.get(url, params={"key": self.api_key, "isbns": ",".join(isbns)}, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.circuit_breaker.record_failure()
+            raise GoodreadsAPIError(f"Goodreads API request failed: {e}")
+
+        # Goodreads answers 404 when none of the isbns are known
+        if res.status_code == 404:
+            self.circuit_breaker.record_success()
+            return dict()
+
+        if res.status_code != 200:
+            self.circuit_breaker.record_failure()
+            raise GoodreadsAPIError("Uh oh. Goodreads API request was unsuccessful!")
 
+        # a 200 whose body isn't the expected json (e.g. an error page of a proxy) counts as a failure too
+        try:
+            books = res.json()['books']
+            requested = set(isbns)
+            reviews = dict()
+            for review in books:
+                for key in ('isbn', 'isbn13'):
+                    if review.get(key) in requested:
+                        reviews[review[key]] = review
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.circuit_breaker.record_failure()
+            raise GoodreadsAPIError(f"Goodreads API answered with an unexpected body: {e!r}")
 
+        self.circuit_breaker.record_success()
+        return reviews
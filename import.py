@@ -1,7 +1,50 @@
-"""Creates the database tables, if not already existing"""
+"""
+Creates the database tables, if not already existing, brings their schema up to date and imports the books from a
+csv file. Can also only apply schema migrations, hash passwords still stored in plain text, or rebuild or verify the
+rating aggregates kept in the 'book_stats' table.
+"""
 
-from book_database import BookDatabase
+import argparse
+import sys
+from book_database import BookDatabase, BOOK_IMPORT_BATCH_SIZE
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creates Reader's Forest database tables and imports books")
+    parser.add_argument("--file", default="books.csv", help="csv file of books (isbn, title, author, year)")
+    parser.add_argument("--batch-size", type=int, default=BOOK_IMPORT_BATCH_SIZE,
+                        help="number of books loaded per batch")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only read and validate the file, without writing to the database")
+    parser.add_argument("--migrate", action="store_true",
+                        help="only apply pending schema migrations to existing tables (no import)")
+    parser.add_argument("--hash-passwords", action="store_true",
+                        help="hash every password still stored in plain text (no import)")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="recompute the rating aggregates of every book from its reviews (no import)")
+    parser.add_argument("--check-stats", action="store_true",
+                        help="verify the rating aggregates of every book against its reviews (no import)")
+    args = parser.parse_args()
+
     db = BookDatabase()
-    db.initialize()
+
+    if args.migrate:
+        db.initiate_session()
+        db.migrate()
+        db.close_session()
+        sys.exit(0)
+
+    if args.hash_passwords:
+        db.initiate_session()
+        db.hash_plaintext_passwords()
+        db.close_session()
+        sys.exit(0)
+
+    if args.rebuild_stats or args.check_stats:
+        db.initiate_session()
+        if args.rebuild_stats:
+            db.rebuild_book_stats()
+        inconsistent_books = db.check_book_stats() if args.check_stats else []
+        db.close_session()
+        sys.exit(1 if inconsistent_books else 0)
+
+    db.initialize(book_file=args.file, batch_size=args.batch_size, dry_run=args.dry_run)
@@ -0,0 +1,246 @@
+"""
+The "RequestInstrumentation" class measures every request served by the website: its total latency, the number and
+duration of the SQL statements it ran (through SQLAlchemy's cursor events), and the time it spent waiting for
+external services such as Goodreads. Measurements are aggregated into Prometheus histograms, served as text by
+render_metrics(), and requests slower than a threshold are logged with a breakdown of their queries. Optionally,
+the numbers of each request are returned in its Server-Timing header.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+# Upper bounds of the histogram buckets, in seconds for durations and in statements for query counts
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def format_labels(label_names, label_values):
+    """Formats label names and values as a Prometheus label set, e.g. {endpoint="book",method="GET"}."""
+
+    labels = list()
+    for name, value in zip(label_names, label_values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        labels.append(f'{name}="{value}"')
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+
+    def __init__(self, name, description, label_names=()):
+        """
+        :param name: metric name
+        :param description: help text of the metric
+        :param label_names: names of the labels each value is counted by
+        """
+
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def render(self):
+        """Returns the counter in the Prometheus text format, as a list of lines."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, description, buckets, label_names=()):
+        """
+        :param name: metric name
+        :param description: help text of the metric
+        :param buckets: increasing upper bounds of the buckets (the +Inf bucket is added)
+        :param label_names: names of the labels each observation is recorded by
+        """
+
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series = dict()    # label values -> [bucket counts (the last one is +Inf), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format, as a list of lines."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, (bucket_counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.label_names + ("le",), label_values + (upper_bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class RequestMetrics:
+    """Measurements of the current request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.queries = list()                   # (statement, seconds) of every SQL statement
+        self.external_time = defaultdict(float)   # service -> seconds spent waiting for it
+
+
+class RequestInstrumentation:
+
+    def __init__(self, app=None, engine=None, slow_request_threshold=1.0, timing_header=False):
+        """
+        :param app: Flask application whose requests are measured
+        :param engine: SQLAlchemy engine whose statements are counted
+        :param slow_request_threshold: seconds after which a request is logged as slow, with its queries
+        :param timing_header: whether to add the measurements of each request to its Server-Timing header
+        """
+
+        self.slow_request_threshold = slow_request_threshold
+        self.timing_header = timing_header
+
+        self.requests = Counter("http_requests_total", "Requests served, by endpoint, method and status.",
+                                ("endpoint", "method", "status"))
+        self.request_duration = Histogram("http_request_duration_seconds", "Total latency of requests.",
+                                          DURATION_BUCKETS, ("endpoint", "method"))
+        self.sql_queries = Histogram("http_request_sql_queries", "SQL statements run per request.",
+                                     QUERY_COUNT_BUCKETS, ("endpoint",))
+        self.sql_duration = Histogram("http_request_sql_duration_seconds", "Time spent in SQL per request.",
+                                      DURATION_BUCKETS, ("endpoint",))
+        self.external_duration = Histogram("http_request_external_duration_seconds",
+                                           "Time spent waiting for external services per request.",
+                                           DURATION_BUCKETS, ("endpoint", "service"))
+
+        if app is not None:
+            self.init_app(app)
+        if engine is not None:
+            self.instrument_engine(engine)
+
+    def init_app(self, app):
+        """Measures the requests served by a Flask application."""
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def instrument_engine(self, engine):
+        """Counts and times the SQL statements run on a SQLAlchemy engine during requests."""
+
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @contextmanager
+    def external_call(self, service):
+        """Context manager adding the time spent in its block to the current request's time for a service."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics = self._current_metrics()
+            if metrics is not None:
+                metrics.external_time[service] += time.perf_counter() - start
+
+    def render_metrics(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+
+        lines = list()
+        for metric in (self.requests, self.request_duration, self.sql_queries, self.sql_duration,
+                       self.external_duration):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _current_metrics():
+        """Returns the measurements of the current request, or None outside of requests."""
+
+        if not has_app_context():
+            return None
+        return g.get("request_metrics")
+
+    @staticmethod
+    def _start_request():
+        g.request_metrics = RequestMetrics()
+
+    def _finish_request(self, response):
+        metrics = self._current_metrics()
+        if metrics is None:
+            return response
+
+        total_time = time.perf_counter() - metrics.start
+        endpoint = request.endpoint or "none"
+        self.requests.inc((endpoint, request.method, str(response.status_code)))
+        self.request_duration.observe((endpoint, request.method), total_time)
+        self.sql_queries.observe((endpoint,), metrics.sql_count)
+        self.sql_duration.observe((endpoint,), metrics.sql_time)
+        for service, seconds in metrics.external_time.items():
+            self.external_duration.observe((endpoint, service), seconds)
+
+        if total_time >= self.slow_request_threshold:
+            self._log_slow_request(metrics, total_time)
+
+        if self.timing_header:
+            timings = [f'sql;dur={metrics.sql_time * 1000:.1f};desc="{metrics.sql_count} queries"']
+            timings.extend(f"{service};dur={seconds * 1000:.1f}" for service, seconds in
+                           metrics.external_time.items())
+            timings.append(f"total;dur={total_time * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(timings)
+        return response
+
+    @staticmethod
+    def _log_slow_request(metrics, total_time):
+        """Prints a slow request with its SQL statements, grouped by statement and slowest first."""
+
+        external = "".join(f", {service} {seconds * 1000:.1f}ms"
+                           for service, seconds in metrics.external_time.items())
+        print(f"Slow request: {request.method} {request.full_path.rstrip('?')} took {total_time * 1000:.1f}ms "
+              f"(sql {metrics.sql_count} queries {metrics.sql_time * 1000:.1f}ms{external})")
+
+        statements = defaultdict(lambda: [0, 0.0])
+        for statement, seconds in metrics.queries:
+            statements[statement][0] += 1
+            statements[statement][1] += seconds
+        for statement, (count, seconds) in sorted(statements.items(), key=lambda item: -item[1][1])[:10]:
+            print(f"    {count}x {seconds * 1000:.1f}ms {statement[:120]}")
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # a connection runs one statement at a time; the start time of a statement that raised (after which
+        # after_cursor_execute isn't called) is simply replaced by the next one
+        conn.info["query_start_time"] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("query_start_time", None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        metrics = self._current_metrics()
+        if metrics is not None:
+            metrics.sql_count += 1
+            metrics.sql_time += seconds
+            metrics.queries.append((re.sub(r"\s+", " ", statement).strip(), seconds))
@@ -11,3 +11,10 @@ class BookObject(namedtuple('Base', 'db_id isbn title author year star_rating re
 class ReviewObject(namedtuple('Base', 'db_id book_id username date_created rating review')):
     pass
 
+
+class UserObject(namedtuple('Base', 'db_id first_name')):
+    pass
+
+
+class RecommendationObject(namedtuple('Base', 'isbn title author score')):
+    pass
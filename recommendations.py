@@ -0,0 +1,220 @@
+"""
+Offline batch job computing "readers also liked" recommendations, stored in the 'book_recommendations' table from
+which book pages read them. Two books are similar when the same readers rated both highly: the similarity is the
+cosine of the books' columns in the sparse (readers x books) matrix of high ratings, i.e. the number of readers who
+rated both highly divided by the geometric mean of the number of readers of each.
+
+The whole catalog is recomputed by default, replacing every stored recommendation in a single transaction (so books
+no longer similar to any other lose theirs); with --incremental, only the books with new high ratings since the last
+run are (other books keep their recommendations until the next full run):
+
+    $ python recommendations.py
+    $ python recommendations.py --incremental
+
+The job requires NumPy and SciPy, which the website itself doesn't need.
+"""
+import argparse
+import time
+from array import array
+from datetime import datetime
+import numpy as np
+from scipy import sparse
+from sqlalchemy import text
+from book_database import BookDatabase
+
+# Minimum rating (in stars) for a review to count as its reader liking the book
+HIGH_RATING = 4
+
+# Number of recommendations stored per book
+RECOMMENDATIONS_PER_BOOK = 10
+
+# Minimum number of readers who must have liked both books for one to be recommended with the other
+MIN_COMMON_READERS = 2
+
+# Number of books whose similarities are computed (and saved) at once, which bounds the job's memory use
+BLOCK_SIZE = 1000
+
+
+def load_high_ratings(db, min_rating=HIGH_RATING, up_to_review_id=None, batch_size=10000):
+    """
+    Loads who rated which book highly, streaming the reviews from a server-side cursor.
+    :param min_rating: minimum rating of the reviews loaded
+    :param up_to_review_id: if given, reviews with a greater id are ignored
+    :return: tuple of numpy arrays (book ids, user ids), one element per review
+    """
+
+    query = "SELECT book_id, user_id FROM book_reviews WHERE rating >= :min_rating"
+    if up_to_review_id is not None:
+        query += " AND id <= :up_to_review_id"
+
+    book_ids = array('i')
+    user_ids = array('i')
+    result = db.session.execute(text(query).execution_options(stream_results=True),
+                                {"min_rating": min_rating, "up_to_review_id": up_to_review_id})
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for book_id, user_id in rows:
+                book_ids.append(book_id)
+                user_ids.append(user_id)
+    finally:
+        result.close()
+
+    return np.frombuffer(book_ids, dtype=np.int32), np.frombuffer(user_ids, dtype=np.int32)
+
+
+def readers_matrix(book_ids, user_ids):
+    """
+    Builds the sparse matrix of high ratings.
+    :param book_ids: numpy array of the book id of every high rating
+    :param user_ids: numpy array of the user id of every high rating
+    :return: tuple (CSC matrix of readers x books with a 1 for every high rating, book id of every column)
+    """
+
+    books, columns = np.unique(book_ids, return_inverse=True)
+    users, rows = np.unique(user_ids, return_inverse=True)
+    matrix = sparse.csc_matrix((np.ones(len(columns), dtype=np.float32), (rows, columns)),
+                               shape=(len(users), len(books)))
+    # a reader counts once per book, even if the same review was loaded twice
+    matrix.data[:] = 1
+    return matrix, books
+
+
+def compute_recommendations(matrix, books, for_books=None, top=RECOMMENDATIONS_PER_BOOK,
+                            min_common_readers=MIN_COMMON_READERS):
+    """
+    Computes the most similar books of every book (or of the given books), BLOCK_SIZE books at a time.
+    :param matrix: readers x books matrix of high ratings (see readers_matrix)
+    :param books: book id of every column of the matrix
+    :param for_books: ids of the books to compute recommendations for; all books if None
+    :param top: maximum number of recommendations per book
+    :param min_common_readers: minimum number of readers who liked both books
+    :return: generator of tuples (book id, list of (recommended book id, similarity), most similar first)
+    """
+
+    readers = np.asarray(matrix.sum(axis=0)).ravel()
+    columns = np.arange(len(books)) if for_books is None else np.flatnonzero(np.isin(books, for_books))
+    books_by_reader = matrix.T.tocsr()
+
+    for block_start in range(0, len(columns), BLOCK_SIZE):
+        block = columns[block_start:block_start + BLOCK_SIZE]
+        # number of readers who liked both each book of the block and every other book
+        common_readers = (books_by_reader[block] @ matrix).tocsr()
+
+        for row, column in enumerate(block):
+            start, end = common_readers.indptr[row], common_readers.indptr[row + 1]
+            others = common_readers.indices[start:end]
+            counts = common_readers.data[start:end]
+            keep = (others != column) & (counts >= min_common_readers)
+            others, counts = others[keep], counts[keep]
+
+            scores = counts / np.sqrt(readers[column] * readers[others])
+            best = np.argpartition(-scores, top)[:top] if len(scores) > top else np.arange(len(scores))
+            best = best[np.argsort(-scores[best], kind="stable")]
+            yield int(books[column]), [(int(books[others[index]]), float(scores[index])) for index in best]
+
+
+def save_recommendations(db, recommendations, batch_size=BLOCK_SIZE, replace_all=False):
+    """
+    Replaces the stored recommendations of every book in recommendations, committing every batch_size books.
+    :param recommendations: iterable of tuples (book id, list of (recommended book id, similarity))
+    :param replace_all: delete the recommendations of every other book too; everything is then written in a single
+    transaction, left for the caller to commit
+    :return: number of books whose recommendations were saved
+    """
+
+    saved = 0
+    book_ids = list()
+    rows = list()
+
+    if replace_all:
+        db.session.execute("DELETE FROM book_recommendations;")
+
+    def write():
+        db.session.execute("DELETE FROM book_recommendations WHERE book_id = :book_id;",
+                           [{"book_id": book_id} for book_id in book_ids])
+        if rows:
+            db.session.execute(
+                "INSERT INTO book_recommendations (book_id, rank, recommended_book_id, score) "
+                "VALUES (:book_id, :rank, :recommended_book_id, :score);",
+                rows
+            )
+        if not replace_all:
+            db.session.commit()
+        book_ids.clear()
+        rows.clear()
+
+    for book_id, recommended in recommendations:
+        book_ids.append(book_id)
+        rows.extend({"book_id": book_id, "rank": rank, "recommended_book_id": recommended_book_id, "score": score}
+                    for rank, (recommended_book_id, score) in enumerate(recommended, start=1))
+        saved += 1
+        if len(book_ids) >= batch_size:
+            write()
+    if book_ids:
+        write()
+
+    return saved
+
+
+def run(db, incremental=False, min_rating=HIGH_RATING, top=RECOMMENDATIONS_PER_BOOK,
+        min_common_readers=MIN_COMMON_READERS):
+    """
+    Recomputes and stores recommendations, and records the last review taken into account in
+    'recommendation_state'.
+    :param incremental: only recompute the books with new high ratings since the last run
+    :return: number of books whose recommendations were recomputed
+    """
+
+    start = time.perf_counter()
+    last_review_id = db.session.execute("SELECT COALESCE(MAX(id), 0) AS id FROM book_reviews;").fetchone()['id']
+
+    for_books = None
+    if incremental:
+        previous_review_id = db.session.execute(
+            "SELECT last_review_id FROM recommendation_state WHERE id = 1;"
+        ).fetchone()['last_review_id']
+        for_books = [row.book_id for row in db.session.execute(
+            "SELECT DISTINCT book_id FROM book_reviews "
+            "WHERE id > :previous AND id <= :last AND rating >= :min_rating;",
+            {"previous": previous_review_id, "last": last_review_id, "min_rating": min_rating}
+        ).fetchall()]
+        print(f"{len(for_books)} books have new high ratings since review {previous_review_id}")
+
+    saved = 0
+    if for_books != []:
+        book_ids, user_ids = load_high_ratings(db, min_rating, up_to_review_id=last_review_id)
+        print(f"Loaded {len(book_ids)} high ratings in {time.perf_counter() - start:.1f}s")
+        recommendations = list()
+        if len(book_ids):
+            matrix, books = readers_matrix(book_ids, user_ids)
+            recommendations = compute_recommendations(matrix, books, for_books, top, min_common_readers)
+        saved = save_recommendations(db, recommendations, replace_all=not incremental)
+
+    db.session.execute(
+        "UPDATE recommendation_state SET last_review_id = :last_review_id, computed_at = :computed_at WHERE id = 1;",
+        {"last_review_id": last_review_id, "computed_at": datetime.now()}
+    )
+    db.session.commit()
+    print(f"Recomputed recommendations of {saved} books in {time.perf_counter() - start:.1f}s")
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Computes 'readers also liked' book recommendations")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only recompute books with new high ratings since the last run")
+    parser.add_argument("--min-rating", type=int, default=HIGH_RATING, help="minimum rating of a high rating")
+    parser.add_argument("--top", type=int, default=RECOMMENDATIONS_PER_BOOK, help="recommendations per book")
+    parser.add_argument("--min-common-readers", type=int, default=MIN_COMMON_READERS,
+                        help="minimum number of readers who liked both books")
+    args = parser.parse_args()
+
+    db = BookDatabase()
+    db.initiate_session()
+    try:
+        run(db, args.incremental, args.min_rating, args.top, args.min_common_readers)
+    finally:
+        db.close_session()
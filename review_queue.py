@@ -0,0 +1,217 @@
+"""
+Write-behind ingestion of reviews. Instead of inserting every review into the database as it is submitted, reviews
+are appended to a durable local queue ("SQLiteReviewQueue"), and a background thread of "ReviewWriter" flushes
+them in batches with BookDatabase.add_user_reviews: one multi-row INSERT and one update of the affected rating
+aggregates per batch, instead of one transaction per review.
+
+Reviews stay in the queue until their batch is committed, so none are lost if the website stops before they are
+flushed; they are flushed by the next process using the same queue file. Until then, a user's queued review is
+looked up in the queue so that they see it on the book page right away.
+
+Neither the queue's connection nor the writer's thread is shared across a fork: each worker process opens its own
+connection and starts its own thread when it first uses them.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from sqlalchemy.exc import DataError, IntegrityError
+
+
+class SQLiteReviewQueue:
+    """Queue of reviews kept in a local SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self._connection = None
+        self.lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """Connection to the queue file, opened on first use in every process."""
+
+        if self.pid != os.getpid():
+            # the lock may have been held by another thread when the process was forked
+            self.lock = threading.Lock()
+            self._connection = self._connect()
+            self.pid = os.getpid()
+        return self._connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS pending_reviews ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER, user_id INTEGER, review TEXT)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS pending_reviews_book_id_user_id_idx ON pending_reviews (book_id, user_id)"
+        )
+        connection.commit()
+        return connection
+
+    def put(self, review):
+        """Appends a review (dictionary of book_id, user_id, date_created, rating and review) to the queue."""
+
+        connection = self.connection
+        with self.lock:
+            connection.execute(
+                "INSERT INTO pending_reviews (book_id, user_id, review) VALUES (?, ?, ?)",
+                (review["book_id"], review["user_id"], json.dumps(review, default=str))
+            )
+            connection.commit()
+
+    def peek(self, limit):
+        """Returns up to limit of the oldest reviews in the queue, as a list of (queue id, review) tuples."""
+
+        connection = self.connection
+        with self.lock:
+            rows = connection.execute(
+                "SELECT id, review FROM pending_reviews ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(queue_id, self._load(review)) for queue_id, review in rows]
+
+    def remove(self, queue_ids):
+        """Removes reviews from the queue, once they are stored in the database."""
+
+        connection = self.connection
+        with self.lock:
+            connection.executemany("DELETE FROM pending_reviews WHERE id = ?", [(queue_id,) for queue_id in queue_ids])
+            connection.commit()
+
+    def find(self, book_id, user_id):
+        """Returns a user's queued review of a book, or None."""
+
+        connection = self.connection
+        with self.lock:
+            row = connection.execute(
+                "SELECT review FROM pending_reviews WHERE book_id = ? AND user_id = ? LIMIT 1", (book_id, user_id)
+            ).fetchone()
+        return self._load(row[0]) if row else None
+
+    def __len__(self):
+        connection = self.connection
+        with self.lock:
+            return connection.execute("SELECT COUNT(*) FROM pending_reviews").fetchone()[0]
+
+    @staticmethod
+    def _load(review):
+        review = json.loads(review)
+        review["date_created"] = datetime.fromisoformat(review["date_created"])
+        return review
+
+
+class ReviewWriter:
+
+    def __init__(self, db, queue, batch_size=500, flush_interval=1.0):
+        """
+        :param db: BookDatabase the reviews are written to
+        :param queue: queue the reviews wait in (see SQLiteReviewQueue)
+        :param batch_size: maximum number of reviews written per transaction
+        :param flush_interval: seconds between two flushes of the queue
+        """
+
+        self.db = db
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flush_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        """Starts the background thread in the current process, unless it is already running there."""
+
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid():
+                # the flush lock may have been held by the thread of the parent process when this one was forked
+                self.flush_lock = threading.Lock()
+                self.thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def submit(self, user_db_id, book_db_id, rating, review):
+        """
+        Queues a new review, which is written to the database by the next flush.
+        :param user_db_id: database user id
+        :param book_db_id: database book id
+        :param rating: user provided rating, from 1 to 5 stars, validated by the caller (see book_database.parse_rating)
+        :param review: user provided review
+        """
+
+        self.start()
+        self.queue.put({"book_id": book_db_id, "user_id": user_db_id, "date_created": datetime.now(),
+                        "rating": rating, "review": review})
+
+    def pending_review(self, book_db_id, user_db_id):
+        """Returns a user's review of a book that is still waiting to be written to the database, or None."""
+
+        return self.queue.find(book_db_id, user_db_id)
+
+    def flush(self):
+        """
+        Writes every queued review to the database, batch_size reviews per transaction.
+        :return: number of reviews flushed
+        """
+
+        flushed = 0
+        with self.flush_lock:
+            while True:
+                batch = self.queue.peek(self.batch_size)
+                if not batch:
+                    break
+                try:
+                    self._write([review for _, review in batch])
+                finally:
+                    self.db.remove_session()
+                self.queue.remove([queue_id for queue_id, _ in batch])
+                flushed += len(batch)
+        return flushed
+
+    def _write(self, reviews):
+        """
+        Writes a batch of reviews. If the database rejects the batch (e.g. a review of a book that was deleted),
+        the reviews are written one at a time and the rejected ones are dropped, so they don't block the queue.
+        """
+
+        try:
+            self.db.add_user_reviews(reviews)
+            return
+        except (IntegrityError, DataError, ValueError) as e:
+            self.db.session.rollback()
+            print(f"Could not write a batch of {len(reviews)} reviews due to: {e!r}; writing them one at a time")
+
+        for review in reviews:
+            try:
+                self.db.add_user_reviews([review])
+            except (IntegrityError, DataError, ValueError) as e:
+                self.db.session.rollback()
+                print(f"Dropping review of book {review['book_id']} by user {review['user_id']} due to: {e!r}")
+
+    def stop(self):
+        """Stops the background thread, after a last flush."""
+
+        self.stopping.set()
+        if self.pid == os.getpid():
+            self.thread.join()
+        else:
+            # no review was submitted by this process, but reviews queued by a previous one may be waiting
+            self._flush_safely()
+
+    def _run(self):
+        while not self.stopping.wait(self.flush_interval):
+            self._flush_safely()
+        self._flush_safely()
+
+    def _flush_safely(self):
+        try:
+            self.flush()
+        except Exception as e:
+            # e.g. the database is unavailable: the reviews stay queued and are retried by the next flush
+            print(f"Could not flush queued reviews due to: {e!r}")
@@ -0,0 +1,220 @@
+"""
+Search backends decide which books match a user's search and in which order they are returned by
+BookDatabase.search_by_any. Every backend implements search(db, item, limit, offset) and returns a list of
+BookObjects, so the backend can be swapped without changing the website:
+
+* "like": case-insensitive LIKE on isbn, title and author (a sequential scan, ordered by title).
+* "postgres": full-text (tsvector) and trigram (pg_trgm) matching, backed by the indexes created in
+  BookDatabase.create_books_table and ranked by relevance.
+* "memory": an in-process inverted index (token -> isbn postings) of the books table, for SQLite and test setups. It
+  is rebuilt when the catalog is re-imported, like the catalog snapshot (see catalog.py).
+"""
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+")
+
+# Relative importance of a query token being found in the title rather than the author's name
+TITLE_WEIGHT = 2.0
+AUTHOR_WEIGHT = 1.0
+
+# Discount applied when the last token of a search only matches the beginning of a word
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text):
+    """Splits text into lower case alphanumeric tokens."""
+
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class LikeSearch:
+    """Case-insensitive substring matching on isbn, title and author; results are ordered by title."""
+
+    name = "like"
+
+    def search(self, db, item, limit, offset):
+        query_item = '%' + str(item).lower() + '%'
+        condition = "(LOWER(b.isbn) LIKE :item) OR (LOWER(b.title) LIKE :item) OR (LOWER(b.author) LIKE :item)"
+        return db.find_books(condition, {"item": query_item}, "b.title, b.id", limit, offset)
+
+
+class PostgresTextSearch:
+    """
+    Matches books through the full-text index on title and author, or through the trigram indexes on isbn, title
+    and author for partial words. Results are ranked by full-text rank plus trigram similarity.
+    """
+
+    name = "postgres"
+
+    def search(self, db, item, limit, offset):
+        query_item = '%' + str(item) + '%'
+        condition = "(to_tsvector('simple', b.title || ' ' || b.author) @@ plainto_tsquery('simple', :item)) " \
+                    "OR (b.isbn ILIKE :pattern) OR (b.title ILIKE :pattern) OR (b.author ILIKE :pattern)"
+        order_by = "ts_rank(to_tsvector('simple', b.title || ' ' || b.author), plainto_tsquery('simple', :item)) " \
+                   "+ GREATEST(similarity(b.title, :item), similarity(b.author, :item)) DESC, b.title, b.id"
+        return db.find_books(condition, {"item": str(item), "pattern": query_item}, order_by, limit, offset)
+
+
+class InvertedIndexSearch:
+    """
+    In-process inverted index mapping each title/author token to the isbns of the books containing it. A book
+    matches when every token of the search matches (the last token may be a prefix, so partially typed words
+    still match) or when the search is the beginning of its isbn. Matches are ranked by the inverse document frequency of
+    the matched tokens, weighted by whether they appear in the title or the author.
+    """
+
+    name = "memory"
+
+    def __init__(self, books, version=0):
+        """
+        :param books: iterable of (isbn, title, author) tuples
+        :param version: catalog version the books were loaded at
+        """
+
+        self.version = version
+        self.postings = defaultdict(dict)
+        self.isbn_keys = []      # sorted (upper case isbn, isbn), searched by prefix
+        self.titles = {}
+
+        for isbn, title, author in books:
+            self.isbn_keys.append((isbn.upper(), isbn))
+            self.titles[isbn] = title
+            for token in tokenize(author):
+                self.postings[token][isbn] = AUTHOR_WEIGHT
+            for token in tokenize(title):
+                self.postings[token][isbn] = TITLE_WEIGHT
+
+        self.isbn_keys.sort()
+        self.vocabulary = sorted(self.postings)
+        self.book_count = len(self.isbn_keys)
+
+    @classmethod
+    def from_database(cls, db):
+        """Builds the index from the current contents of the books table."""
+
+        version = db.get_catalog_version()
+        return cls(db.session.execute("SELECT isbn, title, author FROM books;").fetchall(), version)
+
+    def search(self, db, item, limit, offset):
+        ranked_isbns = self.rank(item)
+        return db.get_books_by_isbns(ranked_isbns[offset:offset + limit])
+
+    def rank(self, item):
+        """Returns the isbns of all books matching the search item, most relevant first."""
+
+        tokens = tokenize(item)
+        if not tokens:
+            return []
+
+        scores = None
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1:
+                token_scores = self._prefix_scores(token)
+            else:
+                token_scores = self._token_scores(token)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {isbn: score + token_scores[isbn] for isbn, score in scores.items() if isbn in token_scores}
+
+            if not scores:
+                break
+
+        # an isbn search matches on the isbn itself rather than on title/author tokens
+        isbn_item = str(item).strip().upper()
+        if isbn_item:
+            start = bisect_left(self.isbn_keys, (isbn_item,))
+            for isbn_key, isbn in self.isbn_keys[start:]:
+                if not isbn_key.startswith(isbn_item):
+                    break
+                scores[isbn] = scores.get(isbn, 0) + (math.inf if isbn_key == isbn_item else 1.0)
+
+        return sorted(scores, key=lambda isbn: (-scores[isbn], self.titles[isbn], isbn))
+
+    def _token_scores(self, token):
+        """Scores of the books containing exactly this token."""
+
+        postings = self.postings.get(token, {})
+        idf = self._idf(len(postings))
+        return {isbn: weight * idf for isbn, weight in postings.items()}
+
+    def _prefix_scores(self, prefix):
+        """
+        Scores of the books containing any token starting with this prefix (best score per book); books
+        containing the whole token score higher than books only containing a longer word.
+        """
+
+        scores = {}
+        start = bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            weight = 1.0 if token == prefix else PREFIX_WEIGHT
+            for isbn, score in self._token_scores(token).items():
+                score *= weight
+                if score > scores.get(isbn, 0):
+                    scores[isbn] = score
+        return scores
+
+    def _idf(self, document_frequency):
+        return math.log(1 + self.book_count / (1 + document_frequency))
+
+
+class CatalogIndexSearch:
+    """
+    Searches an InvertedIndexSearch of the books table, built on first use, and rebuilds it when the catalog is
+    re-imported. The catalog version is checked at most once every refresh_interval seconds (by default
+    CATALOG_REFRESH_INTERVAL, as for the catalog snapshot).
+    """
+
+    name = InvertedIndexSearch.name
+
+    def __init__(self, refresh_interval=None):
+        if refresh_interval is None:
+            refresh_interval = int(os.getenv("CATALOG_REFRESH_INTERVAL", 60))
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.index = None
+        self.checked_at = 0
+
+    def get_index(self, db):
+        """Returns the current index, (re)building it first if it is missing or the catalog has changed."""
+
+        if self.index is None or time.monotonic() - self.checked_at >= self.refresh_interval:
+            self.refresh(db)
+        return self.index
+
+    def refresh(self, db, force=False):
+        """Rebuilds the index if the catalog version changed (or always, if force is True)."""
+
+        with self.lock:
+            self.checked_at = time.monotonic()
+            if force or self.index is None or db.get_catalog_version() != self.index.version:
+                print("Building search index")
+                self.index = InvertedIndexSearch.from_database(db)
+
+    def search(self, db, item, limit, offset):
+        return self.get_index(db).search(db, item, limit, offset)
+
+
+SEARCH_BACKENDS = {
+    LikeSearch.name: LikeSearch,
+    PostgresTextSearch.name: PostgresTextSearch,
+    CatalogIndexSearch.name: CatalogIndexSearch,
+}
+
+
+def create_search_backend(name):
+    """Creates the search backend registered under the given name (see SEARCH_BACKENDS)."""
+
+    if name not in SEARCH_BACKENDS:
+        raise RuntimeError(f"Unknown search backend '{name}', choose from: {', '.join(SEARCH_BACKENDS)}")
+
+    return SEARCH_BACKENDS[name]()
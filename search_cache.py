@@ -0,0 +1,113 @@
+"""
+The "SearchCache" class caches the results of searches. Queries are normalized first (case, whitespace and the
+hyphens of isbns), so that "Stephen  King" and "stephen king" share their results. A search is cached as the
+ordered list of the isbns it found, while the books themselves come from the BookCache: a new review only drops the
+cached rating of the reviewed book, not the searches that found it.
+
+How often every normalized query is run is counted in memory and added to the 'search_query_stats' table every
+flush_every searches (or flush_interval seconds), so that the most popular queries can be run ahead of the first
+users (see prewarm), e.g. when a new worker process starts.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from cache import TTLCache
+
+# A query made only of digits, spaces and hyphens (possibly ending with an 'x' check digit) is a (partial) isbn
+ISBN_QUERY_PATTERN = re.compile(r"[\d\s-]*\d[\d\s-]*x?")
+
+
+def normalize_query(item):
+    """
+    Lowercases a search query and collapses its whitespace; hyphens and spaces are removed from isbns, which are
+    uppercased instead, like the isbns of the books table (e.g. an 'X' check digit).
+    """
+
+    query = " ".join(str(item).lower().split())
+    if ISBN_QUERY_PATTERN.fullmatch(query):
+        query = re.sub(r"[\s-]", "", query).upper()
+    return query
+
+
+class SearchCache:
+
+    def __init__(self, db, book_cache, max_size=1000, ttl=300, flush_every=100, flush_interval=60):
+        """
+        :param db: BookDatabase searches are run on
+        :param book_cache: BookCache the books found are read from
+        :param max_size: maximum number of (query, page) results kept
+        :param ttl: seconds the results of a search are served for (e.g. until newly imported books are found)
+        :param flush_every: number of searches after which the query counts are added to 'search_query_stats'
+        :param flush_interval: seconds after which the query counts are added to 'search_query_stats', at most
+        """
+
+        self.db = db
+        self.book_cache = book_cache
+        self.results = TTLCache(max_size=max_size, ttl=ttl)     # (query, limit, offset) -> list of isbns
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.query_counts = Counter()
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def search(self, item, limit, offset=0):
+        """
+        Returns the books matching a search, from the cache if it was run recently (see BookDatabase.search_by_any).
+        :param item: any item submitted by user
+        :param limit: maximum number of books to return
+        :param offset: number of matching books to skip
+        :return: list of book tuple Objects, most relevant first
+        """
+
+        query = normalize_query(item)
+        if query:
+            self._count(query)
+        return self._search(query, limit, offset)
+
+    def _search(self, query, limit, offset):
+        key = (query, limit, offset)
+        isbns = self.results.get(key)
+        if isbns is not None:
+            return self.book_cache.get_books(isbns)
+
+        books = self.db.search_by_any(query, limit=limit, offset=offset)
+        self.results.set(key, [book.isbn for book in books])
+        self.book_cache.remember(books)
+        return books
+
+    def prewarm(self, limit, count=20):
+        """
+        Runs the most popular searches, so that their first page is cached.
+        :param limit: number of books per page, as requested by the website
+        :param count: number of searches to run
+        :return: number of searches run
+        """
+
+        queries = self.db.get_popular_search_queries(count)
+        for query in queries:
+            self._search(query, limit, 0)
+        return len(queries)
+
+    def _count(self, query):
+        """Counts a search, and adds the counts to the database once flush_every searches were counted."""
+
+        with self.lock:
+            self.query_counts[query] += 1
+            if sum(self.query_counts.values()) < self.flush_every and \
+                    time.monotonic() - self.flushed_at < self.flush_interval:
+                return
+            query_counts = self.query_counts
+            self.query_counts = Counter()
+            self.flushed_at = time.monotonic()
+
+        try:
+            self.db.record_search_queries(query_counts)
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Could not record search query counts due to: {e!r}")
+
+    def cache_stats(self):
+        """Returns the hit/miss/eviction counters of the cached results."""
+
+        return self.results.stats()
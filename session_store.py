@@ -0,0 +1,166 @@
+"""
+Server-side storage of Flask sessions. The browser only holds a random session id in a cookie; the session data
+(e.g. the logged in user's first name and id) lives in a store shared by every worker process:
+
+* "DatabaseSessionStore": the 'user_sessions' table of the website's database.
+* "MemorySessionStore": a dictionary in the current process, as a stand-in for tests and benchmarks.
+
+Sessions are only written back when they change (or are close to expiring), and expired sessions are deleted in
+batches rather than on every request.
+"""
+import json
+import secrets
+import threading
+from datetime import datetime, timedelta
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data, which records whether it was modified during the request."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+
+    def __init__(self, store, lifetime=timedelta(days=1), cleanup_every=1000):
+        """
+        :param store: session store (see DatabaseSessionStore and MemorySessionStore)
+        :param lifetime: how long a session is kept after it was last saved
+        :param cleanup_every: number of saved sessions between two deletions of expired sessions
+        """
+
+        self.store = store
+        self.lifetime = lifetime
+        self.cleanup_every = cleanup_every
+        self.saves = 0
+        self.saves_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            stored = self.store.get(sid)
+            if stored is not None:
+                data, expires_at = stored
+                if expires_at > datetime.now():
+                    return ServerSession(data, sid=sid, expires_at=expires_at)
+
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        # unmodified sessions are only written again when more than half of their lifetime has passed
+        now = datetime.now()
+        if not session.modified and session.expires_at is not None \
+                and session.expires_at - now > self.lifetime / 2:
+            return
+
+        expires_at = now + self.lifetime
+        self.store.set(session.sid, dict(session), expires_at)
+        response.set_cookie(
+            app.session_cookie_name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+        self._cleanup_if_due()
+
+    def _cleanup_if_due(self):
+        """Deletes expired sessions once every cleanup_every saves."""
+
+        with self.saves_lock:
+            self.saves += 1
+            if self.saves % self.cleanup_every:
+                return
+
+        deleted = self.store.delete_expired()
+        print(f"Deleted {deleted} expired sessions")
+
+
+class DatabaseSessionStore:
+    """Keeps sessions, serialized as json, in the 'user_sessions' table (see BookDatabase.MIGRATIONS)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, sid):
+        row = self.db.session.execute("SELECT data, expires_at FROM user_sessions WHERE id = :sid;",
+                                      {"sid": sid}).fetchone()
+        if row is None:
+            return None
+
+        expires_at = row.expires_at
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        return json.loads(row.data), expires_at
+
+    def set(self, sid, data, expires_at):
+        self.db.session.execute(
+            "INSERT INTO user_sessions (id, data, expires_at) VALUES (:sid, :data, :expires_at) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at;",
+            {"sid": sid, "data": json.dumps(data), "expires_at": expires_at}
+        )
+        self.db.session.commit()
+
+    def delete(self, sid):
+        self.db.session.execute("DELETE FROM user_sessions WHERE id = :sid;", {"sid": sid})
+        self.db.session.commit()
+
+    def delete_expired(self):
+        deleted = self.db.session.execute("DELETE FROM user_sessions WHERE expires_at <= :now;",
+                                          {"now": datetime.now()}).rowcount
+        self.db.session.commit()
+        return deleted
+
+
+class MemorySessionStore:
+    """Keeps sessions in a dictionary of the current process (sessions are lost on restart)."""
+
+    def __init__(self):
+        self.sessions = dict()
+        self.lock = threading.Lock()
+
+    def get(self, sid):
+        with self.lock:
+            stored = self.sessions.get(sid)
+        if stored is None:
+            return None
+        data, expires_at = stored
+        return json.loads(data), expires_at
+
+    def set(self, sid, data, expires_at):
+        with self.lock:
+            self.sessions[sid] = (json.dumps(data), expires_at)
+
+    def delete(self, sid):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+    def delete_expired(self):
+        now = datetime.now()
+        with self.lock:
+            expired = [sid for sid, (_, expires_at) in self.sessions.items() if expires_at <= now]
+            for sid in expired:
+                del self.sessions[sid]
+        return len(expired)
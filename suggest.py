@@ -0,0 +1,168 @@
+"""
+The "SuggestionIndex" class completes what a user has started typing into the titles and authors of the catalog,
+most reviewed first, for the /api/suggest endpoint. Every title and author is indexed under each of its words, so
+"pott" completes "Beatrix Potter" as well as "From Potter's Field"; among equally reviewed completions, those
+starting with the prefix come first. The index is a sorted list of keys searched with bisect; the completions of
+very short prefixes, which match a large part of the catalog, are ranked once when the index is built.
+
+Like the catalog snapshot (see catalog.py), the index is rebuilt by "Suggestions" when the catalog is re-imported,
+and also every max_age seconds so that the ranking follows new reviews.
+"""
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+# Maximum number of completions returned for a prefix
+MAX_SUGGESTIONS = 20
+
+# Completions of prefixes up to this length are ranked when the index is built
+PRECOMPUTED_PREFIX_LENGTH = 3
+
+
+def normalize(text):
+    """Lowercases text and collapses its whitespace, so that completions don't depend on either."""
+
+    return " ".join(text.lower().split())
+
+
+class SuggestionIndex:
+
+    def __init__(self, books, version=0):
+        """
+        :param books: iterable of (isbn, title, author, review count) tuples
+        :param version: catalog version the books were loaded at
+        """
+
+        self.version = version
+        self.completions = list()       # (text, type, isbn or None, review count)
+        author_positions = dict()
+        keys = list()
+
+        for isbn, title, author, review_count in books:
+            keys.extend((key, len(self.completions), word_number) for key, word_number in self._keys(title))
+            self.completions.append((title, "title", isbn, review_count))
+
+            # an author is ranked by the reviews of all their books
+            if author in author_positions:
+                text, kind, _, author_reviews = self.completions[author_positions[author]]
+                self.completions[author_positions[author]] = (text, kind, None, author_reviews + review_count)
+            else:
+                author_positions[author] = len(self.completions)
+                keys.extend((key, len(self.completions), word_number) for key, word_number in self._keys(author))
+                self.completions.append((author, "author", None, review_count))
+
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.positions = array('I', (position for _, position, _ in keys))
+        self.word_numbers = array('H', (min(word_number, 65535) for _, _, word_number in keys))
+
+        short_prefixes = defaultdict(dict)
+        for key, position, word_number in keys:
+            for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                matches = short_prefixes[key[:length]]
+                matches[position] = min(matches.get(position, word_number), word_number)
+        self.top_completions = {prefix: self._rank(matches, MAX_SUGGESTIONS)
+                                for prefix, matches in short_prefixes.items()}
+
+    @classmethod
+    def from_database(cls, db):
+        """Builds an index of the whole books table, with review counts from 'book_stats'."""
+
+        version = db.get_catalog_version()
+        books = db.session.execute(
+            "SELECT b.isbn, b.title, b.author, COALESCE(s.rating_count, 0) AS review_count "
+            "FROM books b LEFT JOIN book_stats s ON s.book_id = b.id;"
+        )
+        return cls(((book.isbn, book.title, book.author, book.review_count) for book in books), version)
+
+    @staticmethod
+    def _keys(text):
+        """
+        Returns the keys text is indexed under: its normalized form starting from each of its words, with the
+        number of that word (0 for the first one).
+        """
+
+        text = normalize(text)
+        return [(text[match.start():], word_number) for word_number, match in enumerate(re.finditer(r"\w+", text))]
+
+    def _rank(self, matches, limit):
+        """
+        Returns the positions of the limit best completions: most reviewed first, then those starting with the
+        prefix, then alphabetically.
+        :param matches: dictionary of completion positions to the number of the first word matching the prefix
+        """
+
+        return heapq.nsmallest(limit, matches, key=lambda position: (-self.completions[position][3],
+                                                                     matches[position] > 0,
+                                                                     self.completions[position][0]))
+
+    def suggest(self, prefix, limit=10):
+        """
+        Completes a prefix into titles and authors.
+        :param prefix: what the user has typed so far
+        :param limit: maximum number of completions (at most MAX_SUGGESTIONS)
+        :return: list of dictionaries of the completion's text, type ('title' or 'author'), isbn (for titles)
+        and review count, most reviewed first
+        """
+
+        prefix = normalize(prefix)
+        limit = min(limit, MAX_SUGGESTIONS)
+        if not prefix or limit <= 0:
+            return []
+
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            positions = self.top_completions.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + "\uffff", start)
+            matches = dict()
+            for position, word_number in zip(self.positions[start:end], self.word_numbers[start:end]):
+                matches[position] = min(matches.get(position, word_number), word_number)
+            positions = self._rank(matches, limit)
+
+        suggestions = list()
+        for position in positions:
+            text, kind, isbn, review_count = self.completions[position]
+            suggestion = {"text": text, "type": kind, "review_count": review_count}
+            if isbn is not None:
+                suggestion["isbn"] = isbn
+            suggestions.append(suggestion)
+        return suggestions
+
+
+class Suggestions:
+    """
+    Holds the current suggestion index, built on first use, and rebuilds it when the catalog is re-imported (checked
+    at most once every refresh_interval seconds) or when it is older than max_age seconds.
+    """
+
+    def __init__(self, db, refresh_interval=60, max_age=3600):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.index = None
+        self.built_at = self.checked_at = 0
+
+    def get_index(self):
+        """Returns the current index, building or rebuilding it first if it is missing or out of date."""
+
+        if self.index is None or time.monotonic() - self.checked_at >= self.refresh_interval:
+            self.refresh()
+        return self.index
+
+    def refresh(self, force=False):
+        """Rebuilds the index if the catalog version changed or the index is too old (or always, if force is True)."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.checked_at = now
+            if force or self.index is None or now - self.built_at >= self.max_age \
+                    or self.db.get_catalog_version() != self.index.version:
+                print("Rebuilding suggestion index")
+                self.index = SuggestionIndex.from_database(self.db)
+                self.built_at = time.monotonic()
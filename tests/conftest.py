@@ -0,0 +1,122 @@
+"""
+Shared setup of the tests: the website's modules are imported from the repository root, every test runs against
+its own SQLite database with a few books, and Goodreads is replaced by a local stub server.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from book_database import BookDatabase  # noqa: E402
+
+BOOKS_CSV = "isbn,title,author,year\n" \
+            "080213825X,Lolita,Vladimir Nabokov,1955\n" \
+            "0380795272,Krondor: The Betrayal,Raymond E. Feist,1998\n" \
+            "0553803700,I Robot,Isaac Asimov,1950\n"
+
+
+class GoodreadsStub:
+    """
+    Local stand-in for the Goodreads review_counts endpoint, which answers every isbn with a fixed rating after
+    an optional delay, answers every request with an error when "failing" is set, or with "body" when it is set.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.failing = False
+        self.body = None
+        self.requests = list()      # isbns of every request
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                isbns = parse_qs(urlparse(self.path).query)["isbns"][0].split(",")
+                stub.requests.append(isbns)
+                time.sleep(stub.delay)
+                if stub.failing:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                body = stub.body if stub.body is not None else json.dumps(
+                    {"books": [{"isbn": isbn, "average_rating": "4.00", "ratings_count": 100} for isbn in isbns]}
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def goodreads():
+    """A local Goodreads stub server."""
+
+    stub = GoodreadsStub()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A BookDatabase on an empty SQLite file, with all tables and a 3 book catalog."""
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    book_file = tmp_path / "books.csv"
+    book_file.write_text(BOOKS_CSV)
+    database = BookDatabase()
+    database.initiate_session()
+    database.create_all_tables()
+    database.insert_books_from_file(str(book_file))
+    yield database
+    database.close_session()
+
+
+@pytest.fixture
+def application(db, goodreads, monkeypatch):
+    """
+    The website's module, using the test database and the Goodreads stub; its caches are emptied. Sessions are kept
+    in memory, rather than in files written to the working directory.
+    """
+
+    monkeypatch.setenv("GOODREADS_API_KEY", "test")
+    monkeypatch.setenv("SESSION_BACKEND", "memory")
+    import application
+
+    application.db.initiate_session()
+    monkeypatch.setattr(application.goodreads_api, "base_url", goodreads.url)
+    for cache in (application.goodreads_api.cache, application.book_cache.details, application.book_cache.stats,
+                  application.fragment_cache.fragments, application.search_cache.results):
+        cache.clear()
+    application.warmed_up.clear()
+    yield application
+    application.db.close_session()
+
+
+@pytest.fixture
+def client(application):
+    """A test client of the website, logged in as the first user."""
+
+    application.db.add_new_user("Test", "Reader", "reader", "secret")
+    client = application.app.test_client()
+    with client.session_transaction() as user_session:
+        user_session["first_name"] = "Test"
+        user_session["user_id"] = 1
+    return client
@@ -0,0 +1,106 @@
+import pytest
+
+
+def test_ready_warms_up_sqlite(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("database_url", [None, "not a database url"])
+def test_not_ready_without_a_valid_database_url(application, monkeypatch, database_url):
+    if database_url is None:
+        monkeypatch.delenv("DATABASE_URL")
+    else:
+        monkeypatch.setenv("DATABASE_URL", database_url)
+    application.db.engine = None
+
+    response = application.app.test_client().get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["ready"] is False
+
+
+def test_login(application):
+    application.db.add_new_user("Ada", "Reader", "ada", "secret")
+    client = application.app.test_client()
+
+    response = client.post("/login", data={"username": "ada", "password": "wrong"})
+    assert b"Your username or password is incorrect" in response.data
+    response = client.post("/login", data={"username": "ada", "password": "secret"})
+    assert response.status_code == 302
+    with client.session_transaction() as user_session:
+        assert user_session["first_name"] == "Ada"
+
+
+def test_page_of_an_unknown_book_is_not_found(client, goodreads):
+    assert client.get("/book/0000000000").status_code == 404
+    assert goodreads.requests == []
+
+
+def test_review_is_added(application, client):
+    response = client.post("/book-review", data={"book_isbn": "0380795272", "user_rating": "4", "user_review": "Fun"})
+    assert response.status_code == 302
+    book_id = application.db.get_book_db_id_by_isbn("0380795272")
+    assert [review.rating for review in application.db.get_book_reviews(book_id)] == [4]
+
+
+def test_second_review_of_a_book_is_rejected(application, client):
+    data = {"book_isbn": "0380795272", "user_rating": "4", "user_review": "Fun"}
+    assert client.post("/book-review", data=data).status_code == 302
+
+    response = client.post("/book-review", data=dict(data, user_rating="1", user_review="Dull"))
+    assert response.status_code == 409
+    assert b"You already reviewed this book." in response.data
+    book_id = application.db.get_book_db_id_by_isbn("0380795272")
+    assert [review.review for review in application.db.get_book_reviews(book_id)] == ["Fun"]
+
+
+def test_second_queued_review_of_a_book_is_rejected(application, client, tmp_path, monkeypatch):
+    from review_queue import ReviewWriter, SQLiteReviewQueue
+    writer = ReviewWriter(application.db, SQLiteReviewQueue(str(tmp_path / "queue.db")))
+    monkeypatch.setattr(application, "review_writer", writer)
+
+    data = {"book_isbn": "0380795272", "user_rating": "4"}
+    assert client.post("/book-review", data=data).status_code == 302
+    assert client.post("/book-review", data=data).status_code == 409
+    assert len(writer.queue) == 1
+    writer.stop()
+
+
+@pytest.mark.parametrize("rating", [None, "", "0", "6", "five"])
+def test_review_without_a_valid_rating_is_rejected(application, client, rating):
+    data = {"book_isbn": "0380795272", "user_review": "Fun"}
+    if rating is not None:
+        data["user_rating"] = rating
+    response = client.post("/book-review", data=data)
+    assert response.status_code == 400
+    assert b"Please choose a rating" in response.data and b"Fun</textarea>" in response.data
+    assert application.db.get_book_reviews(application.db.get_book_db_id_by_isbn("0380795272")) == []
+
+
+@pytest.mark.parametrize("isbn", [None, "0000000000"])
+def test_review_of_an_unknown_book_is_rejected(client, isbn):
+    data = {"user_rating": "4"} if isbn is None else {"book_isbn": isbn, "user_rating": "4"}
+    assert client.post("/book-review", data=data).status_code == 400
+
+
+def test_invalid_rating_is_rejected_before_the_review_queue(application, client, tmp_path, monkeypatch):
+    from review_queue import ReviewWriter, SQLiteReviewQueue
+    writer = ReviewWriter(application.db, SQLiteReviewQueue(str(tmp_path / "queue.db")))
+    monkeypatch.setattr(application, "review_writer", writer)
+
+    response = client.post("/book-review", data={"book_isbn": "0380795272", "user_rating": "9"})
+    assert response.status_code == 400
+    assert len(writer.queue) == 0
+
+
+@pytest.mark.parametrize("body", [["0380795272"], "0380795272", {"isbns": "0380795272"}, {"isbns": None}, {}])
+def test_bulk_api_rejects_a_body_without_a_list_of_isbns(client, body):
+    assert client.post("/api/books", json=body).status_code == 400
+    assert client.post("/api/saved-books", json=body).status_code == 400
+
+
+def test_bulk_api_returns_books_in_the_order_requested(client):
+    response = client.post("/api/books", json={"isbns": ["0553803700", "080213825x", "123"]})
+    assert response.status_code == 200
+    assert [book.get("title") or book["Error"] for book in response.get_json()] == \
+        ["I Robot", "Lolita", "ISBN number provided is invalid"]
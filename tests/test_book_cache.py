@@ -0,0 +1,27 @@
+def test_unchanged_book_is_not_modified(client):
+    response = client.get("/api/0380795272")
+    assert response.status_code == 200
+    assert response.headers.get("Last-Modified") is None
+    etag = response.headers["ETag"]
+
+    response = client.get("/api/0380795272", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_new_review_changes_the_etag(application, client):
+    etag = client.get("/api/0380795272").headers["ETag"]
+
+    client.post("/book-review", data={"book_isbn": "0380795272", "user_rating": "4"})
+    response = client.get("/api/0380795272", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json()["review_count"] == 1
+    assert response.headers["ETag"] != etag
+
+
+def test_fields_of_a_book_are_read_from_its_cached_details(application, client):
+    hits = application.book_cache.details.stats()["hits"]
+    assert client.get("/api/0553803700/author").get_json() == {"author": "Isaac Asimov"}
+    assert client.get("/api/0553803700/year").get_json() == {"year": 1950}
+    assert application.book_cache.details.stats()["hits"] == hits + 1
+    assert client.get("/api/0000000000/year").status_code == 404
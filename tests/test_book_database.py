@@ -0,0 +1,105 @@
+from book_database import BookDatabase, MIGRATIONS, PASSWORD_HASH_METHOD
+
+
+def test_migrate_database_created_before_book_stats(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'old.db'}")
+    db = BookDatabase()
+    db.create_user_table()
+    db.create_books_table()
+    db.create_reviews_table()
+    db.create_user_saved_books()
+    db.session.execute("INSERT INTO books (id, isbn, title, author, year) VALUES (1, '0380795272', 'Krondor', "
+                       "'Raymond E. Feist', 1998);")
+    db.session.execute("INSERT INTO book_reviews (id, book_id, user_id, rating) VALUES (1, 1, 1, 4), (2, 1, 2, 2);")
+    db.session.commit()
+
+    db.migrate()
+
+    assert db.session.execute("SELECT MAX(version) FROM schema_version;").scalar() == MIGRATIONS[-1][0]
+    assert db.get_book_stats([1]) == {1: (3.0, 2)}
+    db.close_session()
+
+
+def test_rows_get_ids_on_sqlite(db):
+    db.add_new_user("Ada", "Reader", "ada", "secret")
+    user_id = db.session.execute("SELECT id FROM users WHERE username = 'ada';").scalar()
+    book_id = db.get_book_db_id_by_isbn("0380795272")
+    assert user_id is not None and book_id is not None
+    assert db.get_username_by_id(user_id) == "ada"
+
+    assert db.add_user_review(user_id, book_id, 5, "Great")
+    reviews = db.get_book_reviews(book_id)
+    assert [(review.username, review.rating) for review in reviews] == [("ada", 5)]
+    assert reviews[0].db_id is not None
+
+
+def test_warm_up_in_memory_database(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    db = BookDatabase()
+    assert type(db.engine.pool).__name__ == "SingletonThreadPool"
+    assert db.warm_up_pool() == 1
+    db.close_session()
+
+
+def test_reimport_updates_books_and_bumps_the_catalog_version(db, tmp_path):
+    book_id = db.get_book_db_id_by_isbn("0380795272")
+    version = db.get_catalog_version()
+    book_file = tmp_path / "books_v2.csv"
+    book_file.write_text("isbn,title,author,year\n"
+                         "0380795272,Krondor: the Betrayal,Raymond E. Feist,1999\n"
+                         "0441172717,Dune,Frank Herbert,1965\n"
+                         "0441013597,Dune Messiah,Frank Herbert,not a year\n")
+
+    assert db.insert_books_from_file(str(book_file), batch_size=1) == 2
+
+    krondor = db.search_by_isbn("0380795272")
+    assert (krondor.db_id, krondor.title, krondor.year) == (book_id, "Krondor: the Betrayal", 1999)
+    assert db.search_by_isbn("0441172717").title == "Dune"
+    assert db.session.execute("SELECT COUNT(*) FROM books;").scalar() == 4
+    assert db.get_catalog_version() == version + 1
+
+
+def test_dry_run_import_writes_nothing(db, tmp_path):
+    version = db.get_catalog_version()
+    book_file = tmp_path / "books_v2.csv"
+    book_file.write_text("isbn,title,author,year\n0441172717,Dune,Frank Herbert,1965\n")
+
+    assert db.insert_books_from_file(str(book_file), dry_run=True) == 1
+    assert db.search_by_isbn("0441172717") is None
+    assert db.get_catalog_version() == version
+
+
+def test_passwords_are_stored_hashed(db):
+    db.add_new_user("Ada", "Reader", "ada", "secret")
+    password = db.session.execute("SELECT password FROM users WHERE username = 'ada';").scalar()
+    assert password.startswith(PASSWORD_HASH_METHOD + "$") and "secret" not in password
+
+    assert db.authenticate("ada", "secret").first_name == "Ada"
+    assert db.authenticate("ada", "wrong") is None
+    assert db.authenticate("nobody", "secret") is None
+
+
+def test_plain_text_password_is_hashed_on_login(db):
+    db.session.execute("INSERT INTO users (first_name, last_name, username, password) "
+                       "VALUES ('Bob', 'Reader', 'bob', 'hunter2'), ('Cy', 'Reader', 'cy', 'letmein');")
+    db.session.commit()
+
+    assert db.authenticate("bob", "wrong") is None
+    assert db.authenticate("bob", "hunter2").first_name == "Bob"
+    passwords = dict(db.session.execute("SELECT username, password FROM users;").fetchall())
+    assert passwords["bob"].startswith("pbkdf2:") and passwords["cy"] == "letmein"
+    assert db.authenticate("bob", "hunter2") is not None
+
+    # accounts that don't log in again are hashed by the import script
+    assert db.hash_plaintext_passwords() == 1
+    assert db.authenticate("cy", "letmein") is not None
+
+
+def test_password_is_rehashed_when_the_iterations_change(db, monkeypatch):
+    import book_database
+    db.add_new_user("Ada", "Reader", "ada", "secret")
+    monkeypatch.setattr(book_database, "PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+
+    assert db.authenticate("ada", "secret") is not None
+    password = db.session.execute("SELECT password FROM users WHERE username = 'ada';").scalar()
+    assert password.startswith("pbkdf2:sha256:1000$")
@@ -0,0 +1,27 @@
+import time
+from cache import CacheEntry, SQLiteCacheStore
+
+
+def test_sqlite_store_connects_on_first_use_in_every_process(tmp_path):
+    path = tmp_path / "cache.db"
+    store = SQLiteCacheStore(str(path))
+    assert not path.exists()
+
+    entry = CacheEntry(value={"average_rating": 4.5}, expires_at=time.time() + 60, stale_until=time.time() + 120)
+    store.set("0380795272", entry)
+    connection = store.connection
+
+    store.pid = -1      # as seen from a forked worker
+    assert store.get("0380795272") == entry
+    assert store.connection is not connection
+
+
+def test_sqlite_store_prunes_entries_past_their_stale_time_on_write(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.db"), prune_interval=0)
+    now = time.time()
+    store.set("expired", CacheEntry(value=1, expires_at=now - 120, stale_until=now - 60))
+    store.set("stale", CacheEntry(value=2, expires_at=now - 60, stale_until=now + 60))
+    store.set("fresh", CacheEntry(value=3, expires_at=now + 60, stale_until=now + 120))
+
+    keys = [key for key, in store.connection.execute("SELECT key FROM cache_entries ORDER BY key")]
+    assert keys == ["fresh", "stale"]
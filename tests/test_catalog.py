@@ -0,0 +1,48 @@
+from catalog import Catalog, CatalogSnapshot
+
+
+def test_snapshot_lookups():
+    snapshot = CatalogSnapshot([(1, "080213825X", "Lolita", "Vladimir Nabokov", 1955),
+                                (2, "0380795272", "Krondor: The Betrayal", "Raymond E. Feist", 1998),
+                                (3, "0553803699", "Krondor: The Assassins", "Raymond E. Feist", 1999)], version=7)
+
+    assert len(snapshot) == 3 and "0380795272" in snapshot and "0000000000" not in snapshot
+    assert snapshot.get("0553803699") == {"db_id": 3, "isbn": "0553803699", "title": "Krondor: The Assassins",
+                                          "author": "Raymond E. Feist", "year": 1999}
+    assert snapshot.get("0000000000") is None
+    assert snapshot.authors == ["Vladimir Nabokov", "Raymond E. Feist"]
+
+
+def test_books_are_looked_up_in_the_snapshot(db):
+    db.catalog = Catalog(db)
+    book = db.search_by_isbn("0380795272")
+    assert (book.title, book.db_id) == ("Krondor: The Betrayal", db.get_book_db_id_by_isbn("0380795272"))
+    assert [book.title for book in db.get_books_by_isbns(["0553803700", "0000000000", "080213825X"])] == \
+        ["I Robot", "Lolita"]
+    assert db.search_by_isbn("0000000000") is None
+
+
+def test_snapshot_is_reloaded_when_the_catalog_is_reimported(db, tmp_path):
+    catalog = db.catalog = Catalog(db, refresh_interval=0)
+    snapshot = catalog.get_snapshot()
+    assert catalog.get_snapshot() is snapshot
+
+    book_file = tmp_path / "more_books.csv"
+    book_file.write_text("isbn,title,author,year\n0441172717,Dune,Frank Herbert,1965\n")
+    db.insert_books_from_file(str(book_file))
+
+    assert catalog.get_snapshot() is not snapshot
+    assert db.search_by_isbn("0441172717").title == "Dune"
+
+
+def test_catalog_version_is_checked_once_per_refresh_interval(db, tmp_path):
+    catalog = db.catalog = Catalog(db, refresh_interval=3600)
+    snapshot = catalog.get_snapshot()
+
+    book_file = tmp_path / "more_books.csv"
+    book_file.write_text("isbn,title,author,year\n0441172717,Dune,Frank Herbert,1965\n")
+    db.insert_books_from_file(str(book_file))
+
+    assert catalog.get_snapshot() is snapshot
+    catalog.refresh()
+    assert "0441172717" in catalog.get_snapshot()
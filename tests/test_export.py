@@ -0,0 +1,47 @@
+import json
+from datetime import date, datetime, timedelta
+import pytest
+from export import export_catalog, parse_since
+
+
+def exported_isbns(db, since=None):
+    return [json.loads(line)["isbn"] for line in export_catalog(db, "ndjson", since)]
+
+
+@pytest.fixture
+def reviewed_book(db):
+    db.add_new_user("Ada", "Reader", "ada", "secret")
+    user_id = db.session.execute("SELECT id FROM users WHERE username = 'ada';").scalar()
+    assert db.add_user_review(user_id, db.get_book_db_id_by_isbn("0380795272"), 4, "Fun")
+    return "0380795272"
+
+
+def test_export_of_the_whole_catalog(db, reviewed_book):
+    assert "".join(export_catalog(db, "csv")).splitlines() == [
+        "isbn,title,author,year,average_rating,review_count",
+        "080213825X,Lolita,Vladimir Nabokov,1955,0,0",
+        "0380795272,Krondor: The Betrayal,Raymond E. Feist,1998,4.0,1",
+        "0553803700,I Robot,Isaac Asimov,1950,0,0"
+    ]
+
+
+def test_export_of_the_books_reviewed_since_a_date(db, reviewed_book):
+    assert exported_isbns(db, since=date.today()) == [reviewed_book]
+    assert exported_isbns(db, since=date.today() + timedelta(days=1)) == []
+    # reviews are dated by day, so a time of day doesn't leave out that day's reviews
+    assert exported_isbns(db, since=datetime.now() + timedelta(minutes=1)) == [reviewed_book]
+
+
+def test_since_must_be_a_date():
+    assert parse_since("2019-06-01") == date(2019, 6, 1)
+    assert parse_since(None) is None
+    with pytest.raises(ValueError):
+        parse_since("2019-06-01T12:00")
+
+
+def test_export_api(client):
+    response = client.get("/api/export?format=ndjson")
+    assert response.status_code == 200
+    assert len(response.data.splitlines()) == 3
+    assert client.get(f"/api/export?since={date.today().isoformat()}").data == b""
+    assert client.get("/api/export?since=2019-06-01T12:00").status_code == 400
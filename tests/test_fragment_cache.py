@@ -0,0 +1,43 @@
+from fragment_cache import FragmentCache
+
+
+def test_fragment_is_rendered_once_per_key():
+    fragments = FragmentCache()
+    renders = list()
+
+    def render():
+        renders.append(1)
+        return "<p>Krondor & co</p>"
+
+    assert fragments.render(("book_header", "0380795272", 0), render) == "<p>Krondor & co</p>"
+    assert fragments.render(("book_header", "0380795272", 0), render).__html__() == "<p>Krondor & co</p>"
+    assert len(renders) == 1
+    fragments.render(("book_header", "0380795272", 1), render)
+    assert len(renders) == 2
+
+
+def test_fragments_are_evicted_beyond_the_size_limit():
+    fragments = FragmentCache(max_bytes=10 * 1024)
+    for number in range(10):
+        fragments.render(("book_reviews", number), lambda: "x" * 2048)
+    assert fragments.cache_stats()["evictions"] >= 5
+
+
+def test_new_review_changes_the_cached_book_page(application, client):
+    assert b"(0 reviews)" in client.get("/book/0380795272").data
+    application.db.add_new_user("Ada", "Reader", "ada", "secret")
+    user_id = application.db.session.execute("SELECT id FROM users WHERE username = 'ada';").scalar()
+    application.db.add_user_review(user_id, application.db.get_book_db_id_by_isbn("0380795272"), 4, "Gripping")
+
+    page = client.get("/book/0380795272").data
+    assert b"(1 reviews)" in page and b"Gripping" in page
+
+
+def test_new_review_changes_the_cached_search_results(application, client):
+    def search():
+        return client.post("/search", data={"user_search": "Krondor"}).data
+
+    assert search().count(b"fa-star-o dull_star") == 5
+    client.post("/book-review", data={"book_isbn": "0380795272", "user_rating": "4"})
+    results = search()
+    assert results.count(b"fa fa-star checked") == 4 and b"dull_star" not in results
@@ -0,0 +1,127 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import goodreads as goodreads_module
+from cache import TTLCache
+from goodreads import GoodreadsAPI, GoodreadsAPIError
+
+
+def create_api(goodreads, monkeypatch, **environment):
+    """A GoodreadsAPI calling the stub server, configured by environment variables."""
+
+    monkeypatch.setenv("GOODREADS_API_KEY", "test")
+    for name, value in environment.items():
+        monkeypatch.setenv(name, str(value))
+    api = GoodreadsAPI(cache=TTLCache())
+    api.base_url = goodreads.url
+    return api
+
+
+def test_review_is_fetched(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch)
+    assert api.get_review("0380795272")["average_rating"] == "4.00"
+
+
+def test_reviews_of_many_books_are_fetched_in_one_request(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch)
+    reviews = api.get_reviews_for_isbns(["0380795272", "0553803700", "0380795272"])
+    assert sorted(reviews) == ["0380795272", "0553803700"]
+    assert goodreads.requests == [["0380795272", "0553803700"]]
+
+    # cached reviews are reused, only the missing ones are fetched
+    api.get_reviews_for_isbns(["0553803700", "080213825X"])
+    assert goodreads.requests[1:] == [["080213825X"]]
+
+
+def test_reviews_are_fetched_in_batches(goodreads, monkeypatch):
+    monkeypatch.setattr(goodreads_module, "GOODREADS_BATCH_SIZE", 2)
+    api = create_api(goodreads, monkeypatch)
+    assert len(api.get_reviews_for_isbns(["080213825X", "0380795272", "0553803700"])) == 3
+    assert goodreads.requests == [["080213825X", "0380795272"], ["0553803700"]]
+
+
+def test_slow_goodreads_times_out(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch, GOODREADS_TIMEOUT=0.2)
+    goodreads.delay = 1.0
+    start = time.monotonic()
+    with pytest.raises(GoodreadsAPIError):
+        api.get_review("0380795272")
+    assert time.monotonic() - start < 0.8
+
+
+def test_book_page_waits_for_goodreads_within_the_latency_budget(application, client, goodreads, monkeypatch):
+    monkeypatch.setattr(application, "GOODREADS_LATENCY_BUDGET", 0.2)
+    goodreads.delay = 1.0
+
+    start = time.monotonic()
+    response = client.get("/book/0380795272")
+    assert response.status_code == 200
+    assert time.monotonic() - start < 0.8
+    assert b"Goodreads Rating: unavailable" in response.data
+
+
+def test_malformed_goodreads_answer_is_a_failure(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch, GOODREADS_FAILURE_THRESHOLD=2)
+    for body in (b"<html>Bad gateway</html>", b'{"error": "no books"}'):
+        goodreads.body = body
+        with pytest.raises(GoodreadsAPIError):
+            api.get_reviews_for_isbns(["0380795272"])
+    assert api.circuit_breaker.state == "open"
+
+
+def test_pages_are_shown_without_ratings_when_goodreads_answers_garbage(client, goodreads):
+    goodreads.body = b"<html>Bad gateway</html>"
+    response = client.get("/book/0380795272")
+    assert response.status_code == 200
+    assert b"Goodreads Rating: unavailable" in response.data
+
+    response = client.post("/search", data={"user_search": "Krondor"})
+    assert response.status_code == 200
+    assert b"Krondor" in response.data
+
+
+def test_circuit_breaker_opens_after_repeated_failures(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch, GOODREADS_FAILURE_THRESHOLD=3)
+    goodreads.failing = True
+    for isbn in ("0380795272", "0553803700", "080213825X"):
+        with pytest.raises(GoodreadsAPIError):
+            api.get_review(isbn)
+    assert api.circuit_breaker.state == "open"
+
+    # while open, Goodreads isn't called at all
+    with pytest.raises(GoodreadsAPIError):
+        api.get_review("0380795272")
+    assert len(goodreads.requests) == 3
+
+
+def test_circuit_breaker_closes_after_the_reset_timeout(goodreads, monkeypatch):
+    api = create_api(goodreads, monkeypatch, GOODREADS_FAILURE_THRESHOLD=1, GOODREADS_RESET_TIMEOUT=1)
+    goodreads.failing = True
+    with pytest.raises(GoodreadsAPIError):
+        api.get_review("0380795272")
+    assert api.circuit_breaker.state == "open"
+
+    goodreads.failing = False
+    time.sleep(1.05)
+    assert api.circuit_breaker.state == "half open"
+    assert api.get_review("0380795272")["ratings_count"] == 100
+    assert api.circuit_breaker.state == "closed"
+    assert len(goodreads.requests) == 2
+
+
+def test_stale_review_is_refreshed_once_in_the_thread_pool(goodreads, monkeypatch):
+    monkeypatch.setenv("GOODREADS_API_KEY", "test")
+    executor = ThreadPoolExecutor(max_workers=2)
+    api = GoodreadsAPI(cache=TTLCache(ttl=60, stale_ttl=3600), executor=executor)
+    api.base_url = goodreads.url
+    api.cache.set("0380795272", {"average_rating": "3.00", "ratings_count": 10}, ttl=-1)
+    goodreads.delay = 0.2
+
+    # the stale review is served while a single refresh runs
+    for _ in range(3):
+        assert api.get_review("0380795272")["average_rating"] == "3.00"
+    executor.shutdown(wait=True)
+
+    assert len(goodreads.requests) == 1
+    assert api.get_review("0380795272")["average_rating"] == "4.00"
+    assert not api.refreshing
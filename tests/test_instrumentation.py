@@ -0,0 +1,24 @@
+import pytest
+from flask import Flask, g
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from instrumentation import RequestInstrumentation
+
+
+def test_failed_statements_leave_no_start_time_behind():
+    app = Flask(__name__)
+    engine = create_engine("sqlite://")
+    instrumentation = RequestInstrumentation(app, engine)
+
+    with app.test_request_context(), engine.connect() as conn:
+        app.preprocess_request()
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute("SELECT * FROM missing_table;")
+        assert conn.execute("SELECT 1;").scalar() == 1
+
+        assert g.request_metrics.sql_count == 1
+        assert g.request_metrics.queries[0][0] == "SELECT 1;"
+        # nothing is left on the (pooled) connection once its statements are finished
+        assert conn.info == {}
+    engine.dispose()
@@ -0,0 +1,46 @@
+import recommendations
+
+
+def add_reviews(db, ratings):
+    """Adds reviews given as (username, isbn, rating), creating the users first."""
+
+    for username in sorted({username for username, _, _ in ratings}):
+        db.add_new_user(username.title(), "Reader", username, "secret")
+    for username, isbn, rating in ratings:
+        user_id = db.session.execute("SELECT id FROM users WHERE username = :username;",
+                                     {"username": username}).scalar()
+        assert db.add_user_review(user_id, db.get_book_db_id_by_isbn(isbn), rating, None)
+
+
+def recommended_titles(db, isbn):
+    return [book.title for book in db.get_book_recommendations(db.get_book_db_id_by_isbn(isbn))]
+
+
+def test_books_liked_by_the_same_readers_are_recommended(db):
+    add_reviews(db, [("ada", "080213825X", 5), ("ada", "0380795272", 4), ("bob", "080213825X", 4),
+                     ("bob", "0380795272", 5), ("bob", "0553803700", 5), ("cy", "0553803700", 2)])
+
+    assert recommendations.run(db) == 3
+    assert recommended_titles(db, "080213825X") == ["Krondor: The Betrayal"]
+    assert recommended_titles(db, "0380795272") == ["Lolita"]
+    # a single common reader isn't enough
+    assert recommended_titles(db, "0553803700") == []
+
+
+def test_full_run_drops_the_recommendations_of_books_without_high_ratings(db):
+    add_reviews(db, [("ada", "080213825X", 5), ("ada", "0380795272", 4), ("bob", "080213825X", 4),
+                     ("bob", "0380795272", 5)])
+    recommendations.run(db)
+    assert recommended_titles(db, "080213825X") == ["Krondor: The Betrayal"]
+
+    db.session.execute("DELETE FROM book_reviews WHERE book_id = :book_id;",
+                       {"book_id": db.get_book_db_id_by_isbn("080213825X")})
+    db.session.commit()
+
+    # an incremental run only recomputes books with new high ratings
+    assert recommendations.run(db, incremental=True) == 0
+    assert recommended_titles(db, "080213825X") == ["Krondor: The Betrayal"]
+
+    assert recommendations.run(db) == 1
+    assert recommended_titles(db, "080213825X") == []
+    assert recommended_titles(db, "0380795272") == []
@@ -0,0 +1,18 @@
+from datetime import datetime
+from review_queue import ReviewWriter, SQLiteReviewQueue
+
+
+def test_invalid_review_does_not_block_the_batch(db, tmp_path):
+    for number in range(3):
+        db.add_new_user("Test", "Reader", f"reader_{number}", "secret")
+    book_id = db.get_book_db_id_by_isbn("0380795272")
+    writer = ReviewWriter(db, SQLiteReviewQueue(str(tmp_path / "queue.db")))
+    for user_id, rating in ((1, 5), (2, None), (3, 2)):
+        writer.queue.put({"book_id": book_id, "user_id": user_id, "date_created": datetime.now(),
+                          "rating": rating, "review": "Fun"})
+
+    assert writer.flush() == 3
+    assert len(writer.queue) == 0
+    assert sorted((review.username, review.rating) for review in db.get_book_reviews(book_id)) == \
+        [("reader_0", 5), ("reader_2", 2)]
+    assert db.get_book_stats([book_id]) == {book_id: (3.5, 2)}
@@ -0,0 +1,46 @@
+def saved_isbns(client, page=0):
+    response = client.get(f"/api/saved-books?page={page}")
+    assert response.status_code == 200
+    return [book["isbn"] for book in response.get_json()["books"]]
+
+
+def test_books_are_saved_and_removed_in_bulk(client):
+    response = client.post("/api/saved-books", json={"isbns": ["0380795272", "0553803700", "0000000000"]})
+    assert response.get_json() == {"saved": 2}
+    # saving a book again keeps it once
+    assert client.post("/api/saved-books", json={"isbns": ["0553803700"]}).get_json() == {"saved": 0}
+    assert saved_isbns(client) == ["0553803700", "0380795272"]
+
+    response = client.delete("/api/saved-books", json={"isbns": ["0380795272", "080213825X"]})
+    assert response.get_json() == {"removed": 1}
+    assert saved_isbns(client) == ["0553803700"]
+
+
+def test_reading_list_is_paged_most_recently_saved_first(application, client, monkeypatch):
+    monkeypatch.setattr(application, "SAVED_BOOKS_PAGE_SIZE", 2)
+    for isbn in ("080213825X", "0380795272", "0553803700"):
+        client.post("/api/saved-books", json={"isbns": [isbn]})
+
+    assert saved_isbns(client) == ["0553803700", "0380795272"]
+    assert client.get("/api/saved-books").get_json()["has_more"] is True
+    assert saved_isbns(client, page=1) == ["080213825X"]
+    assert client.get("/api/saved-books?page=1").get_json()["has_more"] is False
+
+
+def test_book_is_saved_from_its_page(client):
+    assert b"Save to my list" in client.get("/book/0380795272").data
+
+    response = client.post("/saved-books", data={"book_isbn": "0380795272", "action": "save", "return_to": "book"})
+    assert response.headers["Location"].endswith("/book/0380795272")
+    assert b"Remove from my list" in client.get("/book/0380795272").data
+    assert b"Krondor: The Betrayal" in client.get("/my-list").data
+
+    client.post("/saved-books", data={"book_isbn": "0380795272", "action": "remove"})
+    assert b"Save to my list" in client.get("/book/0380795272").data
+    assert saved_isbns(client) == []
+
+
+def test_reading_list_requires_a_login(application):
+    client = application.app.test_client()
+    assert client.get("/api/saved-books").status_code == 401
+    assert client.get("/my-list").status_code == 302
@@ -0,0 +1,41 @@
+from search_backends import CatalogIndexSearch, InvertedIndexSearch
+
+BOOKS = [
+    ("0451524934", "Nineteen Eighty-Four", "George Orwell"),
+    ("0452284244", "Animal Farm", "George Orwell"),
+    ("0141036133", "Orwell's England", "George Orwell"),
+    ("0316769487", "The Catcher in the Rye", "J.D. Salinger"),
+]
+
+
+def test_title_matches_rank_before_author_matches():
+    index = InvertedIndexSearch(BOOKS)
+    assert index.rank("orwell") == ["0141036133", "0452284244", "0451524934"]
+    assert index.rank("george orwell farm") == ["0452284244"]
+
+
+def test_last_word_of_a_search_may_be_a_prefix():
+    index = InvertedIndexSearch(BOOKS)
+    assert index.rank("catch") == ["0316769487"]
+    assert index.rank("catch rye") == []
+    assert index.rank("the catch") == ["0316769487"]
+
+
+def test_isbns_are_matched_by_prefix():
+    index = InvertedIndexSearch(BOOKS)
+    assert index.rank("045") == ["0452284244", "0451524934"]
+    assert index.rank("0452284244") == ["0452284244"]
+    assert index.rank("2284244") == []
+
+
+def test_index_is_rebuilt_when_the_catalog_is_reimported(db, tmp_path):
+    backend = CatalogIndexSearch(refresh_interval=0)
+    assert [book.title for book in backend.search(db, "robot", 10, 0)] == ["I Robot"]
+
+    book_file = tmp_path / "more_books.csv"
+    book_file.write_text("isbn,title,author,year\n0553294385,I Robot: The Illustrated Screenplay,Harlan Ellison,1994\n")
+    db.insert_books_from_file(str(book_file))
+
+    assert [book.title for book in backend.search(db, "robot", 10, 0)] == \
+        ["I Robot", "I Robot: The Illustrated Screenplay"]
+    assert backend.index.version == db.get_catalog_version()
@@ -0,0 +1,27 @@
+from book_cache import BookCache
+from search_backends import InvertedIndexSearch
+from search_cache import SearchCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Stephen   KING ") == "stephen king"
+    assert normalize_query("0-8021-3825-x") == "080213825X"
+    assert normalize_query("978 0 553 29") == "978055329"
+    assert normalize_query("catch-22") == "catch-22"
+
+
+def test_isbn_with_x_check_digit_is_found():
+    index = InvertedIndexSearch([("080213825X", "Lolita", "Vladimir Nabokov"),
+                                 ("0380795272", "Krondor: The Betrayal", "Raymond E. Feist")])
+
+    assert index.rank(normalize_query("080213825x")) == ["080213825X"]
+    assert index.rank("080213825x") == ["080213825X"]
+
+
+def test_cached_search_by_isbn_with_x_check_digit(db):
+    db.search_backend = InvertedIndexSearch.from_database(db)
+    search_cache = SearchCache(db, BookCache(db))
+
+    for search in ("080213825X", "0-8021-3825-x"):
+        assert [book.title for book in search_cache.search(search, limit=10)] == ["Lolita"]
+    assert search_cache.cache_stats()["hits"] == 1
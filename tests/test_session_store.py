@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask, session
+from session_store import DatabaseSessionStore, MemorySessionStore, ServerSideSessionInterface
+
+
+def create_app(store, **options):
+    """A Flask application keeping its sessions in a store, with routes to log in, read the session and log out."""
+
+    app = Flask(__name__)
+    app.session_interface = ServerSideSessionInterface(store, **options)
+
+    @app.route("/login/<name>")
+    def login(name):
+        session["first_name"] = name
+        return ""
+
+    @app.route("/whoami")
+    def whoami():
+        return session.get("first_name", "")
+
+    @app.route("/logout")
+    def logout():
+        session.clear()
+        return ""
+
+    return app
+
+
+@pytest.fixture(params=["memory", "database"])
+def store(request, db):
+    return MemorySessionStore() if request.param == "memory" else DatabaseSessionStore(db)
+
+
+def test_session_round_trip(store):
+    client = create_app(store).test_client()
+    assert client.get("/whoami").data == b""
+
+    response = client.get("/login/Ada")
+    sid = response.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+    assert store.get(sid)[0] == {"first_name": "Ada"}
+    assert client.get("/whoami").data == b"Ada"
+
+    client.get("/logout")
+    assert store.get(sid) is None
+    assert client.get("/whoami").data == b""
+
+
+def test_unchanged_session_is_not_saved_again(store):
+    client = create_app(store).test_client()
+    client.get("/login/Ada")
+
+    response = client.get("/whoami")
+    assert response.data == b"Ada"
+    assert "Set-Cookie" not in response.headers
+
+
+def test_expired_sessions_are_deleted_in_batches(store):
+    app = create_app(store, lifetime=timedelta(hours=1), cleanup_every=2)
+    store.set("expired", {"first_name": "Bob"}, datetime.now() - timedelta(seconds=1))
+
+    # an expired session isn't used, even before it is deleted
+    client = app.test_client()
+    client.set_cookie("localhost", app.session_cookie_name, "expired")
+    assert client.get("/whoami").data == b""
+
+    app.test_client().get("/login/Ada")
+    assert store.get("expired") is not None
+    app.test_client().get("/login/Cy")
+    assert store.get("expired") is None
@@ -0,0 +1,48 @@
+"""
+Pins the number of SQL statements run by the busiest routes, as counted by the request instrumentation (see
+/metrics), so that a change adding queries to them (e.g. one per book of a page) is noticed.
+"""
+
+
+def sql_statements(application, endpoint, send_request):
+    """Returns the number of SQL statements run by a request to an endpoint."""
+
+    series = application.instrumentation.sql_queries.series
+    before = series[(endpoint,)][1] if (endpoint,) in series else 0
+    response = send_request()
+    assert response.status_code == 200
+    return series[(endpoint,)][1] - before
+
+
+def test_book_page_statements(application, client):
+    client.post("/book-review", data={"book_isbn": "0380795272", "user_rating": "4", "user_review": "Fun"})
+
+    def book_page():
+        return client.get("/book/0380795272")
+
+    # the book with its rating, its rating histogram and reviews, whether the user reviewed and saved it, and the
+    # recommendations
+    assert sql_statements(application, "book", book_page) == 6
+    # the histogram and reviews are rendered from the fragment cache
+    assert sql_statements(application, "book", book_page) == 4
+
+
+def test_search_statements(application, client):
+    def search():
+        return client.post("/search", data={"user_search": "Krondor"})
+
+    # the matching books, with their ratings, in a single query
+    assert sql_statements(application, "search_db", search) == 1
+    # the same search, normalized, is served from the search and book caches
+    assert sql_statements(application, "search_db",
+                          lambda: client.post("/search", data={"user_search": " krondor"})) == 0
+    assert sql_statements(application, "search_db", search) == 0
+
+
+def test_book_api_statements(application, client):
+    def book_api():
+        return client.get("/api/0553803700")
+
+    # the book's details and its rating statistics, which the book cache keeps apart
+    assert sql_statements(application, "book_by_isbn", book_api) == 2
+    assert sql_statements(application, "book_by_isbn", book_api) == 0
@@ -0,0 +1,57 @@
+from suggest import SuggestionIndex, Suggestions
+
+BOOKS = [
+    ("0439708184", "Harry Potter and the Sorcerer's Stone", "J.K. Rowling", 50),
+    ("0439064872", "Harry Potter and the Chamber of Secrets", "J.K. Rowling", 30),
+    ("0723247706", "The Tale of Peter Rabbit", "Beatrix Potter", 5),
+    ("0671727753", "From Potter's Field", "Patricia Cornwell", 5),
+    ("0316769487", "The Catcher in the Rye", "J.D. Salinger", 40),
+]
+
+
+def texts(suggestions):
+    return [suggestion["text"] for suggestion in suggestions]
+
+
+def test_short_and_long_prefixes_complete_any_word():
+    index = SuggestionIndex(BOOKS)
+    # an author is ranked by the reviews of all their books
+    assert texts(index.suggest("j")) == ["J.K. Rowling", "J.D. Salinger"]
+    assert texts(index.suggest("pott", limit=4)) == ["Harry Potter and the Sorcerer's Stone",
+                                                     "Harry Potter and the Chamber of Secrets",
+                                                     "Beatrix Potter", "From Potter's Field"]
+    assert texts(index.suggest("  CATCHER in ")) == ["The Catcher in the Rye"]
+    assert index.suggest("xyz") == [] and index.suggest("   ") == []
+
+
+def test_completions_starting_with_the_prefix_come_first_among_equals():
+    index = SuggestionIndex([("0723247706", "Beatrix Potter: A Life", "Linda Lear", 5),
+                             ("0671727753", "Potter's Field", "Patricia Cornwell", 5)])
+    assert texts(index.suggest("potter")) == ["Potter's Field", "Beatrix Potter: A Life"]
+    assert texts(index.suggest("pot")) == ["Potter's Field", "Beatrix Potter: A Life"]
+
+
+def test_suggestions_describe_titles_and_authors():
+    index = SuggestionIndex(BOOKS)
+    assert index.suggest("the tale") == [{"text": "The Tale of Peter Rabbit", "type": "title", "isbn": "0723247706",
+                                          "review_count": 5}]
+    assert index.suggest("rowl") == [{"text": "J.K. Rowling", "type": "author", "review_count": 80}]
+
+
+def test_index_is_rebuilt_when_the_catalog_is_reimported(db, tmp_path):
+    suggestions = Suggestions(db, refresh_interval=0)
+    assert suggestions.get_index().suggest("dun") == []
+
+    book_file = tmp_path / "more_books.csv"
+    book_file.write_text("isbn,title,author,year\n0441172717,Dune,Frank Herbert,1965\n")
+    db.insert_books_from_file(str(book_file))
+
+    assert texts(suggestions.get_index().suggest("dun")) == ["Dune"]
+
+
+def test_suggest_api(application, client):
+    application.suggestions.refresh(force=True)
+    response = client.get("/api/suggest?q=Kron&limit=5")
+    assert response.get_json() == {"query": "Kron", "suggestions": [
+        {"text": "Krondor: The Betrayal", "type": "title", "isbn": "0380795272", "review_count": 0}
+    ]}